@@ -0,0 +1,503 @@
+"""
+Content-addressed, size-bounded caching of expensive computations
+"""
+import collections
+import cPickle
+import errno
+import hashlib
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .compute.chunked import ChunkedMatrix
+from .compute.sparse import SparseMatrix
+
+# Default byte budget for a single cache, e.g. all the memoized results of
+# one Study
+DEFAULT_CACHE_MAX_BYTES = 2 ** 30
+
+# How deep to look into an object's attributes when estimating its size
+_NBYTES_MAX_DEPTH = 2
+
+
+def _update_with_array(hasher, array):
+    """Add the contents of a numpy array to a hashlib hasher"""
+    array = np.asarray(array)
+    hasher.update('{}{}'.format(array.dtype.str, array.shape))
+    if array.dtype.hasobject:
+        # Object arrays hold pointers, so hash the actual python objects
+        hasher.update(cPickle.dumps(array.tolist(), protocol=2))
+    else:
+        hasher.update(np.ascontiguousarray(array).view(np.uint8))
+
+
+def _update_with_object(hasher, obj, identities=None):
+    """Recursively add an object to a hashlib hasher
+
+    If ``identities`` is a list, objects which are hashed on their identity
+    rather than their contents are appended to it
+    """
+    if isinstance(obj, pd.DataFrame):
+        hasher.update('DataFrame')
+        _update_with_object(hasher, obj.index, identities)
+        _update_with_object(hasher, obj.columns, identities)
+        _update_with_array(hasher, obj.values)
+    elif isinstance(obj, pd.Series):
+        hasher.update('Series')
+        _update_with_object(hasher, obj.name, identities)
+        _update_with_object(hasher, obj.index, identities)
+        _update_with_array(hasher, obj.values)
+    elif isinstance(obj, pd.Index):
+        hasher.update(type(obj).__name__)
+        _update_with_object(hasher, obj.names, identities)
+        _update_with_array(hasher, obj.values)
+    elif isinstance(obj, np.ndarray):
+        _update_with_array(hasher, obj)
+    elif isinstance(obj, SparseMatrix):
+        hasher.update('SparseMatrix')
+        _update_with_object(hasher, obj.index, identities)
+        _update_with_object(hasher, obj.columns, identities)
+        for array in (obj.values.data, obj.values.indices,
+                      obj.values.indptr):
+            _update_with_array(hasher, array)
+    elif isinstance(obj, ChunkedMatrix) and not obj._operations:
+        # The values on disk are never modified, so the checksum saved with
+        # them stands in for reading them all. Operations are functions,
+        # which can't be hashed on their contents.
+        hasher.update('ChunkedMatrix')
+        hasher.update(obj.fingerprint)
+        _update_with_object(hasher, obj._rows, identities)
+        _update_with_object(hasher, obj._columns, identities)
+        _update_with_object(hasher, obj.index, identities)
+        _update_with_object(hasher, obj.columns, identities)
+    elif isinstance(obj, (list, tuple)):
+        hasher.update('{}{}'.format(type(obj).__name__, len(obj)))
+        for item in obj:
+            _update_with_object(hasher, item, identities)
+    elif isinstance(obj, dict):
+        hasher.update('dict{}'.format(len(obj)))
+        for key in sorted(obj, key=repr):
+            _update_with_object(hasher, key, identities)
+            _update_with_object(hasher, obj[key], identities)
+    elif isinstance(obj, (set, frozenset)):
+        hasher.update('set{}'.format(len(obj)))
+        digests = []
+        for item in obj:
+            item_hasher = hashlib.sha1()
+            _update_with_object(item_hasher, item, identities)
+            digests.append(item_hasher.hexdigest())
+        for digest in sorted(digests):
+            hasher.update(digest)
+    elif obj is None or isinstance(obj, (bool, int, long, float, complex,
+                                         basestring, np.generic)):
+        hasher.update(repr(obj))
+    elif isinstance(obj, type):
+        # Classes, e.g. a reducer like DataFramePCA, are keyed on their name
+        # so the key is the same in the next python session
+        hasher.update('class {}.{}'.format(obj.__module__, obj.__name__))
+    else:
+        # Everything else (e.g. data objects, functions) is keyed on its
+        # identity, which is what the string representation used to give
+        if identities is not None:
+            identities.append(obj)
+        hasher.update('{}.{}@{:x}'.format(type(obj).__module__,
+                                          type(obj).__name__, id(obj)))
+
+
+def hash_object(obj):
+    """Hash the contents of an object, including pandas and numpy objects
+
+    Unlike ``str(obj)``, which pandas truncates for large objects, this looks
+    at every value and label of a DataFrame, Series, Index or array, so two
+    objects only get the same hash if they have the same contents.
+
+    Parameters
+    ----------
+    obj : object
+        Any python object. Lists, tuples, dicts and sets are hashed
+        recursively. A ChunkedMatrix is hashed on the checksum saved with
+        its blocks. Objects which aren't containers, numbers, strings,
+        pandas/numpy objects or flotilla matrices are hashed on their
+        identity.
+
+    Returns
+    -------
+    digest : str
+        Hexadecimal digest of the contents of ``obj``
+    """
+    hasher = hashlib.sha1()
+    _update_with_object(hasher, obj)
+    return hasher.hexdigest()
+
+
+def nbytes(obj, depth=0):
+    """Estimate the number of bytes held by an object
+
+    Parameters
+    ----------
+    obj : object
+        Any python object. For pandas and numpy objects, this is the size of
+        their values and labels. For other objects, this adds up the sizes of
+        their attributes.
+    depth : int, optional (default=0)
+        How deep into the attributes of ``obj`` we already are
+
+    Returns
+    -------
+    n : int
+        Estimated size of ``obj`` in bytes
+    """
+    if isinstance(obj, pd.DataFrame):
+        return obj.values.nbytes + obj.index.values.nbytes \
+            + obj.columns.values.nbytes
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        n = obj.values.nbytes
+        if isinstance(obj, pd.Series):
+            n += obj.index.values.nbytes
+        return n
+    elif isinstance(obj, np.ndarray):
+        return obj.nbytes
+    elif isinstance(obj, SparseMatrix):
+        return obj.nbytes + obj.index.values.nbytes \
+            + obj.columns.values.nbytes
+
+    n = sys.getsizeof(obj)
+    if depth >= _NBYTES_MAX_DEPTH:
+        return n
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        n += sum(nbytes(item, depth + 1) for item in obj)
+    elif isinstance(obj, dict):
+        n += sum(nbytes(value, depth + 1) for value in obj.itervalues())
+    elif hasattr(obj, '__dict__'):
+        n += sum(nbytes(value, depth + 1)
+                 for value in vars(obj).itervalues())
+    return n
+
+
+class LRUCache(object):
+    """Least-recently-used cache with a maximum total size in bytes
+
+    Parameters
+    ----------
+    max_bytes : int, optional (default=DEFAULT_CACHE_MAX_BYTES)
+        When the estimated size of all the cached values is larger than this,
+        the least recently used values are evicted
+
+    Attributes
+    ----------
+    nbytes : int
+        Estimated size of all the cached values
+    hits : int
+        Number of lookups which found a cached value
+    misses : int
+        Number of lookups which did not find a cached value
+    evictions : int
+        Number of values which were thrown out to stay under ``max_bytes``
+    invalidations : int
+        Number of values which were thrown out by :py:meth:`invalidate`
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        # Keys of the values which depend on each tag
+        self._tagged = collections.defaultdict(set)
+        # What computed each value, whose it is and how often it was used
+        self._info = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        try:
+            value, size, tags = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        # Re-insert so this is now the most recently used entry
+        self._entries[key] = value, size, tags
+        self._info[key]['hits'] += 1
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, tags=(), name=None, owner=None):
+        """Cache a value, noting what it depends on
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the value
+        value : object
+            Value to cache
+        tags : list-like, optional (default=())
+            Hashable labels of what the value depends on, e.g. (id(data),
+            "data"). :py:meth:`invalidate` with any of these tags removes
+            the value
+        name : str, optional (default=None)
+            What computed the value, e.g. "modalities", for :py:meth:`entries`
+        owner : int, optional (default=None)
+            ``id()`` of the object the value belongs to, for
+            :py:meth:`entries`
+        """
+        if key in self._entries:
+            self.pop(key)
+        size = nbytes(value)
+        if size > self.max_bytes:
+            # Would evict everything else and still not fit, so don't store it
+            self.evictions += 1
+            return
+        tags = tuple(tags)
+        self._entries[key] = value, size, tags
+        self._info[key] = {'name': name, 'owner': owner, 'hits': 0}
+        for tag in tags:
+            self._tagged[tag].add(key)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            self._evict()
+
+    def _untag(self, key, tags):
+        for tag in tags:
+            keys = self._tagged[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tagged[tag]
+
+    def _evict(self):
+        """Throw out the least recently used value"""
+        key, (value, size, tags) = self._entries.popitem(last=False)
+        self._untag(key, tags)
+        del self._info[key]
+        self.nbytes -= size
+        self.evictions += 1
+
+    def pop(self, key):
+        """Remove a value from the cache and return it"""
+        value, size, tags = self._entries.pop(key)
+        self._untag(key, tags)
+        del self._info[key]
+        self.nbytes -= size
+        return value
+
+    def invalidate(self, tag):
+        """Remove all the cached values which depend on ``tag``
+
+        Returns
+        -------
+        n : int
+            Number of values removed
+        """
+        keys = [key for key in self._tagged.pop(tag, ())
+                if key in self._entries]
+        for key in keys:
+            self.pop(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """Remove all cached values, but keep the hit/miss/eviction counts"""
+        self._entries.clear()
+        self._tagged.clear()
+        self._info.clear()
+        self.nbytes = 0
+
+    def entries(self, owner=None):
+        """Each cached value's name, size and number of hits
+
+        Parameters
+        ----------
+        owner : object, optional (default=None)
+            If given, only the values which belong to this object, e.g. one
+            data type of a :py:class:`.Study`
+
+        Returns
+        -------
+        entries : list of dict
+            The ``key``, ``name`` of what computed it, estimated size in
+            ``nbytes`` and number of ``hits`` of each value, from least to
+            most recently used
+        """
+        entries = []
+        for key, (value, size, tags) in self._entries.iteritems():
+            info = self._info[key]
+            if owner is not None and info['owner'] != id(owner):
+                continue
+            entries.append({'key': key, 'name': info['name'],
+                            'nbytes': size, 'hits': info['hits']})
+        return entries
+
+    def stats(self):
+        """Summary of the size and effectiveness of this cache
+
+        Returns
+        -------
+        stats : dict
+            The number of ``entries``, their estimated size in ``nbytes``,
+            the ``max_bytes`` budget, and the number of ``hits``, ``misses``,
+            ``evictions`` and ``invalidations``
+        """
+        return {'entries': len(self), 'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'invalidations': self.invalidations}
+
+
+class ResultStore(object):
+    """Results of expensive computations, pickled to files in a directory so
+    they're still there in the next python session
+
+    Results are keyed on a content hash (see :py:func:`hash_object`) of the
+    name of the computation and its inputs, e.g. the subset of the data and
+    the parameters, so a result is only reused for exactly the same inputs.
+    Results whose inputs can only be hashed on their identity, e.g. a lambda,
+    are computed but not saved, since their key wouldn't mean the same thing
+    in the next session.
+
+    Parameters
+    ----------
+    directory : str
+        Where to save the results. Created if it doesn't exist
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups which found a saved result
+    misses : int
+        Number of lookups which did not find a saved result
+    unsaved : int
+        Number of results which weren't saved, because some of their inputs
+        are hashed on their identity
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.hits = 0
+        self.misses = 0
+        self.unsaved = 0
+
+    def __repr__(self):
+        return '<ResultStore in {}>'.format(self.directory)
+
+    def _filename(self, key):
+        return os.path.join(self.directory, '{}.pickle'.format(key))
+
+    def __contains__(self, key):
+        return os.path.isfile(self._filename(key))
+
+    def __getitem__(self, key):
+        try:
+            with open(self._filename(key), 'rb') as f:
+                value = cPickle.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.misses += 1
+            raise KeyError(key)
+        except (cPickle.UnpicklingError, EOFError, AttributeError,
+                ImportError):
+            # Saved by an incompatible version of the code, so recompute it
+            self.misses += 1
+            raise KeyError(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        try:
+            data = cPickle.dumps(value, protocol=cPickle.HIGHEST_PROTOCOL)
+        except (cPickle.PicklingError, TypeError) as e:
+            sys.stderr.write('Not saving result {}, because it can\'t be '
+                             'pickled: {}\n'.format(key, e))
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # Write to a temporary file and move it into place, so other
+            # processes never read a half-written result
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(temp, self._filename(key))
+        except (IOError, OSError) as e:
+            sys.stderr.write('Could not save result {} in {}: {}\n'.format(
+                key, self.directory, e))
+
+    def pop(self, key):
+        """Remove a saved result and return it"""
+        value = self[key]
+        os.remove(self._filename(key))
+        return value
+
+    def clear(self):
+        """Remove all the saved results"""
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.pickle'):
+                os.remove(os.path.join(self.directory, filename))
+
+    def fetch(self, name, inputs, compute):
+        """Get a saved result, or compute and save it
+
+        Parameters
+        ----------
+        name : str
+            Name of the computation, e.g. "reduce"
+        inputs : object
+            Everything the result depends on, e.g. a tuple of the data and
+            the parameters
+        compute : function
+            Takes no arguments and computes the result
+
+        Returns
+        -------
+        result : object
+            The saved or newly computed result
+        """
+        hasher = hashlib.sha1()
+        identities = []
+        _update_with_object(hasher, (name, inputs), identities)
+        if identities:
+            # The key depends on where objects are in memory, so it could
+            # match a different object in the next session. Don't save it.
+            self.unsaved += 1
+            return compute()
+        key = hasher.hexdigest()
+        try:
+            return self[key]
+        except KeyError:
+            value = compute()
+            self[key] = value
+            return value
+
+    def stats(self):
+        """Summary of the size and effectiveness of this store
+
+        Returns
+        -------
+        stats : dict
+            The number of saved ``entries``, their size on disk in
+            ``nbytes``, and the number of ``hits``, ``misses`` and
+            ``unsaved`` results
+        """
+        filenames = []
+        if os.path.isdir(self.directory):
+            filenames = [os.path.join(self.directory, f)
+                         for f in os.listdir(self.directory)
+                         if f.endswith('.pickle')]
+        return {'entries': len(filenames),
+                'nbytes': sum(os.path.getsize(f) for f in filenames),
+                'hits': self.hits, 'misses': self.misses,
+                'unsaved': self.unsaved}
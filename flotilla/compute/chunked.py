@@ -0,0 +1,362 @@
+"""
+Labeled matrices which are too big to fit in memory, stored on disk in
+blocks of rows, e.g. expression of 100,000s of single cells
+"""
+import cPickle
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from .sparse import _positions
+
+# Default number of rows (samples) in each block on disk
+BLOCK_ROWS = 1000
+
+_LABELS_FILENAME = 'labels.pkl'
+_BLOCK_FILENAME = 'block_{:05d}.npy'
+
+
+class _ChunkedMatrixIndexer(object):
+    """Label-based indexing of a ChunkedMatrix, like pandas' ``.ix``
+
+    Selecting a single sample or feature reads it into a Series, anything
+    else returns another ChunkedMatrix which reads the selection from disk
+    when it's used
+    """
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            row_key, column_key = key
+        else:
+            row_key, column_key = key, slice(None)
+        matrix = self.matrix
+        rows = _positions(row_key, matrix.index)
+        columns = _positions(column_key, matrix.columns)
+
+        scalar_row, scalar_column = np.isscalar(rows), np.isscalar(columns)
+        subset = matrix._view(np.atleast_1d(rows) if scalar_row else rows,
+                              np.atleast_1d(columns) if scalar_column
+                              else columns)
+        if scalar_row and scalar_column:
+            return subset.to_dense().iat[0, 0]
+        elif scalar_row:
+            return subset.to_dense().iloc[0]
+        elif scalar_column:
+            return subset.to_dense().iloc[:, 0]
+        return subset
+
+
+def _write_blocks(blocks, directory, dtype):
+    """Save DataFrames as the row blocks of a ChunkedMatrix"""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    index, columns, block_rows = [], None, []
+    hasher = hashlib.md5()
+    for i, block in enumerate(blocks):
+        if columns is None:
+            columns = block.columns
+        elif not block.columns.equals(columns):
+            raise ValueError('Every block must have the same columns')
+        values = np.ascontiguousarray(block.values.astype(dtype))
+        np.save(os.path.join(directory, _BLOCK_FILENAME.format(i)), values)
+        hasher.update(values.view(np.uint8))
+        index.append(block.index)
+        block_rows.append(len(block.index))
+    if columns is None:
+        raise ValueError('Cannot make a ChunkedMatrix with no rows')
+
+    index = index[0].append(index[1:]) if len(index) > 1 else index[0]
+    labels = (index, columns, block_rows)
+    hasher.update(cPickle.dumps(labels, protocol=2))
+    # Write the labels last, so they only exist for a complete matrix
+    with open(os.path.join(directory, _LABELS_FILENAME), 'wb') as f:
+        cPickle.dump(labels + (hasher.hexdigest(),), f, protocol=2)
+
+
+class ChunkedMatrix(object):
+    """Samples x features matrix which is kept on disk, in blocks of rows
+
+    Only one block is read into memory at a time, so the matrix can be much
+    bigger than the available memory. Supports the parts of the DataFrame
+    interface that flotilla's data types need to subset and filter data and
+    compute per-feature statistics, which are all computed in one pass over
+    the blocks. Subsetting with ``.ix``, ``fillna`` and ``transform_values``
+    don't read anything, but return a new ChunkedMatrix which applies them
+    to each block as it is read. Missing values (NaN) are ignored by the
+    statistics like in pandas.
+
+    Parameters
+    ----------
+    directory : str
+        Folder of a matrix saved by :py:meth:`from_dataframe` or
+        :py:meth:`from_csv`
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, _LABELS_FILENAME), 'rb') as f:
+            labels = cPickle.load(f)
+        index, columns, block_rows = labels[:3]
+        self._stored_index = index
+        self._stored_columns = columns
+        self._block_starts = np.concatenate([[0], np.cumsum(block_rows)])
+        # Matrices saved before fingerprints were stored get one on demand
+        self._fingerprint = labels[3] if len(labels) > 3 else None
+
+        # Which stored rows and columns this matrix has (None for all), and
+        # what to do to their values after reading them
+        self._rows = None
+        self._columns = None
+        self._operations = ()
+        self.index = index
+        self.columns = columns
+        self._moments = None
+
+    @classmethod
+    def from_dataframe(cls, data, directory, block_rows=BLOCK_ROWS,
+                       dtype=np.float32):
+        """Save a DataFrame to disk in blocks of rows"""
+        blocks = (data.iloc[i:i + block_rows]
+                  for i in range(0, data.shape[0], block_rows))
+        _write_blocks(blocks, directory, dtype)
+        return cls(directory)
+
+    @classmethod
+    def from_csv(cls, filename, directory, block_rows=BLOCK_ROWS, sep=',',
+                 compression=None, dtype=np.float32):
+        """Copy a samples x features text file to disk in blocks of rows,
+        without reading the whole file into memory"""
+        blocks = pd.read_csv(filename, index_col=0, sep=sep,
+                             compression=compression, chunksize=block_rows)
+        _write_blocks(blocks, directory, dtype)
+        return cls(directory)
+
+    @property
+    def fingerprint(self):
+        """MD5 checksum of the stored values and labels, which is the same
+        for the same data saved in different places or python sessions.
+        Subsets and operations aren't included."""
+        if self._fingerprint is None:
+            hasher = hashlib.md5()
+            for i in range(len(self._block_starts) - 1):
+                block = np.load(os.path.join(self.directory,
+                                             _BLOCK_FILENAME.format(i)),
+                                mmap_mode='r')
+                hasher.update(np.ascontiguousarray(block).view(np.uint8))
+            block_rows = [int(n) for n in np.diff(self._block_starts)]
+            hasher.update(cPickle.dumps((self._stored_index,
+                                         self._stored_columns, block_rows),
+                                        protocol=2))
+            self._fingerprint = hasher.hexdigest()
+        return self._fingerprint
+
+    def _view(self, rows, columns):
+        """Subset of these rows and columns, as positions in this matrix"""
+        view = object.__new__(ChunkedMatrix)
+        view.__dict__.update(self.__dict__)
+        if rows is not None:
+            view._rows = rows if self._rows is None else self._rows[rows]
+            view.index = self.index[rows]
+        if columns is not None:
+            view._columns = columns if self._columns is None \
+                else self._columns[columns]
+            view.columns = self.columns[columns]
+        view._moments = None
+        return view
+
+    def _with_operation(self, operation):
+        view = self._view(None, None)
+        view._operations = self._operations + (operation,)
+        return view
+
+    def __repr__(self):
+        return '<ChunkedMatrix of {} x {} in {}>'.format(
+            self.shape[0], self.shape[1], self.directory)
+
+    def __getitem__(self, column):
+        """Read a single feature into a Series"""
+        return self.ix[:, column]
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.columns)
+
+    @property
+    def empty(self):
+        return 0 in self.shape
+
+    @property
+    def ix(self):
+        return _ChunkedMatrixIndexer(self)
+
+    def copy(self):
+        # The data on disk is never modified, so a view is as good as a copy
+        return self._view(None, None)
+
+    def iter_blocks(self, min_rows=None):
+        """Read the matrix one block of rows at a time
+
+        Parameters
+        ----------
+        min_rows : int, optional (default=None)
+            If provided, join blocks so every block has at least this many
+            rows, unless the whole matrix has fewer
+
+        Returns
+        -------
+        blocks : iterator of pandas.DataFrame
+            Blocks of rows, in the order they are stored on disk, which is
+            not necessarily the order of ``index``
+        """
+        blocks = self._iter_stored_blocks()
+        if min_rows is None:
+            return blocks
+        return self._join_blocks(blocks, min_rows)
+
+    def _iter_stored_blocks(self):
+        if self._rows is not None:
+            rows = np.sort(self._rows)
+            bounds = np.searchsorted(rows, self._block_starts)
+        for i in range(len(self._block_starts) - 1):
+            if self._rows is None:
+                local = slice(None)
+            else:
+                local = rows[bounds[i]:bounds[i + 1]] - self._block_starts[i]
+                if len(local) == 0:
+                    continue
+            block = np.load(os.path.join(self.directory,
+                                         _BLOCK_FILENAME.format(i)),
+                            mmap_mode='r')
+            if self._columns is not None and isinstance(local, slice):
+                values = block[:, self._columns]
+            elif self._columns is not None:
+                values = block[np.ix_(local, self._columns)]
+            else:
+                values = block[local]
+            values = np.array(values, dtype=np.float64)
+            for operation in self._operations:
+                values = operation(self, values)
+            index = self._stored_index[self._block_starts[i]:
+                                       self._block_starts[i + 1]][local]
+            yield pd.DataFrame(values, index=index, columns=self.columns)
+
+    @staticmethod
+    def _join_blocks(blocks, min_rows):
+        # Hold on to the last full block, so leftover rows at the end can be
+        # joined onto it rather than making a block that's too small
+        pending, buffered = None, []
+        for block in blocks:
+            buffered.append(block)
+            if sum(len(b) for b in buffered) >= min_rows:
+                if pending is not None:
+                    yield pending
+                pending, buffered = pd.concat(buffered), []
+        if buffered:
+            if pending is not None:
+                buffered.insert(0, pending)
+            pending = pd.concat(buffered)
+        if pending is not None:
+            yield pending
+
+    def to_dense(self):
+        """Read everything into a pandas.DataFrame"""
+        if self.empty:
+            return pd.DataFrame(index=self.index, columns=self.columns,
+                                dtype=np.float64)
+        return pd.concat(self.iter_blocks()).reindex(self.index)
+
+    def transform_values(self, func):
+        """Apply ``func`` elementwise to the values as they're read"""
+        return self._with_operation(lambda matrix, values: func(values))
+
+    def fillna(self, value):
+        """Fill missing values with a value, or a value per feature"""
+        if self._moments is not None \
+                and (self._moments[0] == self.shape[0]).all():
+            return self
+        # Keep the fill values of every stored column, so they still line
+        # up after more columns are subset
+        n_stored = len(self._stored_columns)
+        fill = np.empty(n_stored)
+        fill.fill(np.nan)
+        columns = np.arange(n_stored) if self._columns is None \
+            else self._columns
+        if isinstance(value, pd.Series):
+            fill[columns] = value.reindex(self.columns).values
+        else:
+            fill[columns] = value
+
+        def fill_missing(matrix, values):
+            column_fill = fill if matrix._columns is None \
+                else fill[matrix._columns]
+            return np.where(np.isnan(values), column_fill, values)
+        return self._with_operation(fill_missing)
+
+    def _series(self, values):
+        return pd.Series(values, index=self.columns)
+
+    def _compute_moments(self):
+        """Count, mean and sum of squared deviations from the mean of each
+        feature, in one pass, merging the blocks' moments with Chan et al's
+        parallel algorithm"""
+        if self._moments is not None:
+            return self._moments
+        n_columns = self.shape[1]
+        count = np.zeros(n_columns)
+        mean = np.zeros(n_columns)
+        m2 = np.zeros(n_columns)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for block in self.iter_blocks():
+                values = block.values
+                observed = ~np.isnan(values)
+                block_count = observed.sum(axis=0).astype(float)
+                block_mean = np.where(observed, values, 0).sum(axis=0) \
+                    / block_count
+                deviations = np.where(observed, values - block_mean, 0)
+                block_m2 = (deviations ** 2).sum(axis=0)
+
+                total = count + block_count
+                delta = np.where(block_count > 0, block_mean - mean, 0)
+                weight = np.where(total > 0, block_count / total, 0)
+                mean += delta * weight
+                m2 += block_m2 + delta ** 2 * count * weight
+                count = total
+            mean[count == 0] = np.nan
+        self._moments = count, mean, m2
+        return self._moments
+
+    def count(self):
+        """Number of non-missing values of each feature"""
+        return self._series(self._compute_moments()[0].astype(int))
+
+    def count_greater(self, thresh):
+        """Number of values greater than ``thresh`` in each feature"""
+        n_greater = np.zeros(self.shape[1], dtype=int)
+        with np.errstate(invalid='ignore'):
+            for block in self.iter_blocks():
+                n_greater += (block.values > thresh).sum(axis=0)
+        return self._series(n_greater)
+
+    def sum(self):
+        count, mean, m2 = self._compute_moments()
+        return self._series(np.where(count > 0, count * mean, 0))
+
+    def mean(self):
+        return self._series(self._compute_moments()[1])
+
+    def var(self, ddof=1):
+        """Variance of each feature, ignoring missing values"""
+        count, mean, m2 = self._compute_moments()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = m2 / (count - ddof)
+        var[count <= ddof] = np.nan
+        return self._series(var)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.var(ddof=ddof))
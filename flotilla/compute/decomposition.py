@@ -4,9 +4,13 @@ Perform various dimensionality reduction algorithms on data
 
 import sys
 
+import numpy as np
+from scipy.sparse.linalg import LinearOperator, svds
 from sklearn import decomposition
 import pandas as pd
 
+from .chunked import BLOCK_ROWS
+
 
 class DataFrameReducerBase(object):
     """Just like scikit-learn's reducers, but with prettied up DataFrames."""
@@ -214,3 +218,162 @@ class DataFrameTSNE(DataFrameReducerBase):
 
         self._check_dataframe(X)
         return pd.DataFrame(bh_sne(X), index=X.index)
+
+
+class SparseMatrixPCA(object):
+    """Perform Principal Components Analysis on a SparseMatrix, without
+    making it dense
+
+    Centering (and scaling) the data would fill in all the zeros, so instead
+    the centered, scaled matrix is only ever multiplied by vectors, which
+    only needs the sparse values and the means and standard deviations of the
+    features. The components are found with a truncated SVD of this
+    implicit matrix.
+
+    Has the same ``reduced_space``, ``components_``, ``explained_variance_``
+    and ``explained_variance_ratio_`` attributes as
+    :py:class:`.DataFramePCA`.
+    """
+
+    def __init__(self, X, n_components=None, standardize=True):
+        """Initialize and fit a sparse matrix
+
+        Parameters
+        ----------
+        X : flotilla.compute.sparse.SparseMatrix
+            A (samples, features) matrix of data to reduce, with no missing
+            values
+        n_components : int, optional (default=None)
+            Number of components to calculate. If None, use as many as
+            possible, which is one less than the smaller of the number of
+            samples and features
+        standardize : bool, optional (default=True)
+            If True, scale every feature to unit variance, like
+            sklearn.preprocessing.StandardScaler. Features are always
+            mean-centered.
+        """
+        n_samples, n_features = X.shape
+        if n_features <= 3:
+            raise ValueError(
+                "Too few features (n={}) to reduce".format(n_features))
+        max_components = min(n_samples, n_features) - 1
+        if n_components is None or n_components > max_components:
+            n_components = max_components
+        self.n_components = n_components
+
+        values = X.values.astype(np.float64)
+        means = X.mean().values
+        if standardize:
+            scale = X.std(ddof=0).values
+            scale[scale == 0] = 1
+        else:
+            scale = np.ones(n_features)
+        offset = means / scale
+
+        def matvec(v):
+            v = np.ravel(v)
+            return values.dot(v / scale) - offset.dot(v)
+
+        def rmatvec(u):
+            u = np.ravel(u)
+            return values.T.dot(u) / scale - offset * u.sum()
+
+        centered = LinearOperator((n_samples, n_features), matvec=matvec,
+                                  rmatvec=rmatvec, dtype=np.float64)
+        u, s, vt = svds(centered, k=n_components)
+
+        # svds returns the smallest singular values first
+        order = np.argsort(s)[::-1]
+        u, s, vt = u[:, order], s[order], vt[order]
+        # Make the largest loading of each component positive, so the
+        # results are deterministic
+        signs = np.sign(vt[np.arange(len(vt)), np.abs(vt).argmax(axis=1)])
+        signs[signs == 0] = 1
+        u, vt = u * signs, vt * signs[:, np.newaxis]
+
+        pcs = [DataFrameReducerBase.relabel_pcs(i) for i in range(len(s))]
+        self.components_ = pd.DataFrame(vt, index=pcs, columns=X.columns)
+        self.reduced_space = pd.DataFrame(u * s, index=X.index, columns=pcs)
+        self.explained_variance_ = pd.Series(s ** 2 / (n_samples - 1),
+                                             index=pcs)
+        total_variance = (X.var().values / scale ** 2).sum()
+        self.explained_variance_ratio_ = \
+            self.explained_variance_ / total_variance
+
+
+class ChunkedMatrixPCA(object):
+    """Perform Principal Components Analysis on a ChunkedMatrix, one block
+    of samples at a time
+
+    The components are fit with scikit-learn's IncrementalPCA on each
+    (standardized) block in turn, then each block is transformed into the
+    component space, so only one block is in memory at a time.
+
+    Has the same ``reduced_space``, ``components_``, ``explained_variance_``
+    and ``explained_variance_ratio_`` attributes as
+    :py:class:`.DataFramePCA`.
+    """
+
+    # How many components to find if not specified, since there could be
+    # as many as there are features
+    default_n_components = 50
+
+    def __init__(self, X, n_components=None, standardize=True):
+        """Initialize and fit a chunked matrix
+
+        Parameters
+        ----------
+        X : flotilla.compute.chunked.ChunkedMatrix
+            A (samples, features) matrix of data to reduce, with no missing
+            values
+        n_components : int, optional (default=None)
+            Number of components to calculate. If None, calculate
+            ``default_n_components``, or as many as possible if there are
+            fewer samples or features than that
+        standardize : bool, optional (default=True)
+            If True, scale every feature to unit variance, like
+            sklearn.preprocessing.StandardScaler. Features are always
+            mean-centered.
+        """
+        n_samples, n_features = X.shape
+        if n_features <= 3:
+            raise ValueError(
+                "Too few features (n={}) to reduce".format(n_features))
+        if n_components is None:
+            n_components = self.default_n_components
+        n_components = min(n_components, n_samples, n_features)
+        self.n_components = n_components
+
+        means = X.mean().values
+        if standardize:
+            scale = X.std(ddof=0).values
+            scale[scale == 0] = 1
+        else:
+            scale = np.ones(n_features)
+
+        # Every block given to IncrementalPCA needs at least as many samples
+        # as components
+        min_rows = max(n_components, BLOCK_ROWS)
+        pca = decomposition.IncrementalPCA(n_components=n_components)
+        for block in X.iter_blocks(min_rows=min_rows):
+            pca.partial_fit((block.values - means) / scale)
+
+        # Make the largest loading of each component positive, so the
+        # results are deterministic
+        vt = pca.components_
+        signs = np.sign(vt[np.arange(len(vt)), np.abs(vt).argmax(axis=1)])
+        signs[signs == 0] = 1
+        pca.components_ = vt * signs[:, np.newaxis]
+
+        pcs = [DataFrameReducerBase.relabel_pcs(i)
+               for i in range(n_components)]
+        reduced = [pd.DataFrame(pca.transform((block.values - means) / scale),
+                                index=block.index, columns=pcs)
+                   for block in X.iter_blocks(min_rows=min_rows)]
+        self.reduced_space = pd.concat(reduced).reindex(X.index)
+        self.components_ = pd.DataFrame(pca.components_, index=pcs,
+                                        columns=X.columns)
+        self.explained_variance_ = pd.Series(pca.explained_variance_,
+                                             index=pcs)
+        self.explained_variance_ratio_ = pd.Series(
+            pca.explained_variance_ratio_, index=pcs)
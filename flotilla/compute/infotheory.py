@@ -5,6 +5,10 @@ Information-theoretic calculations
 import numpy as np
 import pandas as pd
 
+# Approximate memory of the temporary arrays binify makes for each chunk of
+# columns it bins at once
+BINIFY_CHUNK_BYTES = 2 ** 25
+
 
 def bin_range_strings(bins):
     """Given a list of bins, make a list of strings of those bin ranges
@@ -25,9 +29,130 @@ def bin_range_strings(bins):
     return ['{}-{}'.format(i, j) for i, j in zip(bins, bins[1:])]
 
 
-def binify(df, bins):
+def _bin_indices(values, bins):
+    """Which bin each value of an array falls in
+
+    Parameters
+    ----------
+    values : numpy.array
+        An array of floats
+    bins : numpy.array
+        Monotonically increasing bin edges, including the final edge
+
+    Returns
+    -------
+    indices : numpy.array
+        The index of each value's bin, the same shape as ``values``. Like
+        numpy.histogram, each bin includes its left edge and the last bin
+        also includes its right edge. NaNs and values outside the bins are -1.
+    """
+    nbins = len(bins) - 1
+    with np.errstate(invalid='ignore'):
+        indices = np.searchsorted(bins, values, side='right') - 1
+        indices[values == bins[-1]] = nbins - 1
+        indices[~((values >= bins[0]) & (values <= bins[-1]))] = -1
+    return indices
+
+
+def _bin_counts(values, bins, chunk_bytes=BINIFY_CHUNK_BYTES):
+    """Histogram every column of a 2d array at once
+
+    Each value's bin is found with one ``searchsorted`` over the whole
+    chunk, and the bins of all columns are counted with one ``bincount`` by
+    offsetting each column's bins by ``nbins * column``.
+
+    Parameters
+    ----------
+    values : numpy.array
+        A samples x features array of floats
+    bins : numpy.array
+        Monotonically increasing bin edges, including the final edge
+    chunk_bytes : int, optional (default=BINIFY_CHUNK_BYTES)
+        Approximate memory of the temporary arrays for each chunk of columns
+
+    Returns
+    -------
+    counts : numpy.array
+        An nbins x features array of the number of values in each bin. Like
+        numpy.histogram, each bin includes its left edge, the last bin also
+        includes its right edge, and NaNs and values outside the bins aren't
+        counted.
+    """
+    n_rows, n_cols = values.shape
+    nbins = len(bins) - 1
+    counts = np.zeros((nbins, n_cols), dtype=np.int64)
+
+    # Several temporary arrays the size of the chunk are alive at once
+    step = max(1, chunk_bytes // max(1, n_rows * 8 * 4))
+    for start in xrange(0, n_cols, step):
+        index = _bin_indices(values[:, start:start + step], bins)
+        width = index.shape[1]
+        counted = index >= 0
+        index += nbins * np.arange(width)
+        column_counts = np.bincount(index[counted], minlength=nbins * width)
+        counts[:, start:start + width] = column_counts.reshape(width, nbins).T
+    return counts
+
+
+def binify_groups(values, groups, n_groups, bins,
+                  chunk_bytes=BINIFY_CHUNK_BYTES):
+    """Histogram every column of a 2d array within each group of rows
+
+    Like :py:func:`binify`, but every group of rows, e.g. the samples of
+    each phenotype, is binned separately, in the same one ``bincount`` per
+    chunk of columns.
+
+    Parameters
+    ----------
+    values : numpy.array
+        A samples x features array of floats
+    groups : numpy.array
+        Integer code of the group of each sample, from 0 to n_groups - 1.
+        Samples with a code of -1 aren't counted.
+    n_groups : int
+        Number of groups
+    bins : numpy.array
+        Monotonically increasing bin edges, including the final edge
+    chunk_bytes : int, optional (default=BINIFY_CHUNK_BYTES)
+        Approximate memory of the temporary arrays for each chunk of columns
+
+    Returns
+    -------
+    binned : numpy.array
+        An (n_groups, nbins, n_features) array of the fraction of each
+        group's values of each feature in each bin. NaN where a group has no
+        values for a feature.
+    """
+    values = np.asarray(values, dtype=float)
+    groups = np.asarray(groups)
+    n_rows, n_cols = values.shape
+    nbins = len(bins) - 1
+    counts = np.zeros((n_groups, nbins, n_cols))
+
+    step = max(1, chunk_bytes // max(1, n_rows * 8 * 4))
+    for start in xrange(0, n_cols, step):
+        index = _bin_indices(values[:, start:start + step], bins)
+        width = index.shape[1]
+        counted = (index >= 0) & (groups >= 0)[:, np.newaxis]
+        # Offset each bin by its column and group, so everything is counted
+        # at once
+        index += nbins * np.arange(width)
+        index += nbins * width * groups[:, np.newaxis]
+        chunk_counts = np.bincount(index[counted],
+                                   minlength=n_groups * nbins * width)
+        counts[:, :, start:start + width] = chunk_counts.reshape(
+            n_groups, width, nbins).transpose(0, 2, 1)
+
+    with np.errstate(invalid='ignore'):
+        return counts / counts.sum(axis=1)[:, np.newaxis, :]
+
+
+def binify(df, bins, chunk_bytes=BINIFY_CHUNK_BYTES):
     """Makes a histogram of each column the provided binsize
 
+    All columns are binned at once rather than one at a time, a chunk of
+    columns at a time to limit memory.
+
     Parameters
     ----------
     data : pandas.DataFrame
@@ -37,16 +162,25 @@ def binify(df, bins):
         Bins you would like to use for this data. Must include the final bin
         value, e.g. (0, 0.5, 1) for the two bins (0, 0.5) and (0.5, 1).
         nbins = len(bins) - 1
+    chunk_bytes : int, optional (default=BINIFY_CHUNK_BYTES)
+        Approximate memory to use for binning each chunk of columns
 
     Returns
     -------
     binned : pandas.DataFrame
-        An nbins x features DataFrame of each column binned across rows
+        An nbins x features DataFrame of each column binned across rows.
+        NaNs and values outside the bins aren't counted, as in
+        numpy.histogram.
     """
     if bins is None:
         raise ValueError('Must specify "bins"')
-    binned = df.apply(lambda x: pd.Series(np.histogram(x, bins=bins)[0]))
-    binned.index = bin_range_strings(bins)
+    edges = np.asarray(bins, dtype=float)
+    if np.any(np.diff(edges) < 0):
+        raise ValueError('"bins" must increase monotonically')
+
+    values = np.asarray(df.values, dtype=float)
+    binned = pd.DataFrame(_bin_counts(values, edges, chunk_bytes),
+                          index=bin_range_strings(bins), columns=df.columns)
 
     # Normalize so each column sums to 1
     binned = binned / binned.sum().astype(float)
@@ -111,6 +245,87 @@ def jsd(p, q):
     return result
 
 
+def pairwise_jsd(p, q):
+    """Jensen-Shannon divergence between every pair of rows of p and q
+
+    Computed as one (len(p), len(q), nbins) array operation rather than one
+    pandas calculation per pair. Like :py:func:`jsd`, terms where a
+    distribution is zero count as zero (0 * log(0) = 0), and rows with
+    NaNs have a NaN divergence.
+
+    Parameters
+    ----------
+    p : numpy.array
+        An (n, nbins) array of distributions, e.g. binned features
+    q : numpy.array
+        An (m, nbins) array of distributions
+
+    Returns
+    -------
+    jsd : numpy.array
+        An (n, m) array of the Jensen-Shannon divergence between each row of
+        p and each row of q
+    """
+    p = np.asarray(p, dtype=float)[:, np.newaxis, :]
+    q = np.asarray(q, dtype=float)[np.newaxis, :, :]
+    return jsd_arrays(p, q, axis=2)
+
+
+def jsd_arrays(p, q, axis=0):
+    """Jensen-Shannon divergence between arrays of distributions
+
+    The numpy equivalent of :py:func:`jsd`, for any number of dimensions.
+    Terms where a distribution is zero count as zero (0 * log(0) = 0), and
+    distributions with NaNs have a NaN divergence.
+
+    Parameters
+    ----------
+    p : numpy.array
+        Distributions along ``axis``, e.g. an (nbins, n_features) array
+    q : numpy.array
+        Distributions along ``axis``, which broadcast against ``p``
+    axis : int, optional (default=0)
+        The axis of the bins
+
+    Returns
+    -------
+    jsd : numpy.array
+        Jensen-Shannon divergence between the distributions, with ``axis``
+        removed
+    """
+    weight = 0.5
+    m = weight * (p + q)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kld_p = np.where(p == 0, 0, p * np.log2(p / m)).sum(axis=axis)
+        kld_q = np.where(q == 0, 0, q * np.log2(q / m)).sum(axis=axis)
+    return weight * kld_p + (1 - weight) * kld_q
+
+
+def entropy_arrays(binned, axis=0, base=2):
+    """Entropy of an array of distributions
+
+    The numpy equivalent of :py:func:`entropy`, for any number of
+    dimensions. Bins with zero probability count as zero (0 * log(0) = 0).
+
+    Parameters
+    ----------
+    binned : numpy.array
+        Probability distributions along ``axis``
+    axis : int, optional (default=0)
+        The axis of the bins
+    base : numeric, optional (default=2)
+        The log-base of the entropy
+
+    Returns
+    -------
+    entropy : numpy.array
+        Entropy of each distribution, with ``axis`` removed
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(binned) / np.log(base)
+        return -np.where(binned == 0, 0, logs * binned).sum(axis=axis)
+
+
 def entropy(binned, base=2):
     """Find the entropy of each column of a dataframe
 
@@ -8,13 +8,9 @@ import math
 
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import ExtraTreesClassifier, ExtraTreesRegressor, \
-    GradientBoostingClassifier, GradientBoostingRegressor
-from sklearn.preprocessing import LabelEncoder
 import pandas.util.testing as pdt
 
 from ..util import memoize, timestamp
-from .decomposition import DataFramePCA, DataFrameNMF
 
 
 CLASSIFIER = 'ExtraTreesClassifier'
@@ -323,11 +319,17 @@ class PredictorConfigManager(object):
     ...                                           verbose=True})
     """
 
-    def __init__(self):
-        """Construct a predictor configuration manager with
-        ExtraTreesClassifier, ExtraTreesRegressor, GradientBoostingClassifier,
-        and GradientBoostingRegressor as default predictors.
+    def _register_builtin_predictors(self):
+        """Add ExtraTreesClassifier, ExtraTreesRegressor,
+        GradientBoostingClassifier, and GradientBoostingRegressor as default
+        predictors.
+
+        Called when the predictor configurations are first used, so
+        scikit-learn isn't imported until a predictor is needed
         """
+        from sklearn.ensemble import ExtraTreesClassifier, \
+            ExtraTreesRegressor, GradientBoostingClassifier, \
+            GradientBoostingRegressor
 
         constant_extratrees_kwargs = {'bootstrap': True,
                                       'random_state': 0,
@@ -373,6 +375,7 @@ class PredictorConfigManager(object):
         """
         if not hasattr(self, '_predictors'):
             self._predictors = {}
+            self._register_builtin_predictors()
 
         return self._predictors
 
@@ -527,6 +530,8 @@ class PredictorDataSet(object):
                 warnings.warn("WARNING: trait {} has >2 categories".format(
                     self.trait_name))
 
+            from sklearn.preprocessing import LabelEncoder
+
             # categorical encoder
             le = LabelEncoder().fit(self.traitset)
 
@@ -876,7 +881,10 @@ class PredictorBase(object):
 
     @property
     def predictor(self):
-        """Thin reference to ``dataset.predictor``"""
+        """Thin reference to ``dataset.predictor``, unless an already-fit
+        predictor was set"""
+        if self.__dict__.get('_predictor') is not None:
+            return self._predictor
         return self.dataset.predictor(self.predictor_name,
                                       obj=self.predictor_obj,
                                       predictor_scoring_fun=self.predictor_scoring_fun,
@@ -884,6 +892,12 @@ class PredictorBase(object):
                                       n_features_dependent_parameters=self.n_features_dependent_kwargs,
                                       **self.constant_kwargs)
 
+    @predictor.setter
+    def predictor(self, value):
+        """Use this predictor, e.g. one fit in an earlier session, instead
+        of the one from ``dataset.predictor``"""
+        self._predictor = value
+
     def fit(self):
         """Fit predictor to the dataset"""
         sys.stdout.write(
@@ -1009,11 +1023,15 @@ class PredictorBase(object):
     @memoize
     def pca(self):
         """Perform PCA on the top-performing features"""
+        from .decomposition import DataFramePCA
+
         return DataFramePCA(self.subset_)
 
     @memoize
     def nmf(self):
         """Perform NMF on the top-performing features"""
+        from .decomposition import DataFrameNMF
+
         return DataFrameNMF(self.subset_)
 
 
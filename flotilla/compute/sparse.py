@@ -0,0 +1,209 @@
+"""
+Labeled sparse matrices, for data which is mostly zeros, e.g. single-cell
+gene expression
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# How many columns of a dense DataFrame to convert to sparse at once
+_CONVERT_BLOCK_COLUMNS = 1000
+
+
+class _SparseMatrixIndexer(object):
+    """Label-based indexing of a SparseMatrix, like pandas' ``.ix``"""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            row_key, column_key = key
+        else:
+            row_key, column_key = key, slice(None)
+        matrix = self.matrix
+        rows = _positions(row_key, matrix.index)
+        columns = _positions(column_key, matrix.columns)
+
+        values = matrix.values
+        if columns is not None:
+            values = values[:, columns]
+        if rows is not None:
+            values = values[rows, :]
+
+        index = matrix.index if rows is None else matrix.index[rows]
+        cols = matrix.columns if columns is None else matrix.columns[columns]
+        if np.isscalar(rows) and np.isscalar(columns):
+            return values
+        elif np.isscalar(rows):
+            return pd.Series(values.toarray().ravel(), index=cols,
+                             name=index)
+        elif np.isscalar(columns):
+            return pd.Series(values.toarray().ravel(), index=index,
+                             name=cols)
+        return SparseMatrix(values, index, cols)
+
+
+def _positions(key, labels):
+    """Integer positions of a label, labels, or boolean mask, or None for
+    everything"""
+    if isinstance(key, slice) and key == slice(None):
+        return None
+    if np.isscalar(key):
+        return labels.get_loc(key)
+    key = np.asarray(key)
+    if key.dtype == bool:
+        return np.flatnonzero(key)
+    positions = labels.get_indexer(key)
+    if (positions < 0).any():
+        raise KeyError('{} not in index'.format(
+            list(key[positions < 0])))
+    return positions
+
+
+class SparseMatrix(object):
+    """Samples x features matrix of mostly zeros, with row and column labels
+
+    Holds only the nonzero values, in a compressed sparse column (CSC)
+    matrix, so memory scales with the number of nonzero values. Supports
+    the parts of the DataFrame interface that flotilla's data types need to
+    subset and filter data and compute per-feature statistics, without
+    making the whole matrix dense. Missing values (NaN) are stored
+    explicitly, and ignored by the statistics like in pandas.
+
+    Parameters
+    ----------
+    values : scipy.sparse matrix
+        The (n_samples, n_features) values
+    index : list-like
+        Sample ids
+    columns : list-like
+        Feature ids
+    """
+
+    def __init__(self, values, index, columns):
+        self.values = sparse.csc_matrix(values)
+        self.values.eliminate_zeros()
+        self.index = pd.Index(index)
+        self.columns = pd.Index(columns)
+        if self.values.shape != (len(self.index), len(self.columns)):
+            shape = len(self.index), len(self.columns)
+            raise ValueError('Shape of values {} does not match the index '
+                             'and columns {}'.format(self.values.shape,
+                                                     shape))
+
+    @classmethod
+    def from_dataframe(cls, data, dtype=np.float32):
+        """Convert a dense DataFrame, a block of columns at a time"""
+        blocks = [sparse.csc_matrix(
+            data.iloc[:, i:i + _CONVERT_BLOCK_COLUMNS].values.astype(dtype))
+            for i in range(0, data.shape[1], _CONVERT_BLOCK_COLUMNS)]
+        if blocks:
+            values = sparse.hstack(blocks, format='csc')
+        else:
+            values = sparse.csc_matrix((data.shape[0], 0), dtype=dtype)
+        return cls(values, data.index, data.columns)
+
+    def __repr__(self):
+        return '<SparseMatrix of {} x {} with {} stored values>'.format(
+            self.shape[0], self.shape[1], self.values.nnz)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def empty(self):
+        return 0 in self.shape
+
+    @property
+    def nbytes(self):
+        return self.values.data.nbytes + self.values.indices.nbytes \
+            + self.values.indptr.nbytes
+
+    @property
+    def ix(self):
+        return _SparseMatrixIndexer(self)
+
+    @property
+    def T(self):
+        return SparseMatrix(self.values.T, self.columns, self.index)
+
+    def copy(self):
+        return SparseMatrix(self.values.copy(), self.index, self.columns)
+
+    def to_dense(self):
+        """Dense pandas.DataFrame of the same data"""
+        return pd.DataFrame(self.values.toarray(), index=self.index,
+                            columns=self.columns)
+
+    def transform_values(self, func):
+        """Apply ``func`` to the stored values. ``func(0)`` must be 0"""
+        values = self.values.copy()
+        values.data = func(values.data)
+        return SparseMatrix(values, self.index, self.columns)
+
+    def _stored_columns(self):
+        """Column number of every stored value"""
+        return np.repeat(np.arange(self.shape[1]), np.diff(self.values.indptr))
+
+    def _column_sums(self, weights):
+        return np.bincount(self._stored_columns(), weights=weights,
+                           minlength=self.shape[1])
+
+    def _series(self, values):
+        return pd.Series(values, index=self.columns)
+
+    def count(self):
+        """Number of non-missing values of each feature"""
+        n_missing = self._column_sums(np.isnan(self.values.data))
+        return self._series(self.shape[0] - n_missing.astype(int))
+
+    def count_greater(self, thresh):
+        """Number of values greater than ``thresh`` in each feature, without
+        comparing every zero"""
+        data = self.values.data
+        with np.errstate(invalid='ignore'):
+            n_greater = self._column_sums(data > thresh).astype(int)
+        if thresh < 0:
+            n_stored = np.diff(self.values.indptr)
+            n_greater += self.shape[0] - n_stored
+        return self._series(n_greater)
+
+    def sum(self):
+        data = self.values.data
+        return self._series(self._column_sums(
+            np.where(np.isnan(data), 0, data)))
+
+    def mean(self):
+        count = self.count().astype(float)
+        return self.sum() / count.replace(0, np.nan)
+
+    def var(self, ddof=1):
+        """Variance of each feature, ignoring missing values"""
+        data = self.values.data
+        sum_squares = self._series(self._column_sums(
+            np.where(np.isnan(data), 0, data.astype(np.float64) ** 2)))
+        count = self.count().astype(float)
+        mean = self.mean()
+        var = (sum_squares - count * mean ** 2) / (count - ddof)
+        var[count <= ddof] = np.nan
+        # Floating point error can make constant features slightly negative
+        return var.clip_lower(0)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.var(ddof=ddof))
+
+    def fillna(self, value):
+        """Fill missing values with a value, or a value per feature"""
+        data = self.values.data
+        missing = np.isnan(data)
+        if not missing.any():
+            return self
+        values = self.values.copy()
+        if isinstance(value, pd.Series):
+            fill = value.reindex(self.columns).values[self._stored_columns()]
+            values.data[missing] = fill[missing]
+        else:
+            values.data[missing] = value
+        return SparseMatrix(values, self.index, self.columns)
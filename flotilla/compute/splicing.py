@@ -1,11 +1,9 @@
-import collections
-
 import numpy as np
 import pandas as pd
-from sklearn import cross_validation
 
 from ..util import memoize
-from .infotheory import jsd, binify
+from .infotheory import (BINIFY_CHUNK_BYTES, binify, pairwise_jsd,
+                         _bin_indices)
 
 
 class Modalities(object):
@@ -71,7 +69,8 @@ class Modalities(object):
             A (n_modalities,) sized series of JSD between this event and the
             true modalities
         """
-        return self.true_modalities.apply(jsd, axis=0, p=col)
+        jsd = pairwise_jsd(col.values[np.newaxis, :], self.modalities_bins)
+        return pd.Series(jsd[0], index=self.modalities_names)
 
     def sqrt_jsd_modalities(self, binned):
         """Calculate JSD between all binned splicing events and true modalities
@@ -90,7 +89,10 @@ class Modalities(object):
             between splicing events and all modalities
 
         """
-        return np.sqrt(binned.apply(self._col_jsd_modalities, axis=0))
+        # All events against all modalities in one array operation
+        jsd = pairwise_jsd(binned.values.T, self.modalities_bins)
+        return pd.DataFrame(np.sqrt(jsd.T), index=self.modalities_names,
+                            columns=binned.columns)
 
     def assignments(self, sqrt_jsd_modalities):
         """Return the modality with the smallest square root JSD to each event
@@ -157,54 +159,92 @@ class Modalities(object):
             Modality assignments of each column (feature)
         """
         binned = binify(data, self.bins)
-        self.true_modalities.index = binned.index
         return self.assignments(self.sqrt_jsd_modalities(binned))
 
     def _bootstrapped_fit_transform(self, data, n_iter=100, thresh=0.6,
-                                    min_samples=10):
+                                    min_samples=10, n_jobs=None,
+                                    random_state=0):
         """Resample each splicing event n_iter times to robustly estimate
         modalities.
-        """
-        bs = cross_validation.Bootstrap(data.shape[0], n_iter=n_iter)
-
-        assignments = pd.DataFrame(columns=data.columns,
-                                   index=range(n_iter))
-
-        for i, (train_index, test_index) in enumerate(bs):
-            index = train_index + test_index
-            psi = data.ix[data.index[index], :]
-            psi = psi.dropna(axis=1, thresh=min_samples)
-            assignments.ix[i] = self._single_fit_transform(psi,
-                                                           do_not_memoize=True)
-
-        counts = assignments.apply(lambda x: pd.Series(
-            collections.Counter(x.dropna())))
-        fractions = counts / counts.sum().astype(float)
-        thresh_assignments = fractions[fractions >= thresh].apply(
-            self._max_assignment, axis=0)
-        thresh_assignments = thresh_assignments.fillna('unassigned')
-        return thresh_assignments
 
-    @staticmethod
-    def _max_assignment(x):
-        """Given a pandas.Series of modalities counts, return the maximum
-        value. Necessary because just np.argmax will use np.nan as the max :(
+        All the resamples are drawn up front, as the number of times each
+        sample is drawn in each resample. Every resample of a chunk of
+        events is then binned with one matrix product, and its modality
+        found with one JSD calculation. Chunks of events are processed in
+        parallel threads, since numpy releases the GIL.
 
         Parameters
         ----------
-        x : pandas.Series
-            A (n_modalities,) sized pandas series of integers, which count how
-            many times this single splicing event was assigned to a modality.
+        data : pandas.DataFrame
+            A samples x features dataframe, where you want to find the
+            splicing modality of each column (feature)
+        n_iter : int, optional (default=100)
+            Number of resamples
+        thresh : float, optional (default=0.6)
+            Minimum fraction of resamples in which an event must be assigned
+            the same modality. Otherwise, the event is "unassigned"
+        min_samples : int, optional (default=10)
+            Events with fewer non-NaN samples in a resample aren't assigned
+            a modality in that resample
+        n_jobs : int, optional (default=None)
+            Number of chunks of events to process at once. If None, use one
+            thread per CPU
+        random_state : int, optional (default=0)
+            Seed for drawing the resamples, so the assignments are the same
+            every time, no matter how many jobs are used
 
         Returns
         -------
-        assignment : str
-            The modality with the largest number of counts
+        assignments : pandas.Series
+            Modality assignments of each column (feature)
         """
-        if np.isfinite(x).sum() == 0:
-            return np.nan
+        from multiprocessing import cpu_count
+        from multiprocessing.pool import ThreadPool
+
+        values = np.asarray(data.values, dtype=float)
+        n_samples, n_events = values.shape
+
+        # Number of times each sample is drawn in each resample, counted
+        # with one bincount by offsetting each resample's draws
+        draws = np.random.RandomState(random_state).randint(
+            0, n_samples, size=(n_iter, n_samples))
+        draws += n_samples * np.arange(n_iter)[:, np.newaxis]
+        weights = np.bincount(draws.ravel(), minlength=n_iter * n_samples)
+        weights = weights.reshape(n_iter, n_samples).astype(float)
+
+        bins = np.asarray(self.bins, dtype=float)
+        n_modalities, nbins = self.modalities_bins.shape
+        # Approximate memory needed per event
+        event_bytes = 8 * (nbins + 1) * (n_samples + 4 * n_iter * n_modalities)
+        step = max(1, BINIFY_CHUNK_BYTES // event_bytes)
+        chunks = [values[:, start:start + step]
+                  for start in xrange(0, n_events, step)]
+
+        def count(chunk):
+            return _bootstrap_modality_counts(
+                chunk, weights, bins, self.modalities_bins, min_samples)
+
+        n_jobs = cpu_count() if n_jobs is None else n_jobs
+        if len(chunks) > 1 and n_jobs != 1:
+            pool = ThreadPool(min(n_jobs, len(chunks)))
+            try:
+                counts = pool.map(count, chunks)
+            finally:
+                pool.close()
+                pool.join()
         else:
-            return np.argmax(x)
+            counts = map(count, chunks)
+        counts = np.concatenate(counts, axis=1) if counts \
+            else np.zeros((n_modalities, 0), dtype=np.int64)
+
+        best = np.argmax(counts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fractions = counts[best, np.arange(n_events)] \
+                / counts.sum(axis=0).astype(float)
+        names = np.asarray(self.modalities_names, dtype=object)
+        assignments = np.where(fractions >= thresh, names[best],
+                               'unassigned')
+        return pd.Series(assignments, index=data.columns)
 
     def counts(self, psi, bootstrapped=False, bootstrapped_kws=None):
         """Return the number of events in each modality category
@@ -223,6 +263,59 @@ class Modalities(object):
         return assignments.groupby(assignments).size()
 
 
+def _bootstrap_modality_counts(values, weights, bins, modalities_bins,
+                               min_samples):
+    """Count how many resamples assign each event to each modality
+
+    Parameters
+    ----------
+    values : numpy.array
+        A (n_samples, n_events) array of psi scores
+    weights : numpy.array
+        A (n_iter, n_samples) array of the number of times each sample is
+        drawn in each resample
+    bins : numpy.array
+        Bin edges, including the final edge
+    modalities_bins : numpy.array
+        A (n_modalities, n_bins) array of the true modalities
+    min_samples : int
+        Events with fewer non-NaN samples in a resample aren't counted in
+        that resample
+
+    Returns
+    -------
+    counts : numpy.array
+        A (n_modalities, n_events) integer array of the number of resamples
+        assigning each event to each modality
+    """
+    n_samples, n_events = values.shape
+    n_iter = weights.shape[0]
+    n_modalities, nbins = modalities_bins.shape
+
+    # One-hot encoding of each value's bin, plus whether it's a value at
+    # all, so binning every resample is one matrix product with the weights
+    indices = _bin_indices(values, bins)
+    samples, events = np.nonzero(indices >= 0)
+    encoded = np.zeros((n_samples, n_events, nbins + 1))
+    encoded[samples, events, indices[samples, events]] = 1
+    encoded[:, :, nbins] = np.isfinite(values)
+    binned = np.dot(weights, encoded.reshape(n_samples, -1)).reshape(
+        n_iter, n_events, nbins + 1)
+
+    n_values = binned[:, :, nbins]
+    binned = binned[:, :, :nbins]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        binned = binned / binned.sum(axis=2)[:, :, np.newaxis]
+    jsd = pairwise_jsd(binned.reshape(-1, nbins), modalities_bins)
+    assigned = np.argmin(jsd, axis=1).reshape(n_iter, n_events)
+    counted = n_values >= min_samples
+
+    counts = np.zeros((n_modalities, n_events), dtype=np.int64)
+    for modality in xrange(n_modalities):
+        counts[modality] = ((assigned == modality) & counted).sum(axis=0)
+    return counts
+
+
 def switchy_score(array):
     """Transform a 1D array of data scores to a vector of "switchy scores"
 
@@ -263,3 +356,72 @@ def get_switchy_score_order(x):
     """
     switchy_scores = np.apply_along_axis(switchy_score, axis=0, arr=x)
     return np.argsort(switchy_scores)
+
+
+class SharedEventCounter(object):
+    """Count how many downsampling iterations detected each splicing event
+
+    Counts are kept in an integer (events x (splice type, probability))
+    array which grows as new events appear, so a tall table of MISO
+    summaries can be counted a chunk of rows at a time, without holding the
+    whole table in memory.
+
+    Parameters
+    ----------
+    dtype : numpy.dtype, optional (default=numpy.int32)
+        Integer type of the counts
+    """
+
+    def __init__(self, dtype=np.int32):
+        self._events = {}
+        self._groups = {}
+        self.counts = np.zeros((0, 0), dtype=dtype)
+
+    @staticmethod
+    def _codes(keys, codes):
+        """Integer code of each key, giving new keys the next code"""
+        labels, uniques = pd.factorize(keys)
+        unique_codes = np.array([codes.setdefault(key, len(codes))
+                                 for key in uniques], dtype=np.intp)
+        return unique_codes[labels]
+
+    def update(self, summary):
+        """Add the events from a chunk of MISO summary rows
+
+        Parameters
+        ----------
+        summary : pandas.DataFrame
+            MISO summaries with the columns "event_name", "splice_type" and
+            "probability", one row per event detected in an iteration
+        """
+        if summary.empty:
+            return
+        rows = self._codes(summary['event_name'].values, self._events)
+        groups = pd.Series(list(zip(summary['splice_type'],
+                                    summary['probability'])))
+        columns = self._codes(groups.values, self._groups)
+
+        n_rows, n_columns = len(self._events), len(self._groups)
+        if (n_rows, n_columns) != self.counts.shape:
+            counts = np.zeros((n_rows, n_columns), dtype=self.counts.dtype)
+            counts[:self.counts.shape[0], :self.counts.shape[1]] = self.counts
+            self.counts = counts
+
+        flat = np.bincount(rows * n_columns + columns,
+                           minlength=n_rows * n_columns)
+        self.counts += flat.reshape(n_rows, n_columns).astype(
+            self.counts.dtype)
+
+    def to_dataframe(self):
+        """Event counts, with splicing events on the rows and (splice type,
+        probability) as the column MultiIndex. Events which weren't detected
+        at that splice type and probability are NaN
+        """
+        if not self._groups:
+            return pd.DataFrame()
+        index = sorted(self._events, key=self._events.get)
+        groups = sorted(self._groups, key=self._groups.get)
+        counts = pd.DataFrame(self.counts, index=index,
+                              columns=pd.MultiIndex.from_tuples(groups))
+        counts = counts.where(counts > 0)
+        return counts.sort_index().sort_index(axis=1)
@@ -3,23 +3,19 @@ Common operations performed on all kinds of data types
 """
 import sys
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import seaborn as sns
-from sklearn.preprocessing import StandardScaler
 
-from ..compute.decomposition import DataFramePCA, DataFrameNMF
+from ..compute.chunked import ChunkedMatrix
 # from ..compute.clustering import Cluster
-from ..compute.infotheory import binify
+from ..compute.infotheory import (binify, binify_groups, entropy_arrays,
+                                  jsd_arrays)
 from ..compute.predict import PredictorConfigManager, PredictorDataSetManager
-from ..visualize.decomposition import DecompositionViz
-from ..visualize.generic import violinplot, nmf_space_transitions, \
-    simple_twoway_scatter
-from ..visualize.network import NetworkerViz
-from ..visualize.predict import ClassifierViz
-from ..util import memoize, cached_property
-from ..compute.outlier import OutlierDetection
+from ..compute.sparse import SparseMatrix
+from ..util import memoize, cached_property, timed
+from ..cache import LRUCache, nbytes
+from .feature_names import FeatureNameIndex
+from .subsets import SubsetIndex
 
 default_predictor_name = "ExtraTreesClassifier"
 MINIMUM_FEATURE_SUBSET = 20
@@ -48,12 +44,15 @@ class BaseData(object):
         the same size as the data, but must at least include all the features
         from :py:attr:`data`. Compared to :py:attr:`.data`,
         ``k_features >= m_features``
-    feature_subsets : dict
+    feature_subsets : SubsetIndex
         Dict of {"subset_name" : list_of_feature_ids} for feature subsets
         specified as either boolean columns in ``feature_data``. All columns in
         ``feature_ignore_subset_cols`` are ignored
     predictor_config_manager : PredictorConfigManager
         Manage different combinations of predictor on different data subtypes
+    cache : LRUCache
+        Memoized results of expensive computations on this data, e.g.
+        :py:meth:`.binned_nmf_reduced`
     variant : pandas.Index
         Genes whose variance among all cells is 2 standard deviations away
         from the mean variance
@@ -68,9 +67,17 @@ class BaseData(object):
         original id
     maybe_renamed_to_feature_id
         Convert a weird feature ID to your known gene names
+    rename_features
+        Rename many feature ids at once
+    resolve_feature_ids
+        Convert many gene names or feature ids to feature ids at once
 
     """
 
+    # Attributes whose changes are counted in _versions, so memoized results
+    # which depend on them are thrown out when they change. See mark_changed
+    _versioned_attributes = ('data', 'feature_data')
+
     def __init__(self, data, thresh=-np.inf,
                  minimum_samples=0,
                  feature_data=None,
@@ -80,7 +87,7 @@ class BaseData(object):
                  outliers=None,
                  pooled=None,
                  predictor_config_manager=None,
-                 data_type=None):
+                 data_type=None, cache=None, result_store=None):
         """Abstract base class for biological measurements
 
         Parameters
@@ -92,7 +99,10 @@ class BaseData(object):
             splicing "Percent-spliced-in" (PSI) values, or RNA editing scores.
             Note: If the columns are a multi-index, the "level 0" is assumed to
             be the unique, crazy ID like 'ENSG00000100320', and "level 1" is
-            assumed to be the convenient gene name like "RBFOX2"
+            assumed to be the convenient gene name like "RBFOX2". For data
+            too big to fit in memory, this can be a
+            :py:class:`.ChunkedMatrix`, which is thresholded, subset and
+            reduced with PCA one block of samples at a time.
         thresh : float, optional (default=-np.inf)
             Minimum value to accept for this data.
         minimum_samples : int, optional (default=0)
@@ -128,12 +138,22 @@ class BaseData(object):
         data_type : str, optional (default=None)
             A string indicating what kind of data this is, e.g. "expression" or
             "splicing"
+        cache : LRUCache, optional (default=None)
+            Where to store memoized results of computations on this data. If
+            None, one is initialized for this instance. Data in the same
+            :py:class:`.Study` share a cache so they share a byte budget.
+        result_store : ResultStore, optional (default=None)
+            Where to save the results of :py:meth:`reduce`,
+            :py:meth:`classify` and :py:meth:`detect_outliers`, so they're
+            reused in later python sessions. If None, they aren't saved.
 
         Notes
         -----
         Any cells not marked as "technical_outliers", "outliers" or "pooled"
         are considered as single-cell samples.
         """
+        # Calls and total seconds spent in the main operations. See stats()
+        self.timings = {}
         self.data = data
         self.data_original = self.data
         self.thresh = thresh
@@ -147,13 +167,19 @@ class BaseData(object):
             good_samples = ~self.data.index.isin(technical_outliers)
             self.data = self.data.ix[good_samples]
 
-        self.pooled_samples = pooled if pooled is not None else []
-        self.outlier_samples = outliers if outliers is not None else []
+        self.pooled_samples = pd.Index(pooled if pooled is not None else [])
+        self.outlier_samples = pd.Index(
+            outliers if outliers is not None else [])
         self.single_samples = self.data.index[~self.data.index.isin(
             self.pooled_samples)]
 
+        # Rows of the data for the singles, pooled and outliers, found the
+        # first time they're used. See _sample_rows
+        self._sample_rows_cache = {}
+
         if self.thresh > -np.inf or self.minimum_samples > 0:
-            self.data_original = self.data.copy()
+            # Thresholding makes a new DataFrame, so there's no need to copy
+            self.data_original = self.data
             if not self.singles.empty:
                 self.data = self._threshold(self.data, self.singles)
             else:
@@ -197,7 +223,55 @@ class BaseData(object):
         self.predictor_dataset_manager = PredictorDataSetManager(
             self.predictor_config_manager)
 
-        self.networks = NetworkerViz(self)
+        self.cache = LRUCache() if cache is None else cache
+        self.result_store = result_store
+
+    @property
+    def data(self):
+        """The samples x features data"""
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self.mark_changed('data')
+
+    @property
+    def feature_data(self):
+        """The features x attributes metadata about the features"""
+        return self._feature_data
+
+    @feature_data.setter
+    def feature_data(self, value):
+        self._feature_data = value
+        self.mark_changed('feature_data')
+
+    def mark_changed(self, *attributes):
+        """Note that these attributes changed, so the cached results which
+        depend on them are thrown out
+
+        Replacing :py:attr:`data` or :py:attr:`feature_data` calls this
+        automatically. Call it yourself after changing them in place, e.g.
+        ``metadata.data['outlier'] = False``.
+
+        Parameters
+        ----------
+        attributes : str
+            Names of the changed attributes, e.g. "data"
+        """
+        versions = self.__dict__.setdefault('_versions', {})
+        cache = self.__dict__.get('cache')
+        for attribute in attributes:
+            versions[attribute] = versions.get(attribute, 0) + 1
+            if isinstance(cache, LRUCache):
+                cache.invalidate((id(self), attribute))
+
+    @cached_property()
+    def networks(self):
+        """Network visualizations of this data"""
+        from ..visualize.network import NetworkerViz
+
+        return NetworkerViz(self)
 
     def _threshold(self, data, other=None):
         """Only take features with expression greater than the threshold,
@@ -219,21 +293,17 @@ class BaseData(object):
         """
         if other is None:
             other = data
-        filtered = data.ix[:, other[other > self.thresh].count() >=
-                              self.minimum_samples]
+        if isinstance(other, (SparseMatrix, ChunkedMatrix)):
+            n_greater = other.count_greater(self.thresh)
+        else:
+            n_greater = other[other > self.thresh].count()
+        filtered = data.ix[:, (n_greater >= self.minimum_samples).values]
         return filtered
 
     def _feature_renamer(self, x):
         """Rename a feature from a crazy ID like 'ENSG00000100320' to 'RBFOX2'
         """
-        if x in self.feature_renamer_series.index:
-            rename = self.feature_renamer_series[x]
-            if isinstance(rename, pd.Series):
-                return rename.values[0]
-            else:
-                return rename
-        else:
-            return x
+        return self._feature_names.rename(x)
 
     @staticmethod
     def _shortener(x, renamer=None, max_char_len=20):
@@ -265,30 +335,159 @@ class BaseData(object):
         else:
             return renamed
 
+    def _sample_rows(self, name, sample_ids):
+        """Rows of the data for a kind of sample, e.g. the pooled samples
+
+        The rows are found once, and reused until :py:attr:`data` changes
+        (it's replaced, e.g. by :py:meth:`.Study.drop_outliers`, or
+        :py:meth:`mark_changed` is called after changing it in place) or the
+        sample ids are replaced, so each access doesn't make a new copy of
+        the data. Samples which aren't in the data are skipped.
+
+        When the samples are all the rows, or consecutive rows, of a
+        DataFrame, this is :py:attr:`data` itself or a view of it rather
+        than a copy, so changing the rows in place changes :py:attr:`data`
+        too. Use ``.copy()`` on the rows before changing them.
+
+        Parameters
+        ----------
+        name : str
+            What kind of samples these are, e.g. "pooled"
+        sample_ids : pandas.Index
+            Which samples to take
+
+        Returns
+        -------
+        rows : pandas.DataFrame
+            The rows of the data for these samples, which may be a view of
+            the data
+        """
+        version = self._versions.get('data', 0)
+        try:
+            cached_version, ids, rows = self._sample_rows_cache[name]
+            if cached_version == version and ids is sample_ids:
+                return rows
+        except KeyError:
+            pass
+
+        positions = self.data.index.get_indexer(sample_ids)
+        positions = positions[positions >= 0]
+        n_rows = self.data.shape[0]
+        consecutive = len(positions) > 0 and (
+            np.diff(positions) == 1).all()
+
+        if not isinstance(self.data, pd.DataFrame):
+            rows = self.data.ix[self.data.index[positions]]
+        elif consecutive and len(positions) == n_rows:
+            rows = self.data
+        elif consecutive:
+            rows = self.data.iloc[positions[0]:positions[-1] + 1]
+        else:
+            rows = self.data.take(positions)
+        self._sample_rows_cache[name] = version, sample_ids, rows
+        return rows
+
+    def _stored_result(self, name, inputs, compute):
+        """Get the result of ``compute()`` from :py:attr:`result_store`, or
+        compute it and save it there, keyed on ``name`` and the contents of
+        ``inputs``"""
+        if self.result_store is None:
+            return compute()
+        return self.result_store.fetch(name, inputs, compute)
+
+    def stats(self):
+        """Memory used by this data, its cached results, and the time spent
+        in the main operations
+
+        Returns
+        -------
+        stats : dict
+            ``nbytes``, the estimated size in bytes of the data, and of each
+            copy of it kept for e.g. :py:attr:`data_original` and
+            :py:attr:`singles`. ``cache``, the name, size and hits of each
+            memoized result of this data (see :py:meth:`LRUCache.entries`).
+            ``timings``, the number of ``calls`` and total ``seconds`` of
+            e.g. :py:meth:`reduce` and :py:meth:`_subset`
+        """
+        def is_copy(other):
+            if other is self.data or other is None:
+                return False
+            if isinstance(other, pd.DataFrame) and \
+                    isinstance(self.data, pd.DataFrame):
+                # E.g. singles can be a view of consecutive rows of data
+                return not np.may_share_memory(other.values, self.data.values)
+            return True
+
+        sizes = {'data': nbytes(self.data)}
+        if is_copy(self.data_original):
+            sizes['data_original'] = nbytes(self.data_original)
+        if self.feature_data is not None:
+            sizes['feature_data'] = nbytes(self.feature_data)
+        version = self._versions.get('data', 0)
+        for name, (cached_version, ids, rows) in \
+                self._sample_rows_cache.items():
+            if cached_version == version and is_copy(rows):
+                sizes[name] = nbytes(rows)
+
+        return {'nbytes': sizes, 'cache': self.cache.entries(owner=self),
+                'timings': dict((name, dict(timing)) for name, timing
+                                in self.timings.items())}
+
     @property
     def singles(self):
         """Data from only the single cells"""
-        return self.data.ix[self.single_samples]
+        return self._sample_rows('singles', self.single_samples)
 
     @property
     def pooled(self):
         """Data from only the pooled samples"""
-        return self.data.ix[self.pooled_samples]
+        return self._sample_rows('pooled', self.pooled_samples)
 
     @property
     def outliers(self):
         """Data from only the outlier samples"""
-        return self.data.ix[self.outlier_samples]
+        return self._sample_rows('outliers', self.outlier_samples)
 
-    @property
+    @cached_property(depends_on=('data', 'feature_data'))
     def feature_renamer_series(self):
         """A pandas Series of the original feature ids to the renamed ids"""
         try:
             return self.feature_data[self.feature_rename_col].dropna()
-        except (TypeError, ValueError):
+        except (TypeError, ValueError, KeyError):
             return pd.Series(self.data.columns.values,
                              index=self.data.columns)
 
+    @cached_property(depends_on=('data', 'feature_data'))
+    def _feature_names(self):
+        """Forward and reverse indexes of feature ids and their names, built
+        once per data and feature_data"""
+        return FeatureNameIndex(self.feature_renamer_series,
+                                self.data.columns)
+
+    def rename_features(self, feature_ids, shorten=True):
+        """Rename many feature ids at once, like :py:meth:`.feature_renamer`
+
+        Parameters
+        ----------
+        feature_ids : list-like
+            Feature ids to rename, e.g. the columns of a subset of the data
+        shorten : bool, optional (default=True)
+            If True, shorten long names as :py:meth:`.feature_renamer` does
+
+        Returns
+        -------
+        renamed : pandas.Index
+            The name of each feature id, or the id itself if it has no name
+        """
+        if self.feature_data is not None and self.feature_rename_col is not \
+                None:
+            renamed = self._feature_names.rename_many(feature_ids)
+        else:
+            renamed = pd.Index(feature_ids)
+        if shorten:
+            renamed = pd.Index([self._shortener(x) for x in renamed])
+        return renamed
+
     def maybe_renamed_to_feature_id(self, feature_id):
         """To be able to give a simple gene name, e.g. "RBFOX2" and get the
         official ENSG ids or MISO ids
@@ -304,17 +503,27 @@ class BaseData(object):
         feature_id : str or list-like
             Valid Feature ID(s) that can be used to subset self.data
         """
-        if feature_id in self.feature_renamer_series.values:
-            feature_ids = self.feature_renamer_series[
-                self.feature_renamer_series ==
-                feature_id].index
-            return self.data.columns.intersection(feature_ids)
-        elif feature_id in self.data.columns:
-            return feature_id
-        else:
-            raise ValueError('{} is not a valid feature identifier (it may '
-                             'not have been measured in this dataset!)'
-                             .format(feature_id))
+        return self._feature_names.resolve(feature_id)
+
+    def resolve_feature_ids(self, names):
+        """Convert many gene names or feature ids to feature ids at once
+
+        Parameters
+        ----------
+        names : list-like
+            Common gene names, e.g. "RBFOX2", or feature ids in the data
+
+        Returns
+        -------
+        feature_ids : pandas.Index
+            Valid feature ids that can be used to subset self.data
+
+        Raises
+        ------
+        ValueError
+            If any of the names aren't gene names or measured feature ids
+        """
+        return self._feature_names.resolve_many(names)
 
     @property
     def _var_cut(self):
@@ -323,7 +532,7 @@ class BaseData(object):
         return self.data.var().dropna().mean() + 2 * self.data.var() \
             .dropna().std()
 
-    @property
+    @cached_property(depends_on=('data',))
     def variant(self):
         """Genes whose variance among all cells is 2 standard deviations away
         from the mean variance"""
@@ -354,14 +563,23 @@ class BaseData(object):
         outlier_data = data.ix[outliers]
         return data, outlier_data
 
-    @property
-    def feature_subsets(self):
-        """Dict of feature subset names to their list of feature ids"""
-        feature_subsets = subsets_from_metadata(
+    @cached_property(depends_on=('feature_data',))
+    def _feature_subset_index(self):
+        """Feature subsets from the columns of feature_data, built once per
+        feature_data"""
+        return SubsetIndex.from_metadata(
             self.feature_data, MINIMUM_FEATURE_SUBSET, 'features',
             ignore=self.feature_ignore_subset_cols)
-        feature_subsets['variant'] = self.variant
-        return feature_subsets
+
+    @cached_property(depends_on=('data', 'feature_data'))
+    def feature_subsets(self):
+        """Mapping of feature subset names to their list of feature ids
+
+        A :py:class:`SubsetIndex`, which also supports ``union``,
+        ``intersection`` and ``difference`` of subsets by name.
+        """
+        return self._feature_subset_index.with_subsets(
+            {'variant': self.variant})
 
     def feature_subset_to_feature_ids(self, feature_subset, rename=True):
         """Convert a feature subset name to a list of feature ids"""
@@ -377,8 +595,12 @@ class BaseData(object):
                     feature_ids = feature_subset
                     n_custom = self.feature_data.columns.map(
                         lambda x: x.startswith('custom')).sum()
-                    self.feature_data['custom_{}'.format(n_custom + 1)] = \
-                        self.feature_data.index.isin(feature_ids)
+                    # Copy rather than add the column in place, because the
+                    # feature data may be shared with other studies
+                    feature_data = self.feature_data.copy()
+                    feature_data['custom_{}'.format(n_custom + 1)] = \
+                        feature_data.index.isin(feature_ids)
+                    self.feature_data = feature_data
                 else:
                     raise ValueError(
                         "There are no {} features in this data: "
@@ -422,11 +644,129 @@ class BaseData(object):
     #     elif 'samples'.startswith(between):
     #         pass
     #
-    # def jsd(self):
-    #     """Jensen-Shannon divergence showing most varying measurements within a
-    #     celltype and between celltypes
-    #     """
-    #     raise NotImplementedError
+    def _values_to_bin(self, data):
+        """Values of the data to bin within phenotypes, and the bins to use
+
+        Each feature is scaled to [0, 1] across all the samples, so that its
+        distributions within different phenotypes are comparable
+        """
+        scaled = (data - data.min()) / (data.max() - data.min())
+        return scaled, np.arange(0, 1.1, .1)
+
+    @memoize(depends_on=('data',))
+    def binify_phenotypes(self, phenotype_groupby, sample_ids=None,
+                          feature_ids=None, phenotype_order=None):
+        """Bin each feature separately within the samples of each phenotype
+
+        All the phenotypes and features are binned at once, and the result is
+        reused by :py:meth:`.jsd` and :py:meth:`.entropy`.
+
+        Parameters
+        ----------
+        phenotype_groupby : pandas.Series or dict
+            Mapping of sample ids to their phenotype
+        sample_ids : list-like, optional (default=None)
+            Samples to use. If None, use all samples
+        feature_ids : list-like, optional (default=None)
+            Features to use. If None, use all features
+        phenotype_order : list-like, optional (default=None)
+            Order of the phenotypes. If None, sort them
+
+        Returns
+        -------
+        phenotypes : pandas.Index
+            The phenotypes, in order
+        binned : numpy.array
+            An (n_phenotypes, n_bins, n_features) array of the distribution
+            of each feature within each phenotype
+        feature_ids : pandas.Index
+            The features, in the order of the columns of the data
+        """
+        # Select with boolean masks rather than _subset, so the features keep
+        # the order of the data, and a single sample or feature is still a
+        # DataFrame
+        data = self.data
+        rows = np.ones(data.shape[0], dtype=bool) if sample_ids is None \
+            else data.index.isin(sample_ids)
+        columns = np.ones(data.shape[1], dtype=bool) if feature_ids is None \
+            else data.columns.isin(feature_ids)
+        data = data.ix[rows, columns]
+        if data.empty:
+            raise ValueError('This data subset is empty. Please double-check '
+                             'that the gene ids are for the correct species!')
+        if isinstance(data, (SparseMatrix, ChunkedMatrix)):
+            data = data.to_dense()
+        values, bins = self._values_to_bin(data)
+        phenotypes = pd.Series(phenotype_groupby).reindex(data.index)
+        if phenotype_order is None:
+            phenotype_order = sorted(phenotypes.dropna().unique())
+        phenotype_order = pd.Index(phenotype_order)
+        codes = phenotype_order.get_indexer(phenotypes.values)
+
+        binned = binify_groups(values.values, codes, len(phenotype_order),
+                               np.asarray(bins, dtype=float))
+        return phenotype_order, binned, data.columns
+
+    @timed
+    def jsd(self, phenotype_groupby, sample_ids=None, feature_ids=None,
+            phenotype_order=None):
+        """Jensen-Shannon divergence of each feature between each pair of
+        phenotypes
+
+        Features with a high divergence change the most between phenotypes.
+
+        Parameters
+        ----------
+        phenotype_groupby : pandas.Series or dict
+            Mapping of sample ids to their phenotype
+        sample_ids : list-like, optional (default=None)
+            Samples to use. If None, use all samples
+        feature_ids : list-like, optional (default=None)
+            Features to use. If None, use all features
+        phenotype_order : list-like, optional (default=None)
+            Order of the phenotypes. If None, sort them
+
+        Returns
+        -------
+        jsd : pandas.DataFrame
+            A (n_features, n_phenotype_pairs) DataFrame of the divergence of
+            each feature between each pair of phenotypes. The columns are a
+            ("phenotype1", "phenotype2") MultiIndex.
+        """
+        phenotypes, binned, feature_ids = self.binify_phenotypes(
+            phenotype_groupby, sample_ids, feature_ids, phenotype_order)
+        first, second = np.triu_indices(len(phenotypes), k=1)
+        jsd = jsd_arrays(binned[first], binned[second], axis=1)
+        columns = pd.MultiIndex.from_arrays(
+            [phenotypes[first], phenotypes[second]],
+            names=['phenotype1', 'phenotype2'])
+        return pd.DataFrame(jsd.T, index=feature_ids, columns=columns)
+
+    @timed
+    def entropy(self, phenotype_groupby, sample_ids=None, feature_ids=None,
+                phenotype_order=None):
+        """Entropy of the distribution of each feature within each phenotype
+
+        Parameters
+        ----------
+        phenotype_groupby : pandas.Series or dict
+            Mapping of sample ids to their phenotype
+        sample_ids : list-like, optional (default=None)
+            Samples to use. If None, use all samples
+        feature_ids : list-like, optional (default=None)
+            Features to use. If None, use all features
+        phenotype_order : list-like, optional (default=None)
+            Order of the phenotypes. If None, sort them
+
+        Returns
+        -------
+        entropy : pandas.DataFrame
+            A (n_features, n_phenotypes) DataFrame of entropies, in bits
+        """
+        phenotypes, binned, feature_ids = self.binify_phenotypes(
+            phenotype_groupby, sample_ids, feature_ids, phenotype_order)
+        return pd.DataFrame(entropy_arrays(binned, axis=1).T,
+                            index=feature_ids, columns=phenotypes)
 
     # TODO.md: Specify dtypes in docstring
     def plot_classifier(self, trait, sample_ids=None, feature_ids=None,
@@ -548,6 +888,8 @@ class BaseData(object):
         viz : :py:class:`.DecompositionViz`
             Object with plotted dimensionality reduction
         """
+        from ..visualize.decomposition import DecompositionViz
+
         reduce_kwargs = {} if reduce_kwargs is None else reduce_kwargs
 
         reduced = self.reduce(sample_ids, feature_ids,
@@ -574,11 +916,14 @@ class BaseData(object):
 
     def plot_pca(self, **kwargs):
         """Call ``plot_dimensionality_reduction`` with PCA specifically"""
+        from ..compute.decomposition import DataFramePCA
+
         return self.plot_dimensionality_reduction(reducer=DataFramePCA,
                                                   **kwargs)
 
+    @timed
     def _subset(self, data, sample_ids=None, feature_ids=None,
-                require_min_samples=True):
+                require_min_samples=True, dense=True):
         """Smartly subset the data given sample and feature ids
 
         Take only a subset of the data, and require at least the minimum
@@ -594,6 +939,10 @@ class BaseData(object):
             Which features to use. If None, use all.
         require_min_samples : bool, optional (default=True)
             If True, then require `minimum_samples` for each feature
+        dense : bool, optional (default=True)
+            If ``data`` is a :py:class:`.SparseMatrix` or
+            :py:class:`.ChunkedMatrix`, return the subset as a (dense)
+            DataFrame. If False, return it in the same format as ``data``
 
         Returns
         -------
@@ -617,15 +966,20 @@ class BaseData(object):
         else:
             single_feature = False
 
-        subset = data.ix[sample_ids]
-        subset = subset.T.ix[feature_ids].T
+        # Gather rows and columns at once, rather than copying the rows and
+        # then copying again to get the columns
+        subset = data.ix[sample_ids, feature_ids]
 
         if require_min_samples and not single_feature:
-            subset = subset.ix[:, subset.count() >= self.minimum_samples]
+            enough_samples = subset.count() >= self.minimum_samples
+            if not np.all(enough_samples):
+                subset = subset.ix[:, enough_samples]
 
         if subset.empty:
             raise ValueError('This data subset is empty. Please double-check '
                              'that the gene ids are for the correct species!')
+        if dense and isinstance(subset, (SparseMatrix, ChunkedMatrix)):
+            subset = subset.to_dense()
         return subset
 
     def _subset_singles_and_pooled(self, sample_ids=None,
@@ -675,6 +1029,7 @@ class BaseData(object):
 
         return singles, pooled
 
+    @timed
     def _subset_and_standardize(self, data, sample_ids=None,
                                 feature_ids=None,
                                 standardize=True, return_means=False,
@@ -715,14 +1070,18 @@ class BaseData(object):
         # fill na with mean for each event
         subset = self._subset(data, sample_ids, feature_ids)
         means = subset.mean()
-        subset = subset.fillna(means).fillna(0)
+        # Features with no observations at all have a NA mean, so fill with 0
+        subset = subset.fillna(means.fillna(0))
 
         if rename:
-            means = means.rename_axis(self.feature_renamer)
-            subset = subset.rename_axis(self.feature_renamer, 1)
+            renamed = self.rename_features(subset.columns)
+            means.index = renamed
+            subset.columns = renamed
 
         # whiten, mean-center
         if standardize:
+            from sklearn.preprocessing import StandardScaler
+
             data = StandardScaler().fit_transform(subset)
         else:
             data = subset
@@ -784,13 +1143,21 @@ class BaseData(object):
                               standardize, reducer_kwargs,
                               bins)
 
-        outlier_detector = OutlierDetection(reducer.reduced_space,
-                                            method=outlier_detection_method,
-                                            **outlier_detection_method_kwargs)
+        from ..compute.outlier import OutlierDetection
+
+        outlier_detector = self._stored_result(
+            'detect_outliers',
+            (reducer.reduced_space, outlier_detection_method,
+             outlier_detection_method_kwargs),
+            lambda: OutlierDetection(reducer.reduced_space,
+                                     method=outlier_detection_method,
+                                     **outlier_detection_method_kwargs))
 
         return reducer, outlier_detector
 
     def plot_outliers(self, reducer, outlier_detector, **pca_args):
+        from ..visualize.decomposition import DecompositionViz
+
         show_point_labels = pca_args['show_point_labels']
         del pca_args['show_point_labels']
         dv = DecompositionViz(reducer.reduced_space,
@@ -820,6 +1187,7 @@ class BaseData(object):
         #dv(show_point_labels=show_point_labels, title=outlier_detector.title)
 
     # @memoize
+    @timed
     def reduce(self, sample_ids=None, feature_ids=None,
                featurewise=False,
                reducer=None,
@@ -854,6 +1222,9 @@ class BaseData(object):
         reducer_object : flotilla.compute.reduce.ReducerViz
             A ready-to-plot object containing the reduced space
         """
+        from ..compute.decomposition import DataFramePCA, SparseMatrixPCA, \
+            ChunkedMatrixPCA
+
         if reducer is None:
             reducer = DataFramePCA
 
@@ -862,6 +1233,40 @@ class BaseData(object):
 
         reducer_kwargs = {} if reducer_kwargs is None else reducer_kwargs
 
+        if isinstance(self.data, SparseMatrix) and reducer is DataFramePCA \
+                and bins is None:
+            # Center and scale implicitly, so the data stays sparse
+            subset = self._subset(self.data, sample_ids, feature_ids,
+                                  dense=False)
+            means = subset.mean()
+            subset = subset.fillna(means.fillna(0))
+            if featurewise:
+                subset = subset.T
+
+            def compute():
+                reducer_object = SparseMatrixPCA(
+                    subset, standardize=standardize, **reducer_kwargs)
+                reducer_object.means = means
+                return reducer_object
+
+            return self._stored_result(
+                'reduce', (subset, SparseMatrixPCA, standardize,
+                           reducer_kwargs), compute)
+
+        if isinstance(self.data, ChunkedMatrix) and reducer is DataFramePCA \
+                and bins is None and not featurewise:
+            # Stream through the samples one block at a time. (Featurewise
+            # reductions need every sample of a feature at once, so they
+            # read the subset into memory below)
+            subset = self._subset(self.data, sample_ids, feature_ids,
+                                  dense=False)
+            means = subset.mean()
+            subset = subset.fillna(means.fillna(0))
+            reducer_object = ChunkedMatrixPCA(subset, standardize=standardize,
+                                              **reducer_kwargs)
+            reducer_object.means = means
+            return reducer_object
+
         subset, means = self._subset_and_standardize(self.data,
                                                      sample_ids, feature_ids,
                                                      standardize,
@@ -873,10 +1278,15 @@ class BaseData(object):
         if featurewise:
             subset = subset.T
 
-        reducer_object = reducer(subset, **reducer_kwargs)
-        reducer_object.means = means
-        return reducer_object
+        def compute():
+            reducer_object = reducer(subset, **reducer_kwargs)
+            reducer_object.means = means
+            return reducer_object
 
+        return self._stored_result(
+            'reduce', (subset, means, reducer, reducer_kwargs), compute)
+
+    @timed
     def classify(self, trait, sample_ids, feature_ids,
                  standardize=True,
                  data_name='expression',
@@ -907,8 +1317,8 @@ class BaseData(object):
             mean-center and make unit-variance all the data via sklearn
             .preprocessing.StandardScaler
         predictor : flotilla.visualize.predict classifier
-            Must inherit from flotilla.visualize.PredictorBaseViz. Default is
-            flotilla.visualize.predict.ClassifierViz
+            Must inherit from flotilla.visualize.predict.PredictorBaseViz.
+            Default is flotilla.visualize.predict.ClassifierViz
         predictor_kwargs : dict or None
             Additional 'keyword arguments' to supply to the predictor class
         predictor_scoring_fun : function
@@ -925,6 +1335,8 @@ class BaseData(object):
         predictor : flotilla.compute.predict.PredictorBaseViz
             A ready-to-plot object containing the predictions
         """
+        from ..visualize.predict import ClassifierViz
+
         subset = self._subset_and_standardize(self.data, sample_ids,
                                               feature_ids, standardize)
         # subset.rename_axis(self.feature_renamer, 1, inplace=True)
@@ -944,6 +1356,19 @@ class BaseData(object):
             feature_renamer=self.feature_renamer,
             singles=self.singles, pooled=self.pooled, outliers=self.outliers,
             **plotting_kwargs)
+
+        if self.result_store is not None and not classifier.has_been_fit:
+            # Fit now, so the fitted predictor can be saved
+            def fit():
+                classifier.fit()
+                return classifier.predictor
+
+            fitted = self._stored_result(
+                'classify', (subset, trait, predictor_name, predictor_obj,
+                             predictor_scoring_fun, score_cutoff_fun,
+                             n_features_dependent_kwargs, constant_kwargs),
+                fit)
+            classifier.predictor = fitted
         return classifier
 
     def _calculate_linkage(self, data, sample_ids, feature_ids,
@@ -958,6 +1383,7 @@ class BaseData(object):
                                                   linkage_method)
         return subset, row_linkage, col_linkage
 
+    @timed
     def binify(self, data, bins=None):
         return binify(data, bins).dropna(how='all', axis=0).dropna(how='all',
                                                                    axis=1)
@@ -969,6 +1395,8 @@ class BaseData(object):
                     label_pooled=False):
         """For compatiblity across data types, can specify _violinplot
         """
+        from ..visualize.generic import violinplot
+
         singles, pooled = self._subset_singles_and_pooled(sample_ids,
                                                           feature_ids=[
                                                               feature_id])
@@ -993,12 +1421,14 @@ class BaseData(object):
                    title=title, data_type=self.data_type, ax=ax,
                    label_pooled=label_pooled, outliers=outliers)
 
-    @cached_property()
+    @cached_property(depends_on=('data',))
     def nmf(self):
+        from ..compute.decomposition import DataFrameNMF
+
         data = self._subset(self.data)
         return DataFrameNMF(self.binify(data).T, n_components=2)
 
-    @memoize
+    @memoize(depends_on=('data',))
     def binned_nmf_reduced(self, sample_ids=None, feature_ids=None):
         data = self._subset(self.data, sample_ids, feature_ids,
                             require_min_samples=False)
@@ -1015,6 +1445,9 @@ class BaseData(object):
         """
         Plot the violinplot of a splicing event (should also show NMF movement)
         """
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         feature_ids = self.maybe_renamed_to_feature_id(feature_id)
 
         if not isinstance(feature_ids, pd.Index):
@@ -1059,6 +1492,8 @@ class BaseData(object):
                                    phenotype_to_color,
                                    phenotype_to_marker, order, ax=None,
                                    xlabel=None, ylabel=None):
+        from ..visualize.generic import nmf_space_transitions
+
         nmf_space_positions = self.nmf_space_positions(groupby)
 
         nmf_space_transitions(nmf_space_positions, feature_id,
@@ -1129,6 +1564,8 @@ class BaseData(object):
         seaborn.jointplot
 
         """
+        from ..visualize.generic import simple_twoway_scatter
+
         x = self.data.ix[sample1]
         y = self.data.ix[sample2]
         return simple_twoway_scatter(x, y, **kwargs)
@@ -1153,33 +1590,13 @@ def subsets_from_metadata(metadata, minimum, subset_type, ignore=None):
     -------
     subsets : dict
         A name: row_ids mapping of which samples correspond to which group
+
+    See Also
+    --------
+    SubsetIndex.from_metadata
+        The same subsets as a sparse membership index, without building
+        every subset and its complement up front
     """
-    subsets = {}
-    ignore = () if ignore is None else ignore
-    if metadata is not None:
-        for col in metadata:
-            if col in ignore:
-                continue
-            if metadata[col].dtype == bool:
-                sample_subset = metadata.index[metadata[col]]
-                subsets[col] = sample_subset
-            else:
-                grouped = metadata.groupby(col)
-                sizes = grouped.size()
-                filtered_sizes = sizes[sizes >= minimum]
-                for group in filtered_sizes.keys():
-                    if isinstance(group, bool):
-                        continue
-                    name = '{}: {}'.format(col, group)
-                    subsets[name] = grouped.groups[group]
-        for sample_subset in subsets.keys():
-            name = 'not ({})'.format(sample_subset)
-            if 'False' in name or 'True' in name:
-                continue
-            if name not in subsets:
-                in_features = metadata.index.isin(subsets[
-                    sample_subset])
-                subsets[name] = metadata.index[~in_features]
-        subsets['all {}'.format(subset_type)] = metadata.index
-    return subsets
+    return dict(SubsetIndex.from_metadata(metadata, minimum, subset_type,
+                                          ignore=ignore).iteritems())
 
@@ -7,6 +7,8 @@ import sys
 import numpy as np
 
 from .base import BaseData
+from ..compute.chunked import ChunkedMatrix
+from ..compute.sparse import SparseMatrix
 from ..util import memoize, timestamp
 
 EXPRESSION_THRESH = -np.inf
@@ -18,12 +20,37 @@ class ExpressionData(BaseData):
                  feature_rename_col=None, feature_ignore_subset_cols=None,
                  outliers=None, log_base=None,
                  pooled=None, plus_one=False, minimum_samples=0,
-                 technical_outliers=None, predictor_config_manager=None):
+                 technical_outliers=None, predictor_config_manager=None,
+                 cache=None, sparse=False, result_store=None):
         """Object for holding and operating on expression data
 
-
+        Parameters
+        ----------
+        sparse : bool, optional (default=False)
+            If True, keep the data as a
+            :py:class:`flotilla.compute.sparse.SparseMatrix` of only the
+            nonzero values, which uses much less memory for single-cell data
+            which is mostly zeros. Thresholding, per-feature statistics,
+            subsetting and PCA work without making the whole matrix dense;
+            other computations make only the subset they use dense. Can't be
+            used with only one of ``plus_one`` and ``log_base``, as that
+            would fill in the zeros.
+
+        Notes
+        -----
+        ``data`` can also be a
+        :py:class:`flotilla.compute.chunked.ChunkedMatrix` of data which is
+        too big to fit in memory.
         """
         sys.stdout.write("{}\tInitializing expression\n".format(timestamp()))
+        if sparse:
+            if plus_one != (log_base is not None):
+                raise ValueError('Sparse expression data can only be '
+                                 'transformed with both plus_one and '
+                                 'log_base (which keeps zeros as zeros), or '
+                                 'neither')
+            if not isinstance(data, SparseMatrix):
+                data = SparseMatrix.from_dataframe(data)
         super(ExpressionData, self).__init__(
             data, feature_data=feature_data,
             feature_rename_col=feature_rename_col,
@@ -31,18 +58,36 @@ class ExpressionData(BaseData):
             thresh=thresh,
             outliers=outliers, pooled=pooled, minimum_samples=minimum_samples,
             predictor_config_manager=predictor_config_manager,
-            technical_outliers=technical_outliers, data_type='expression')
-
-        if plus_one:
-            self.data += 1
-            self.thresh += 1
-        # self.original_data = self.data
-        # import pdb; pdb.set_trace()
-        # self.data = self._threshold(data, thresh)
-        self.log_base = log_base
+            technical_outliers=technical_outliers, data_type='expression',
+            cache=cache, result_store=result_store)
 
-        if self.log_base is not None:
-            self.data = np.log(self.data) / np.log(self.log_base)
+        self.log_base = log_base
+        if sparse:
+            if plus_one:
+                # log(x + 1) only changes the nonzero values
+                log_base = np.log(self.log_base)
+                self.data = self.data.transform_values(
+                    lambda x: np.log1p(x) / log_base)
+                self.thresh += 1
+        elif isinstance(self.data, ChunkedMatrix):
+            # Transform each block as it's read from disk
+            if plus_one:
+                self.data = self.data.transform_values(lambda x: x + 1)
+                self.thresh += 1
+            if self.log_base is not None:
+                log_base = np.log(self.log_base)
+                self.data = self.data.transform_values(
+                    lambda x: np.log(x) / log_base)
+        else:
+            if plus_one:
+                self.data += 1
+                self.thresh += 1
+            # self.original_data = self.data
+            # import pdb; pdb.set_trace()
+            # self.data = self._threshold(data, thresh)
+
+            if self.log_base is not None:
+                self.data = np.log(self.data) / np.log(self.log_base)
 
         self.feature_data = feature_data
 
@@ -87,7 +132,7 @@ class SpikeInData(ExpressionData):
 
     def __init__(self, data, feature_data=None,
                  predictor_config_manager=None,
-                 technical_outliers=None):
+                 technical_outliers=None, cache=None):
         """Constructor for
 
         Parameters
@@ -104,7 +149,8 @@ class SpikeInData(ExpressionData):
         """
         super(SpikeInData, self).__init__(data, feature_data,
                                           technical_outliers=technical_outliers,
-                                          predictor_config_manager=predictor_config_manager)
+                                          predictor_config_manager=predictor_config_manager,
+                                          cache=cache)
 
 
         # def spikeins_violinplot(self):
@@ -0,0 +1,130 @@
+"""
+Hash indexes between feature ids and their human-readable names, e.g.
+"ENSG00000100320" and "RBFOX2"
+"""
+import pandas as pd
+
+
+class FeatureNameIndex(object):
+    """Forward (feature id -> name) and reverse (name -> feature ids) lookups
+
+    Both directions are dicts built once, so renaming or resolving a feature
+    is a hash lookup rather than a scan of all the features.
+
+    Parameters
+    ----------
+    renames : pandas.Series
+        The name of each feature id, without missing values. If a feature id
+        appears more than once, its first name is used.
+    feature_ids : list-like
+        Feature ids which were measured, e.g. the columns of the data. Only
+        these are returned when resolving names to feature ids.
+    """
+
+    def __init__(self, renames, feature_ids):
+        first = renames[~renames.index.duplicated()]
+        self.forward = first
+        self._forward = dict(zip(first.index, first.values))
+
+        measured = renames.index.isin(feature_ids)
+        reverse = {}
+        for feature_id, name, is_measured in zip(renames.index,
+                                                 renames.values, measured):
+            ids = reverse.setdefault(name, [])
+            if is_measured and feature_id not in ids:
+                ids.append(feature_id)
+        self._reverse = dict((name, pd.Index(ids))
+                             for name, ids in reverse.iteritems())
+        self._feature_ids = set(feature_ids)
+
+    def rename(self, feature_id):
+        """Name of a feature id, or the id itself if it has no name"""
+        return self._forward.get(feature_id, feature_id)
+
+    def rename_many(self, feature_ids):
+        """Names of many feature ids at once
+
+        Parameters
+        ----------
+        feature_ids : list-like
+            Feature ids to rename
+
+        Returns
+        -------
+        renamed : pandas.Index
+            The name of each feature id, or the id itself if it has no name
+        """
+        feature_ids = pd.Index(feature_ids)
+        renamed = self.forward.reindex(feature_ids)
+        missing = renamed.isnull().values
+        renamed = renamed.values.astype(object)
+        renamed[missing] = feature_ids.values[missing]
+        return pd.Index(renamed)
+
+    def resolve(self, name):
+        """Measured feature ids for a name or feature id
+
+        Parameters
+        ----------
+        name : str
+            Either a name, e.g. "RBFOX2", or a measured feature id
+
+        Returns
+        -------
+        feature_id : pandas.Index or str
+            All measured feature ids with this name, or the feature id
+            itself
+
+        Raises
+        ------
+        ValueError
+            If this is neither a name nor a measured feature id
+        """
+        if name in self._reverse:
+            return self._reverse[name]
+        elif name in self._feature_ids:
+            return name
+        else:
+            raise ValueError('{} is not a valid feature identifier (it may '
+                             'not have been measured in this dataset!)'
+                             .format(name))
+
+    def resolve_many(self, names):
+        """Measured feature ids for many names or feature ids at once
+
+        Parameters
+        ----------
+        names : list-like
+            Names, e.g. "RBFOX2", or measured feature ids
+
+        Returns
+        -------
+        feature_ids : pandas.Index
+            All measured feature ids for all of the names, in the order of
+            the names
+
+        Raises
+        ------
+        ValueError
+            If any of the names are neither a name nor a measured feature id
+        """
+        feature_ids = []
+        seen = set()
+        invalid = []
+        for name in names:
+            if name in self._reverse:
+                ids = self._reverse[name]
+            elif name in self._feature_ids:
+                ids = [name]
+            else:
+                invalid.append(name)
+                continue
+            for feature_id in ids:
+                if feature_id not in seen:
+                    seen.add(feature_id)
+                    feature_ids.append(feature_id)
+        if invalid:
+            raise ValueError('These are not valid feature identifiers (they '
+                             'may not have been measured in this dataset!): '
+                             '{}'.format(', '.join(map(str, invalid))))
+        return pd.Index(feature_ids)
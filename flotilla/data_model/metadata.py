@@ -1,16 +1,27 @@
+import itertools
 import sys
 
 import matplotlib as mpl
-import seaborn as sns
+import matplotlib.colors
+import matplotlib.markers
+import numpy as np
+import pandas as pd
 
-from .base import BaseData, subsets_from_metadata
-from ..visualize.color import str_to_color
+from .base import BaseData
+from .subsets import SubsetIndex
+from ..util import cached_property
+from ..visualize.color import dark2, grey, str_to_color
 
 
 POOLED_COL = 'pooled'
 PHENOTYPE_COL = 'phenotype'
 MINIMUM_SAMPLE_SUBSET = 10
 
+# Color and marker of samples whose phenotype isn't in the phenotype order,
+# e.g. because it's missing
+UNKNOWN_PHENOTYPE_COLOR = grey
+UNKNOWN_PHENOTYPE_MARKER = 'o'
+
 # Any informational data goes here
 
 class MetaData(BaseData):
@@ -18,10 +29,10 @@ class MetaData(BaseData):
                  phenotype_to_marker=None,
                  phenotype_col=PHENOTYPE_COL,
                  pooled_col=POOLED_COL,
-                 predictor_config_manager=None):
+                 predictor_config_manager=None, cache=None):
         super(MetaData, self).__init__(data, outliers=None,
                                        predictor_config_manager=predictor_config_manager,
-                                       data_type='metadata')
+                                       data_type='metadata', cache=cache)
 
         self.phenotype_col = phenotype_col if phenotype_col is not None else \
             self._default_phenotype_col
@@ -47,8 +58,7 @@ class MetaData(BaseData):
 
         # Convert color strings to non-default matplotlib colors
         if self.phenotype_to_color is not None:
-            colors = iter(
-                sns.color_palette('Dark2', n_colors=self.n_phenotypes))
+            colors = itertools.cycle(dark2)
             for phenotype in self.unique_phenotypes:
                 try:
                     color = self.phenotype_to_color[phenotype]
@@ -56,7 +66,7 @@ class MetaData(BaseData):
                     sys.stderr.write(
                         'No color was assigned to the phenotype {}, '
                         'assigning a random color'.format(phenotype))
-                    color = mpl.colors.rgb2hex(colors.next())
+                    color = colors.next()
                 try:
                     color = str_to_color[color]
                 except KeyError:
@@ -66,9 +76,9 @@ class MetaData(BaseData):
             sys.stderr.write('No phenotype to color mapping was provided, '
                              'so coming up with reasonable defaults\n')
             self.phenotype_to_color = {}
-            colors = sns.color_palette('Dark2', n_colors=self.n_phenotypes)
+            colors = itertools.cycle(dark2)
             for phenotype, color in zip(self.unique_phenotypes, colors):
-                self.phenotype_to_color[phenotype] = mpl.colors.rgb2hex(color)
+                self.phenotype_to_color[phenotype] = color
         # Double-make sure that all incoming colors are stored as strings and
         # not lists
         for phenotype in self.phenotype_to_color:
@@ -101,6 +111,106 @@ class MetaData(BaseData):
             self.phenotype_to_marker = dict.fromkeys(
                 self.sample_id_to_phenotype.unique(), 'o')
 
+        self.encode_phenotypes()
+
+    def encode_phenotypes(self):
+        """Integer-code each sample's phenotype, and build the lookup arrays
+        of phenotype colors and markers
+
+        Afterwards, the phenotype, color or marker of any number of samples
+        is found by indexing arrays, rather than looking up each sample in a
+        dict. This is redone automatically after the data changes (see
+        :py:meth:`mark_changed`). Call this again if the phenotype column,
+        phenotype order, or phenotype colors or markers are changed.
+
+        Samples whose phenotype isn't in the phenotype order get the code -1,
+        and the ``UNKNOWN_PHENOTYPE_COLOR`` and ``UNKNOWN_PHENOTYPE_MARKER``.
+        """
+        getattr(self, '_cache', {}).pop('_phenotype_encoding', None)
+        return self._phenotype_encoding
+
+    @cached_property(depends_on=('data',))
+    def _phenotype_encoding(self):
+        phenotypes = self.sample_id_to_phenotype
+        categories = pd.Index(self.phenotype_order)
+        codes = categories.get_indexer(phenotypes.values)
+        # The unknown color and marker go last, so a code of -1 gets them
+        colors = np.array(
+            [self.phenotype_to_color[p] for p in categories]
+            + [UNKNOWN_PHENOTYPE_COLOR], dtype=object)
+        markers = np.array(
+            [self.phenotype_to_marker.get(p, 'o') for p in categories]
+            + [UNKNOWN_PHENOTYPE_MARKER], dtype=object)
+        return {'categories': categories, 'codes': codes, 'colors': colors,
+                'markers': markers,
+                'sample_id_to_color': pd.Series(colors[codes],
+                                                index=self.data.index)}
+
+    @property
+    def phenotype_categories(self):
+        """The phenotypes, in the order of their integer codes"""
+        return self._phenotype_encoding['categories']
+
+    @property
+    def phenotype_codes(self):
+        """Integer code of each sample's phenotype, or -1 if it isn't in
+        ``phenotype_categories``"""
+        return self._phenotype_encoding['codes']
+
+    @property
+    def phenotype_colors(self):
+        """Array of the color of each phenotype in ``phenotype_categories``"""
+        return self._phenotype_encoding['colors'][:-1]
+
+    @property
+    def phenotype_markers(self):
+        """Array of the marker of each phenotype in ``phenotype_categories``
+        """
+        return self._phenotype_encoding['markers'][:-1]
+
+    def _sample_positions(self, sample_ids):
+        """Positions of sample ids in the metadata, which must all exist"""
+        if sample_ids is None:
+            return slice(None)
+        positions = self.data.index.get_indexer(sample_ids)
+        if (positions < 0).any():
+            raise KeyError('Samples not in the metadata: {}'.format(
+                list(np.asarray(sample_ids)[positions < 0])))
+        return positions
+
+    def sample_phenotype_codes(self, sample_ids=None):
+        """Integer code of the phenotype of each sample, i.e. its position
+        in ``phenotype_categories``"""
+        return self.phenotype_codes[self._sample_positions(sample_ids)]
+
+    def sample_colors(self, sample_ids=None):
+        """Array of the phenotype color of each sample"""
+        return self._phenotype_encoding['colors'][
+            self.sample_phenotype_codes(sample_ids)]
+
+    def sample_markers(self, sample_ids=None):
+        """Array of the phenotype marker of each sample"""
+        return self._phenotype_encoding['markers'][
+            self.sample_phenotype_codes(sample_ids)]
+
+    def _flag(self, col):
+        try:
+            return self.data[col].values.astype(bool)
+        except (KeyError, TypeError, ValueError):
+            return np.zeros(self.data.shape[0], dtype=bool)
+
+    @property
+    def is_pooled(self):
+        """Boolean array of whether each sample is pooled. All False if there
+        is no pooled column"""
+        return self._flag(self.pooled_col)
+
+    @property
+    def is_outlier(self):
+        """Boolean array of whether each sample is an outlier. All False if
+        there is no "outlier" column"""
+        return self._flag('outlier')
+
     @property
     def n_phenotypes(self):
         return len(self.unique_phenotypes)
@@ -122,7 +232,7 @@ class MetaData(BaseData):
 
     @property
     def phenotype_color_order(self):
-        return [self.phenotype_to_color[p] for p in self.phenotype_order]
+        return list(self.phenotype_colors)
 
     @property
     def sample_id_to_phenotype(self):
@@ -130,17 +240,23 @@ class MetaData(BaseData):
 
     @property
     def sample_id_to_color(self):
-        return dict((sample_id, self.phenotype_to_color[p])
-                    for sample_id, p in self.sample_id_to_phenotype.iteritems())
+        """Series of each sample's phenotype color, built once from the
+        integer phenotype codes"""
+        return self._phenotype_encoding['sample_id_to_color']
 
     @property
     def phenotype_transitions(self):
         return zip(self.phenotype_order[:-1], self.phenotype_order[1:])
 
-    @property
+    @cached_property(depends_on=('data',))
     def sample_subsets(self):
-        return subsets_from_metadata(self.data, MINIMUM_SAMPLE_SUBSET,
-                                     'samples')
+        """Mapping of sample subset names to their sample ids
+
+        A :py:class:`SubsetIndex`, built once per metadata, whose ``query``
+        method evaluates expressions like "phenotype: neuron & ~outlier"
+        """
+        return SubsetIndex.from_metadata(self.data, MINIMUM_SAMPLE_SUBSET,
+                                         'samples')
 
     def merge_boolean_columns(self, columns):
         """Merge boolean columns in data and return logical OR
@@ -182,4 +298,5 @@ class MetaData(BaseData):
             columns)
         print "there are {} outliers".format(is_ever_an_outlier.sum())
         self.data['outlier'] = is_ever_an_outlier
+        self.mark_changed('data')
         return is_ever_an_outlier
\ No newline at end of file
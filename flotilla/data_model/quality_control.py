@@ -17,7 +17,7 @@ class MappingStatsData(BaseData):
     """
 
     def __init__(self, data, number_mapped_col, min_reads=MIN_READS,
-                 predictor_config_manager=None):
+                 predictor_config_manager=None, cache=None):
         """Constructor for MappingStatsData
 
         Parameters
@@ -33,7 +33,8 @@ class MappingStatsData(BaseData):
 
         """
         super(MappingStatsData, self).__init__(data,
-                                               predictor_config_manager=predictor_config_manager)
+                                               predictor_config_manager=predictor_config_manager,
+                                               cache=cache)
         self.number_mapped_col = number_mapped_col
         self.min_reads = min_reads
 
@@ -1,24 +1,21 @@
-import collections
 import sys
 import itertools
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 from .base import BaseData
-from ..compute.splicing import Modalities
+from ..compute.splicing import Modalities, SharedEventCounter
 from ..visualize.color import purples
-from ..visualize.splicing import ModalitiesViz
-from ..util import memoize, timestamp
+from ..util import cached_property, memoize, timed, timestamp
 from ..visualize.color import red
-from ..visualize.splicing import lavalamp, hist_single_vs_pooled_diff, \
-    lavalamp_pooled_inconsistent
 
 
 FRACTION_DIFF_THRESH = 0.1
 
+# Rows of a tall MISO summary file to read at a time
+DOWNSAMPLED_CHUNKSIZE = 10 ** 6
+
 
 class SplicingData(BaseData):
     binned_reducer = None
@@ -34,7 +31,8 @@ class SplicingData(BaseData):
                  feature_ignore_subset_cols=None,
                  excluded_max=0.2, included_min=0.8,
                  pooled=None, predictor_config_manager=None,
-                 technical_outliers=None, minimum_samples=0):
+                 technical_outliers=None, minimum_samples=0, cache=None,
+                 result_store=None):
         """Instantiate a object for percent spliced in (PSI) scores
 
         Parameters
@@ -64,16 +62,23 @@ class SplicingData(BaseData):
             outliers=outliers, pooled=pooled,
             technical_outliers=technical_outliers,
             predictor_config_manager=predictor_config_manager,
-            minimum_samples=minimum_samples, data_type='splicing')
+            minimum_samples=minimum_samples, data_type='splicing',
+            cache=cache, result_store=result_store)
         sys.stdout.write("{}\tDone initializing splicing\n".format(timestamp()))
         self.binsize = binsize
         self.bins = np.arange(0, 1 + self.binsize, self.binsize)
 
         self.modalities_calculator = Modalities(excluded_max=excluded_max,
                                                 included_min=included_min)
-        self.modalities_visualizer = ModalitiesViz()
 
-    @memoize
+    @cached_property()
+    def modalities_visualizer(self):
+        from ..visualize.splicing import ModalitiesViz
+
+        return ModalitiesViz()
+
+    @timed
+    @memoize(depends_on=('data',))
     def modalities(self, sample_ids=None, feature_ids=None,
                    bootstrapped=False, bootstrapped_kws=None):
         """Assigned modalities for these samples and features.
@@ -97,10 +102,13 @@ class SplicingData(BaseData):
             The modality assignments of each feature given these samples
         """
         data = self._subset(self.data, sample_ids, feature_ids)
-        return self.modalities_calculator.fit_transform(data, bootstrapped,
-                                                        bootstrapped_kws)
+        return self._stored_result(
+            'modalities', (data, self.modalities_calculator.bins,
+                           bootstrapped, bootstrapped_kws),
+            lambda: self.modalities_calculator.fit_transform(
+                data, bootstrapped, bootstrapped_kws))
 
-    @memoize
+    @memoize(depends_on=('data',))
     def modalities_counts(self, sample_ids=None, feature_ids=None,
                           bootstrapped=False, bootstrapped_kws=False):
         """Count the number of each modalities of these samples and features
@@ -132,6 +140,10 @@ class SplicingData(BaseData):
     def binify(self, data):
         return super(SplicingData, self).binify(data, self.bins)
 
+    def _values_to_bin(self, data):
+        """Percent spliced-in is already from 0 to 1, so use it as is"""
+        return data, self.bins
+
 
     def plot_modalities_reduced(self, sample_ids=None, feature_ids=None,
                                 ax=None, title=None,
@@ -241,6 +253,8 @@ class SplicingData(BaseData):
         from matplotlib.gridspec import GridSpec, GridSpecFromSubplotSpec
         import matplotlib.pyplot as plt
 
+        from ..visualize.splicing import lavalamp
+
         gs_x = len(modalities_names)
         gs_y = 15
 
@@ -381,6 +395,8 @@ class SplicingData(BaseData):
     def plot_lavalamp_pooled_inconsistent(
             self, sample_ids, feature_ids=None,
             fraction_diff_thresh=FRACTION_DIFF_THRESH, color=None):
+        from ..visualize.splicing import lavalamp_pooled_inconsistent
+
         singles, pooled, not_measured_in_pooled, pooled_inconsistent = \
             self.pooled_inconsistent(sample_ids, feature_ids,
                                      fraction_diff_thresh)
@@ -397,6 +413,8 @@ class SplicingData(BaseData):
                                         feature_ids=None,
                                         color=None, title='',
                                         hist_kws=None):
+        from ..visualize.splicing import hist_single_vs_pooled_diff
+
         singles, pooled, not_measured_in_pooled, diff_from_singles = \
             self._diff_from_singles(sample_ids, feature_ids)
         singles, pooled, not_measured_in_pooled, diff_from_singles_scaled = \
@@ -497,7 +515,7 @@ class DownsampledSplicingData(BaseData):
     _binsize = 0.1
     _var_cut = 0.2
 
-    def __init__(self, df, sample_descriptors):
+    def __init__(self, df, sample_descriptors, shared_events=None):
         """Instantiate an object of downsampled splicing data
 
         Parameters
@@ -508,22 +526,69 @@ class DownsampledSplicingData(BaseData):
             'probability', 'iteration.' Where "probability" indicates the
             randomly sampling probability from the bam file used to generate
             these reads, and "iteration" indicates the integer iteration
-            performed, e.g. if multiple resamplings were performed.
+            performed, e.g. if multiple resamplings were performed. Can be
+            None if ``shared_events`` is given.
         experiment_design_data: pandas.DataFrame
+        shared_events : pandas.DataFrame, optional (default=None)
+            Already counted :py:attr:`shared_events`, e.g. from
+            :py:meth:`from_miso_summary`
 
         Notes
         -----
         Warning: this data is usually HUGE (we're taking like 10GB raw .tsv
         files) so make sure you have the available memory for dealing with
-        these.
+        these, or use :py:meth:`from_miso_summary` to only keep the shared
+        event counts.
 
         """
         super(DownsampledSplicingData, self).__init__(sample_descriptors)
 
-        self.sample_descriptors, splicing = \
-            self.sample_descriptors.align(df, join='inner', axis=0)
+        self.sample_descriptors = self.data
+        if df is not None:
+            self.sample_descriptors, splicing = \
+                self.sample_descriptors.align(df, join='inner', axis=0)
 
         self.df = df
+        if shared_events is not None:
+            self._shared_events = shared_events
+
+    @classmethod
+    def from_miso_summary(cls, filename, sample_descriptors, sep='\t',
+                          compression=None, chunksize=DOWNSAMPLED_CHUNKSIZE):
+        """Count the shared events in a tall MISO summary file, a chunk of
+        rows at a time
+
+        Only the event name, splice type and probability columns are read,
+        and only the event counts are kept, so the memory used depends on
+        the number of distinct events rather than the size of the file.
+
+        Parameters
+        ----------
+        filename : str
+            Tall table of MISO summaries, with at least the columns
+            "event_name", "splice_type" and "probability"
+        sample_descriptors : pandas.DataFrame
+            Experiment design data
+        sep : str, optional (default="\t")
+            Delimiter between fields
+        compression : str, optional (default=None)
+            "gzip", "bz2" or None
+        chunksize : int, optional (default=DOWNSAMPLED_CHUNKSIZE)
+            Number of rows to read at a time
+
+        Returns
+        -------
+        downsampled : DownsampledSplicingData
+            Downsampled data with the shared events counted, and no ``df``
+        """
+        counter = SharedEventCounter()
+        for chunk in pd.read_csv(filename, sep=sep, compression=compression,
+                                 usecols=['event_name', 'splice_type',
+                                          'probability'],
+                                 chunksize=chunksize):
+            counter.update(chunk)
+        return cls(None, sample_descriptors,
+                   shared_events=counter.to_dataframe())
 
     @property
     def shared_events(self):
@@ -540,19 +605,10 @@ class DownsampledSplicingData(BaseData):
         """
 
         if not hasattr(self, '_shared_events'):
-            shared_events = {}
-
-            for (splice_type, probability), df in self.df.groupby(
-                    ['splice_type', 'probability']):
-                event_count = collections.Counter(df.event_name)
-                shared_events[(splice_type, probability)] = pd.Series(
-                    event_count)
-
-            self._shared_events = pd.DataFrame(shared_events)
-            self._shared_events.columns = pd.MultiIndex.from_tuples(
-                self._shared_events_df.columns.tolist())
-        else:
-            return self._shared_events
+            counter = SharedEventCounter()
+            counter.update(self.df)
+            self._shared_events = counter.to_dataframe()
+        return self._shared_events
 
     def shared_events_barplot(self, figure_dir='./'):
         """PLot a "histogram" via colored bars of the number of events shared
@@ -563,6 +619,9 @@ class DownsampledSplicingData(BaseData):
         figure_dir : str
             Where to save the pdf figures created
         """
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         figure_dir = figure_dir.rstrip('/')
         colors = purples + ['#262626']
 
@@ -608,6 +667,9 @@ class DownsampledSplicingData(BaseData):
         figure_dir : str
             Where to save the pdf figures created
         """
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         figure_dir = figure_dir.rstrip('/')
         sns.set(style='whitegrid', context='talk')
 
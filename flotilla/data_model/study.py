@@ -2,33 +2,59 @@
 Data models for "studies" studies include attributes about the data and are
 heavier in terms of data load
 """
+import collections
 import json
 import os
 import sys
+import threading
 import warnings
+from multiprocessing.pool import ThreadPool
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import semantic_version
 
 from .metadata import MetaData, PHENOTYPE_COL, POOLED_COL
 from .expression import ExpressionData, SpikeInData
 from .quality_control import MappingStatsData, MIN_READS
 from .splicing import SplicingData, FRACTION_DIFF_THRESH
+from ..cache import LRUCache, ResultStore, DEFAULT_CACHE_MAX_BYTES
 from ..compute.predict import PredictorConfigManager
 from ..datapackage import data_package_url_to_dict, \
-    check_if_already_downloaded, make_study_datapackage
+    make_study_datapackage, load_resources, resource_filename
 from ..visualize.color import blue
 from ..visualize.ipython_interact import Interactive
 from ..datapackage import FLOTILLA_DOWNLOAD_DIR
-from ..util import load_csv, load_json, load_tsv, load_gzip_pickle_df, \
-    load_pickle_df, timestamp
+from ..util import load_csv_chunked, load_json, load_tsv_chunked, \
+    load_gzip_pickle_df, load_pickle_df, timestamp
 
 
 SPECIES_DATA_PACKAGE_BASE_URL = 'http://sauron.ucsd.edu/flotilla_projects'
 DATAPACKAGE_RESOURCE_COMMON_KWS = ('url', 'path', 'format', 'compression',
-                                   'name')
+                                   'name', 'hash')
+
+# Directory in a study's flotilla_projects folder where the results of
+# expensive analyses are saved
+RESULT_STORE_DIRNAME = '.flotilla_results'
+
+# Species' feature data loaded so far in this process, keyed by the species
+# and the base URL it came from, so every Study of the same species shares
+# one copy of e.g. the hg19 gene annotations. The dataframes are shared, so
+# treat them as read-only
+_species_data = {}
+_species_data_locks = collections.defaultdict(threading.Lock)
+_species_data_locks_lock = threading.Lock()
+
+
+def clear_species_data():
+    """Forget all the species' feature data loaded so far, so it's read
+    again the next time a Study needs it"""
+    with _species_data_locks_lock:
+        _species_data.clear()
+
+
+def _load_if_lazy(data):
+    """Load data which was given as a function that loads it"""
+    return data() if callable(data) else data
 
 
 class Study(object):
@@ -43,14 +69,20 @@ class Study(object):
     # data
     _subsetable_data_types = ['expression', 'splicing']
 
+    # Resources which aren't read until they're used, when loading a
+    # datapackage lazily. The metadata and mapping stats are small and
+    # needed to create the other data types, so they're always read
+    _lazy_resources = ('expression', 'splicing', 'spikein',
+                       'expression_feature', 'splicing_feature')
+
     initializers = {'metadata_data': MetaData,
                     'expression_data': ExpressionData,
                     'splicing_data': SplicingData,
                     'mapping_stats_data': MappingStatsData,
                     'spikein_data': SpikeInData}
 
-    readers = {'tsv': load_tsv,
-               'csv': load_csv,
+    readers = {'tsv': load_tsv_chunked,
+               'csv': load_csv_chunked,
                'json': load_json,
                'pickle_df': load_pickle_df,
                'gzip_pickle_df': load_gzip_pickle_df}
@@ -68,6 +100,7 @@ class Study(object):
                  expression_log_base=None,
                  expression_thresh=-np.inf,
                  expression_plus_one=False,
+                 expression_sparse=False,
                  splicing_data=None,
                  splicing_feature_data=None,
                  splicing_feature_rename_col=None,
@@ -88,7 +121,11 @@ class Study(object):
                  license=None, title=None, sources=None,
                  default_sample_subset="all_samples",
                  default_feature_subset="variant",
-                 metadata_minimum_samples=0):
+                 metadata_minimum_samples=0,
+                 cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
+                 result_store_dir=None,
+                 load_species_data=True,
+                 species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
         """Construct a biological study
 
         This class only accepts data, no filenames. All data must already
@@ -130,6 +167,11 @@ class Study(object):
             Minimum (non log-transformed) expression value. (default -inf)
         expression_plus_one : bool
             Whether or not to add 1 to the expression data. (default False)
+        expression_sparse : bool
+            Whether to store the expression data as a sparse matrix of only
+            the nonzero values, to save memory on single-cell data which is
+            mostly zeros. If used with expression_plus_one, must also have
+            expression_log_base. (default False)
         splicing_data : pandas.DataFrame
             Samples x feature dataframe of percent spliced in scores, e.g. as
             measured by the program MISO. Assumed that these values only fall
@@ -168,6 +210,30 @@ class Study(object):
         metadata_pooled_col : str
             Column in metadata_data which specifies as a boolean
             whether or not this sample was pooled.
+        cache_max_bytes : int
+            Maximum size, in bytes, of the memoized results of computations
+            on all the data in this study. When this is exceeded,
+            the least recently used results are thrown out. See
+            ``study.cache.stats()`` for how well the cache is working.
+            (default 1GB)
+        result_store_dir : str
+            If given, save the results of expensive analyses, e.g. modalities,
+            classifiers, reductions and outlier detection, in this directory
+            so they're reused after the python session ends. See
+            ``study.result_store``. (default None)
+        load_species_data : bool
+            If True and ``species`` is given, load the species' gene and
+            splicing event annotations as the feature data, if no feature
+            data is given. (default True)
+        species_datapackage_base_url : str
+            Base URL to fetch species-specific gene and splicing event
+            metadata from. (default 'http://sauron.ucsd.edu/flotilla_projects')
+
+        Any of the "_data" parameters except ``sample_metadata`` and
+        ``mapping_stats_data`` can also be a function which takes no
+        arguments and returns the DataFrame. Then that data is only loaded,
+        and its data type (e.g. ``study.expression``) only created, the first
+        time it's used. See ``Study.from_datapackage(..., lazy=True)``.
 
         Note
         ----
@@ -180,12 +246,22 @@ class Study(object):
         [1] http://stackoverflow.com/q/12513185/1628971
         """
         sys.stdout.write("{}\tInitializing Study\n".format(timestamp()))
+        # Functions which create the data types that haven't been used yet
+        self._lazy_data_types = {}
+        # Where the resources of lazily loaded data types come from, as
+        # (resource, datapackage name, datapackage dir), so save() can copy
+        # them without loading them
+        self._source_resources = {}
+
         sys.stdout.write("{}\tInitializing Predictor configuration manager "
                          "for Study\n".format(timestamp()))
         self.predictor_config_manager = predictor_config_manager \
             if predictor_config_manager is not None \
             else PredictorConfigManager()
         # self.predictor_config_manager = None
+        self.cache = LRUCache(cache_max_bytes)
+        self.result_store = None if result_store_dir is None \
+            else ResultStore(result_store_dir)
 
         self.species = species
         self.gene_ontology_data = gene_ontology_data
@@ -201,7 +277,8 @@ class Study(object):
             metadata_phenotype_to_color,
             metadata_phenotype_to_marker, pooled_col=metadata_pooled_col,
             phenotype_col=metadata_phenotype_col,
-            predictor_config_manager=self.predictor_config_manager)
+            predictor_config_manager=self.predictor_config_manager,
+            cache=self.cache)
 
         self.phenotype_col = self.metadata.phenotype_col
         self.phenotype_order = self.metadata.phenotype_order
@@ -216,22 +293,17 @@ class Study(object):
         self.default_sample_subset = default_sample_subset
 
         if 'outlier' in self.metadata.data and drop_outliers:
-            outliers = self.metadata.data.index[
-                self.metadata.data.outlier.astype(bool)]
+            outliers = self.metadata.data.index[self.metadata.is_outlier]
         else:
             outliers = None
             self.metadata.data['outlier'] = False
+            self.metadata.mark_changed('data')
 
         # Get pooled samples
         pooled = None
         if self.metadata.pooled_col is not None:
             if self.metadata.pooled_col in self.metadata.data:
-                try:
-                    pooled = self.metadata.data.index[
-                        self.metadata.data[
-                            self.metadata.pooled_col].astype(bool)]
-                except:
-                    pooled = None
+                pooled = self.metadata.data.index[self.metadata.is_pooled]
         self.pooled = pooled
 
         if mapping_stats_data is not None:
@@ -239,7 +311,7 @@ class Study(object):
                 mapping_stats_data,
                 number_mapped_col=mapping_stats_number_mapped_col,
                 predictor_config_manager=self.predictor_config_manager,
-                min_reads=mapping_stats_min_reads)
+                min_reads=mapping_stats_min_reads, cache=self.cache)
             self.technical_outliers = self.mapping_stats.too_few_mapped
             sys.stderr.write('samples had too few mapped reads (<{'
                              ':.1e} reads):\n\t{}\n'.format(
@@ -247,72 +319,135 @@ class Study(object):
         else:
             self.technical_outliers = None
 
-        if self.species is not None:
-
-            sys.stdout.write('{}\tLoading species metadata from '
-                             '~/flotilla_packages\n'.format(timestamp()))
-            species_kws = self.load_species_data(self.species, self.readers)
-
-            if expression_feature_data is None:
-                expression_feature_data = species_kws.pop('expression_feature_data',
-                    None)
-
-            if expression_feature_rename_col is None:
-                expression_feature_rename_col = species_kws.pop(
-                    'expression_feature_rename_col', None)
-
-
-            if splicing_feature_data is None:
-                splicing_feature_data = species_kws.pop('splicing_feature_data',
-                                                        None)
+        loaded_species_kws = []
 
-            if splicing_feature_rename_col is None:
-                splicing_feature_rename_col = species_kws.pop(
-                'splicing_feature_rename_col', None)
+        def species_kws():
+            """Species' feature data, loaded the first time it's needed"""
+            if self.species is None or not load_species_data:
+                return {}
+            if not loaded_species_kws:
+                sys.stdout.write('{}\tLoading species metadata from '
+                                 '~/flotilla_packages\n'.format(timestamp()))
+                loaded_species_kws.append(self.load_species_data(
+                    self.species, self.readers, species_datapackage_base_url))
+            return loaded_species_kws[0]
 
-        if expression_data is not None:
+        def build_expression():
             sys.stdout.write(
                 "{}\tLoading expression data\n".format(timestamp()))
-            self.expression = ExpressionData(
-                expression_data,
-                feature_data=expression_feature_data,
+            feature_data = _load_if_lazy(expression_feature_data)
+            if feature_data is None:
+                feature_data = species_kws().get('expression_feature_data')
+            rename_col = expression_feature_rename_col
+            if rename_col is None:
+                rename_col = species_kws().get(
+                    'expression_feature_rename_col')
+            expression = ExpressionData(
+                _load_if_lazy(expression_data),
+                feature_data=feature_data,
                 thresh=expression_thresh,
-                feature_rename_col=expression_feature_rename_col,
+                feature_rename_col=rename_col,
                 outliers=outliers, plus_one=expression_plus_one,
                 log_base=expression_log_base, pooled=pooled,
+                sparse=expression_sparse,
                 predictor_config_manager=self.predictor_config_manager,
                 technical_outliers=self.technical_outliers,
                 minimum_samples=metadata_minimum_samples,
-                feature_ignore_subset_cols=expression_feature_ignore_subset_cols)
-            self.default_feature_set_ids.extend(self.expression.feature_subsets
-                                                .keys())
-        if splicing_data is not None:
+                feature_ignore_subset_cols=expression_feature_ignore_subset_cols,
+                cache=self.cache, result_store=self.result_store)
+            self.default_feature_set_ids.extend(
+                expression.feature_subsets.keys())
+            return expression
+
+        def build_splicing():
             sys.stdout.write("{}\tLoading splicing data\n".format(
                 timestamp()))
-            self.splicing = SplicingData(
-                splicing_data, feature_data=splicing_feature_data,
-                feature_rename_col=splicing_feature_rename_col,
+            feature_data = _load_if_lazy(splicing_feature_data)
+            if feature_data is None:
+                feature_data = species_kws().get('splicing_feature_data')
+            rename_col = splicing_feature_rename_col
+            if rename_col is None:
+                rename_col = species_kws().get('splicing_feature_rename_col')
+            return SplicingData(
+                _load_if_lazy(splicing_data), feature_data=feature_data,
+                feature_rename_col=rename_col,
                 outliers=outliers, pooled=pooled,
                 predictor_config_manager=self.predictor_config_manager,
                 technical_outliers=self.technical_outliers,
                 minimum_samples=metadata_minimum_samples,
-                feature_ignore_subset_cols=splicing_feature_ignore_subset_cols)
+                feature_ignore_subset_cols=splicing_feature_ignore_subset_cols,
+                cache=self.cache, result_store=self.result_store)
 
-        if spikein_data is not None:
-            self.spikein = SpikeInData(
-                spikein_data, feature_data=spikein_feature_data,
+        def build_spikein():
+            return SpikeInData(
+                _load_if_lazy(spikein_data),
+                feature_data=_load_if_lazy(spikein_feature_data),
                 technical_outliers=self.technical_outliers,
-                predictor_config_manager=self.predictor_config_manager)
+                predictor_config_manager=self.predictor_config_manager,
+                cache=self.cache)
+
+        for name, data, build in (('expression', expression_data,
+                                   build_expression),
+                                  ('splicing', splicing_data, build_splicing),
+                                  ('spikein', spikein_data, build_spikein)):
+            if data is None:
+                continue
+            elif callable(data):
+                self._lazy_data_types[name] = build
+            else:
+                setattr(self, name, build())
         sys.stdout.write("{}\tSuccessfully initialized a Study "
                          "object!\n".format(timestamp()))
 
+    def __getattr__(self, key):
+        """Create data types which were loaded lazily, on their first use
+        """
+        lazy_data_types = self.__dict__.get('_lazy_data_types', {})
+        if key not in lazy_data_types:
+            raise AttributeError("'{}' object has no attribute '{}'".format(
+                type(self).__name__, key))
+        # Remove it first, so the attribute doesn't "exist" while being set
+        build = lazy_data_types.pop(key)
+        setattr(self, key, build())
+        return self.__dict__[key]
+
     def __setattr__(self, key, value):
         """Check if the attribute already exists and warns on overwrite.
         """
-        if hasattr(self, key):
+        # Not hasattr, which would load a lazy data type just to replace it
+        if key in self.__dict__ \
+                or key in self.__dict__.get('_lazy_data_types', {}):
             warnings.warn('Over-writing attribute {}'.format(key))
         super(Study, self).__setattr__(key, value)
 
+    # Data types reported by stats(), if they exist
+    _stats_data_types = ('metadata', 'mapping_stats', 'expression',
+                         'splicing', 'spikein')
+
+    def stats(self):
+        """Where this study's memory and time go
+
+        Data types which haven't been loaded yet (see ``lazy`` in
+        :py:meth:`from_datapackage`) aren't loaded by this.
+
+        Returns
+        -------
+        stats : dict
+            ``cache``, the summary of the memoized results shared by all the
+            data types (see :py:meth:`LRUCache.stats`), ``result_store``, the
+            summary of the results saved to disk (or None), and for each
+            loaded data type, e.g. "expression", the sizes of its data and
+            cached results and the time spent in its main operations (see
+            :py:meth:`BaseData.stats`)
+        """
+        stats = {'cache': self.cache.stats(),
+                 'result_store': None if self.result_store is None
+                 else self.result_store.stats()}
+        for name in self._stats_data_types:
+            if name in self.__dict__:
+                stats[name] = self.__dict__[name].stats()
+        return stats
+
     @property
     def default_sample_subsets(self):
         #move default_sample_subset to the front of the list, sort the rest
@@ -337,7 +472,9 @@ class Study(object):
     def from_datapackage_url(
             cls, datapackage_url,
             load_species_data=True,
-            species_data_package_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
+            species_data_package_base_url=SPECIES_DATA_PACKAGE_BASE_URL,
+            binary_cache=True, mmap=False, lazy=False, chunked=False,
+            result_store=False):
         """Create a study from a url of a datapackage.json file
 
         Parameters
@@ -350,6 +487,24 @@ class Study(object):
         species_data_pacakge_base_url : str
             Base URL to fetch species-specific gene and splicing event
             metadata from. Default 'http://sauron.ucsd.edu/flotilla_projects'
+        binary_cache : bool
+            Whether or not to keep fast-loading binary copies of the
+            resources next to the downloaded files. Default True
+        mmap : bool
+            If True, keep the expression and splicing values in read-only,
+            memory-mapped float32 files instead of in memory. Default False
+        lazy : bool
+            If True, only read each data type the first time it's used.
+            Default False
+        chunked : bool
+            If True, keep the expression data on disk in blocks of samples,
+            for data which is too big to fit in memory. Default False
+        result_store : bool
+            If True, save the results of expensive analyses in
+            "~/flotilla_projects/<name>/.flotilla_results", and reuse them
+            when the study is opened again. Nothing is ever removed from
+            there, so use ``study.result_store.clear()`` to free the space.
+            Default False
 
         Returns
         -------
@@ -366,13 +521,17 @@ class Study(object):
         data_package = data_package_url_to_dict(datapackage_url)
         return cls.from_datapackage(
             data_package, load_species_data=load_species_data,
-            species_datapackage_base_url=species_data_package_base_url)
+            species_datapackage_base_url=species_data_package_base_url,
+            binary_cache=binary_cache, mmap=mmap, lazy=lazy,
+            chunked=chunked, result_store=result_store)
 
     @classmethod
     def from_datapackage_file(
             cls, datapackage_filename,
             load_species_data=True,
-            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
+            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL,
+            binary_cache=True, mmap=False, lazy=False, chunked=False,
+            result_store=False):
         with open(datapackage_filename) as f:
             sys.stdout.write('{}\tReading datapackage from {}\n'.format(
                 timestamp(), datapackage_filename))
@@ -381,19 +540,51 @@ class Study(object):
         return cls.from_datapackage(
             datapackage, datapackage_dir=datapackage_dir,
             load_species_data=load_species_data,
-            species_datapackage_base_url=species_datapackage_base_url)
+            species_datapackage_base_url=species_datapackage_base_url,
+            binary_cache=binary_cache, mmap=mmap, lazy=lazy,
+            chunked=chunked, result_store=result_store)
 
     @classmethod
     def from_datapackage(
             cls, datapackage, datapackage_dir='./',
             load_species_data=True,
-            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
+            species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL,
+            binary_cache=True, mmap=False, lazy=False, chunked=False,
+            result_store=False):
         """Create a study object from a datapackage dictionary
 
         Parameters
         ----------
         datapackage : dict
 
+        binary_cache : bool
+            If True, read each resource from a binary copy in a
+            ".flotilla_cache" directory next to the resource file, if the
+            copy is up to date. Otherwise, parse the resource file and write
+            the binary copy so the next load is faster. Default True
+        mmap : bool
+            If True, the expression and splicing values are float32 and
+            memory-mapped from a read-only file in the ".flotilla_cache"
+            directory, so several Study objects (or processes) using the same
+            data share one copy, and the data doesn't all have to fit in
+            memory. Default False
+        lazy : bool
+            If True, only read the metadata and mapping stats now. Each of
+            the other data types, e.g. expression, and the species data it
+            needs, are read the first time they're used, e.g. with
+            ``study.expression``. Default False
+        chunked : bool
+            If True, keep the expression data on disk as a
+            :py:class:`.ChunkedMatrix` in the ".flotilla_cache" directory,
+            for data which is too big to fit in memory. Thresholding, the
+            "variant" feature subset and PCA read it one block of samples at
+            a time. Default False
+        result_store : bool
+            If True, save the results of expensive analyses, e.g. modalities
+            and classifiers, in a ".flotilla_results" directory in
+            "~/flotilla_projects/<name>", and reuse them whenever this study
+            is opened again. Nothing is ever removed from there, so use
+            ``study.result_store.clear()`` to free the space. Default False
 
         Returns
         -------
@@ -402,33 +593,61 @@ class Study(object):
         """
         sys.stdout.write('{}\tParsing datapackage to create a Study '
                          'object\n'.format(timestamp()))
-        dfs = {}
         kwargs = {}
         datapackage_name = datapackage['name']
+        load_kws = dict(datapackage_dir=datapackage_dir,
+                        binary_cache=binary_cache,
+                        mmap=cls._subsetable_data_types if mmap else (),
+                        chunked=('expression',) if chunked else ())
+
+        resources = datapackage['resources']
+        lazy_resources = []
+        if lazy:
+            lazy_resources = [r for r in resources
+                              if r['name'] in cls._lazy_resources]
+            resources = [r for r in resources
+                         if r['name'] not in cls._lazy_resources]
+
+        result_store_dir = None
+        if result_store:
+            result_store_dir = os.path.join(FLOTILLA_DOWNLOAD_DIR,
+                                            datapackage_name,
+                                            RESULT_STORE_DIRNAME)
 
-        for resource in datapackage['resources']:
-            if 'url' in resource:
-                resource_url = resource['url']
-                filename = check_if_already_downloaded(resource_url,
-                                                       datapackage_name)
-            else:
-                filename = resource['path']
-                # Test if the file exists, if not, then add the datapackage
-                # file
-                try:
-                    with open(filename) as f:
-                        pass
-                except IOError:
-                    filename = os.path.join(datapackage_dir, filename)
+        species = None if 'species' not in datapackage else datapackage[
+            'species']
+        # Load the species data at the same time as this study's resources
+        species_pool = None
+        species_kws = {}
+        if load_species_data and species is not None and not lazy:
+            species_pool = ThreadPool(1)
+        try:
+            if species_pool is not None:
+                species_result = species_pool.apply_async(
+                    cls.load_species_data,
+                    (species, cls.readers, species_datapackage_base_url),
+                    {'binary_cache': binary_cache})
+
+            dfs = load_resources(resources, datapackage_name, cls.readers,
+                                 **load_kws)
+
+            if species_pool is not None:
+                species_kws = species_result.get()
+        finally:
+            if species_pool is not None:
+                species_pool.close()
+                species_pool.join()
+
+        def loader(resource):
+            return lambda: load_resources(
+                [resource], datapackage_name, cls.readers,
+                **load_kws)[resource['name']]
+
+        for resource in lazy_resources:
+            dfs[resource['name']] = loader(resource)
 
+        for resource in datapackage['resources']:
             name = resource['name']
-
-            reader = cls.readers[resource['format']]
-            compression = None if 'compression' not in resource else \
-                resource['compression']
-
-            dfs[name] = reader(filename, compression=compression)
-
             if name == 'expression':
                 if 'log_transformed' in resource:
                     log_base = 2
@@ -436,13 +655,6 @@ class Study(object):
                     DATAPACKAGE_RESOURCE_COMMON_KWS):
                 kwargs['{}_{}'.format(name, key)] = resource[key]
 
-        species_kws = {}
-        species = None if 'species' not in datapackage else datapackage[
-            'species']
-        if load_species_data and species is not None:
-            species_kws = cls.load_species_data(species, cls.readers,
-                                                species_datapackage_base_url)
-
         try:
             sample_metadata = dfs.pop('metadata')
         except KeyError:
@@ -464,6 +676,8 @@ class Study(object):
             'sources']
         version = None if 'datapackage_version' not in datapackage else \
             datapackage['datapackage_version']
+        import semantic_version
+
         if not semantic_version.validate(version):
             raise ValueError('{} is not a valid version string. Please use '
                              'semantic versioning, with major.minor.patch, '
@@ -476,12 +690,65 @@ class Study(object):
             title=title,
             sources=sources,
             version=version,
+            # Unless lazy, species data was already loaded (or not wanted)
+            load_species_data=load_species_data and lazy,
+            species_datapackage_base_url=species_datapackage_base_url,
+            result_store_dir=result_store_dir,
             **kwargs)
+        study._source_resources.update(
+            (resource['name'], (resource, datapackage_name, datapackage_dir))
+            for resource in lazy_resources)
         return study
 
     @staticmethod
     def load_species_data(species, readers,
-                          species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL):
+                          species_datapackage_base_url=SPECIES_DATA_PACKAGE_BASE_URL,
+                          binary_cache=True):
+        """Get a species' feature data, e.g. gene annotations for hg19
+
+        Each species is only read once per process, and every Study of that
+        species shares the same dataframes. Use :py:func:`clear_species_data`
+        to read them again.
+
+        Parameters
+        ----------
+        species : str
+            Name of the species and genome version, e.g. 'hg19' or 'mm10'
+        readers : dict
+            Mapping of resource format to function which reads it
+        species_datapackage_base_url : str
+            Base URL to fetch species-specific gene and splicing event
+            metadata from
+        binary_cache : bool
+            If True, read each resource from its binary copy if it's up to
+            date
+
+        Returns
+        -------
+        dfs : dict
+            Keyword arguments to Study, e.g. "expression_feature_data". Empty
+            if the species data couldn't be loaded
+        """
+        key = species, species_datapackage_base_url
+        with _species_data_locks_lock:
+            lock = _species_data_locks[key]
+
+        # Only one thread reads each species, and the others wait for it
+        with lock:
+            if key not in _species_data:
+                dfs = Study._read_species_data(species, readers,
+                                               species_datapackage_base_url,
+                                               binary_cache)
+                if not dfs:
+                    # Don't remember failures, so we try again next time
+                    return {}
+                _species_data[key] = dfs
+            return dict(_species_data[key])
+
+    @staticmethod
+    def _read_species_data(species, readers, species_datapackage_base_url,
+                           binary_cache):
+        """Read a species' datapackage, without using the loaded species"""
         dfs = {}
 
         try:
@@ -490,21 +757,12 @@ class Study(object):
             species_data_package = data_package_url_to_dict(
                 species_data_url)
 
-            for resource in species_data_package['resources']:
-                if 'url' in resource:
-                    resource_url = resource['url']
-                    filename = check_if_already_downloaded(resource_url,
-                                                           species)
-                else:
-                    filename = resource['path']
-
-                reader = readers[resource['format']]
+            dfs.update(load_resources(species_data_package['resources'],
+                                      species, readers,
+                                      binary_cache=binary_cache))
 
-                compression = None if 'compression' not in resource else \
-                    resource['compression']
+            for resource in species_data_package['resources']:
                 name = resource['name']
-                dfs[name] = reader(filename,
-                                   compression=compression)
                 other_keys = set(resource.keys()).difference(
                     DATAPACKAGE_RESOURCE_COMMON_KWS)
                 name_no_data = name.rstrip('_data')
@@ -563,6 +821,7 @@ class Study(object):
 
         self.metadata.data[outlier_detector.title].update(
             outlier_detector.outliers)
+        self.metadata.mark_changed('data')
         return reducer, outlier_detector
 
     def drop_outliers(self):
@@ -585,18 +844,76 @@ class Study(object):
         except:
             sys.stderr.write("couldn't drop splicing outliers")
 
-    def jsd(self):
-        """Performs Jensen-Shannon Divergence on both splicing and expression
-        study_data
+    def jsd(self, data_type='expression', sample_subset=None,
+            feature_subset=None):
+        """Jensen-Shannon divergence of each feature between every pair of
+        phenotypes
 
         Jensen-Shannon divergence is a method of quantifying the amount of
         change in distribution of one measurement (e.g. a splicing event or a
         gene expression) from one celltype to another.
+
+        Parameters
+        ----------
+        data_type : "expression" | "splicing", optional
+            Which data to use (default "expression")
+        sample_subset : str, optional
+            Samples to use, e.g. "~outlier". See
+            :py:meth:`.sample_subset_to_sample_ids`
+        feature_subset : str, optional
+            Features to use. If None, use all features
+
+        Returns
+        -------
+        jsd : pandas.DataFrame
+            A (n_features, n_phenotype_pairs) DataFrame of the divergence of
+            each feature between each pair of phenotypes, in
+            ``phenotype_order``
         """
-        raise NotImplementedError
-        # TODO: Check if JSD has not already been calculated (memoize)
-        self.expression.jsd()
-        self.splicing.jsd()
+        data, sample_ids, feature_ids = self._phenotype_comparison_args(
+            data_type, sample_subset, feature_subset)
+        return data.jsd(self.sample_id_to_phenotype, sample_ids, feature_ids,
+                        phenotype_order=self.phenotype_order)
+
+    def entropy(self, data_type='expression', sample_subset=None,
+                feature_subset=None):
+        """Entropy of each feature's distribution within each phenotype
+
+        Parameters
+        ----------
+        data_type : "expression" | "splicing", optional
+            Which data to use (default "expression")
+        sample_subset : str, optional
+            Samples to use, e.g. "~outlier". See
+            :py:meth:`.sample_subset_to_sample_ids`
+        feature_subset : str, optional
+            Features to use. If None, use all features
+
+        Returns
+        -------
+        entropy : pandas.DataFrame
+            A (n_features, n_phenotypes) DataFrame of entropies, in bits
+        """
+        data, sample_ids, feature_ids = self._phenotype_comparison_args(
+            data_type, sample_subset, feature_subset)
+        return data.entropy(self.sample_id_to_phenotype, sample_ids,
+                            feature_ids, phenotype_order=self.phenotype_order)
+
+    def _phenotype_comparison_args(self, data_type, sample_subset,
+                                   feature_subset):
+        if data_type == "expression":
+            data = self.expression
+        elif data_type == "splicing":
+            data = self.splicing
+        else:
+            raise ValueError('data_type must be "expression" or "splicing", '
+                             'not "{}"'.format(data_type))
+        sample_ids = self.sample_subset_to_sample_ids(sample_subset)
+        feature_ids = None
+        if feature_subset is not None:
+            feature_ids = self.feature_subset_to_feature_ids(
+                data_type, feature_subset, rename=False)
+        return data, sample_ids, feature_ids
 
     def normalize_to_spikein(self):
         raise NotImplementedError
@@ -646,36 +963,41 @@ class Study(object):
         ----------
         phenotype_subset : str
             A valid string describing a boolean phenotype described in the
-            metadata data
+            metadata data, or a query combining sample subsets with ``&``,
+            ``|``, ``~`` and parentheses, e.g.
+            "phenotype: neuron & ~outlier | pooled". See
+            :py:meth:`SubsetIndex.query`
 
         Returns
         -------
         sample_ids : list of strings
             List of sample ids in the data
         """
+        if not isinstance(phenotype_subset, basestring):
+            if phenotype_subset is None:
+                return self.metadata.data.index
+            # Already a list of sample ids
+            return phenotype_subset
+
+        if 'all_samples'.startswith(phenotype_subset):
+            return self.metadata.data.index
+
+        sample_subsets = self.metadata.sample_subsets
+        if phenotype_subset in sample_subsets:
+            return sample_subsets[phenotype_subset]
 
         try:
-            return self.metadata.sample_subsets[phenotype_subset]
+            return sample_subsets.query(phenotype_subset)
         except KeyError:
             pass
 
-        try:
-            if phenotype_subset is None or 'all_samples'.startswith(
-                    phenotype_subset):
-                sample_ind = np.ones(self.metadata.data.shape[0],
-                                     dtype=bool)
-            elif phenotype_subset.startswith("~"):
-                sample_ind = ~pd.Series(
-                    self.metadata.data[phenotype_subset.lstrip("~")],
-                    dtype='bool')
-
-            else:
-                sample_ind = pd.Series(
-                    self.metadata.data[phenotype_subset], dtype='bool')
-            sample_ids = self.metadata.data.index[sample_ind]
-            return sample_ids
-        except AttributeError:
-            return phenotype_subset
+        # Not a subset, but maybe a metadata column which can be treated as
+        # boolean
+        sample_ind = pd.Series(
+            self.metadata.data[phenotype_subset.lstrip("~")], dtype='bool')
+        if phenotype_subset.startswith("~"):
+            sample_ind = ~sample_ind
+        return self.metadata.data.index[sample_ind.values]
 
     def plot_pca(self, data_type='expression', x_pc=1, y_pc=2,
                  sample_subset=None, feature_subset=None,
@@ -808,6 +1130,8 @@ class Study(object):
                 **kwargs)
 
     def plot_study_sample_legend(self):
+        import matplotlib.pyplot as plt
+
         markers = self.metadata.data.color.groupby(
             self.metadata.data.marker
             + "." + self.metadata.data.celltype).last()
@@ -910,6 +1234,8 @@ class Study(object):
 
     def plot_modalities(self, sample_subset=None, feature_subset=None,
                         normed=True):
+        import matplotlib.pyplot as plt
+
         # try:
         sample_ids = self.sample_subset_to_sample_ids(sample_subset)
         feature_ids = self.feature_subset_to_feature_ids('splicing',
@@ -1196,7 +1522,29 @@ class Study(object):
         ------
         """
 
-    def save(self, name, flotilla_dir=FLOTILLA_DOWNLOAD_DIR):
+    def save(self, name, flotilla_dir=FLOTILLA_DOWNLOAD_DIR,
+             resource_format='csv', compresslevel=9):
+        """Save this study as a datapackage, with an increased version
+
+        Data which hasn't changed since the last time this study was saved to
+        the same place isn't written again. Data types which were never
+        loaded (see ``lazy`` in :py:meth:`from_datapackage`) aren't loaded
+        by this, but their files are copied from the original datapackage.
+
+        Parameters
+        ----------
+        name : str
+            Name of the datapackage, which is also the folder it's saved to
+        flotilla_dir : str, optional
+            Where to save the datapackage folder. Default
+            "~/flotilla_projects"
+        resource_format : "csv" | "pickle_df", optional (default="csv")
+            Save the data as gzipped csv files, or as uncompressed pickles
+            which are much faster to write and read, but only from Python
+        compresslevel : int, optional (default=9)
+            For "csv", the gzip compression level from 1 (fastest) to 9
+            (smallest)
+        """
 
         metadata = self.metadata.data
 
@@ -1209,46 +1557,65 @@ class Study(object):
                             self.metadata.phenotype_to_marker,
                         'minimum_samples': self.metadata.minimum_samples}
 
-        try:
-            expression = self.expression.data_original
-            expression_kws = {
-                'log_base': self.expression.log_base,
-                'thresh': self.expression.thresh}
-        except AttributeError:
-            expression = None
-            expression_kws = None
+        # Data types which were never loaded are copied from the datapackage
+        # they would have been loaded from, rather than loaded just to save
+        copy_resources = {}
+        for data_type in self._lazy_data_types:
+            if data_type not in self._source_resources:
+                continue
+            for resource_name in (data_type,
+                                  '{}_feature'.format(data_type)):
+                if resource_name in self._source_resources:
+                    resource, datapackage_name, datapackage_dir = \
+                        self._source_resources[resource_name]
+                    filename = resource_filename(resource, datapackage_name,
+                                                 datapackage_dir)
+                    copy_resources[resource_name] = filename, resource
+
+        expression = expression_kws = None
+        expression_feature_data = expression_feature_kws = None
+        if 'expression' not in copy_resources:
+            try:
+                expression = self.expression.data_original
+                expression_kws = {
+                    'log_base': self.expression.log_base,
+                    'thresh': self.expression.thresh}
+            except AttributeError:
+                pass
 
-        try:
-            expression_feature_data = self.expression.feature_data
-            expression_feature_kws = {'rename_col':
-                                          self.expression.feature_rename_col,
-                                      'ignore_subset_cols':
-                                          self.expression.feature_ignore_subset_cols}
-        except AttributeError:
-            expression_feature_data = None
-            expression_feature_kws = None
+            try:
+                expression_feature_data = self.expression.feature_data
+                expression_feature_kws = {
+                    'rename_col': self.expression.feature_rename_col,
+                    'ignore_subset_cols':
+                        self.expression.feature_ignore_subset_cols}
+            except AttributeError:
+                pass
 
-        try:
-            splicing = self.splicing.data_original
-            splicing_kws = {}
-        except AttributeError:
-            splicing = None
-            splicing_kws = None
+        splicing = splicing_kws = None
+        splicing_feature_data = splicing_feature_kws = None
+        if 'splicing' not in copy_resources:
+            try:
+                splicing = self.splicing.data_original
+                splicing_kws = {}
+            except AttributeError:
+                pass
 
-        try:
-            splicing_feature_data = self.splicing.feature_data
-            splicing_feature_kws = {'rename_col':
-                                        self.splicing.feature_rename_col,
-                                    'ignore_subset_cols':
-                                        self.splicing.feature_ignore_subset_cols}
-        except AttributeError:
-            splicing_feature_data = None
-            splicing_feature_kws = None
+            try:
+                splicing_feature_data = self.splicing.feature_data
+                splicing_feature_kws = {
+                    'rename_col': self.splicing.feature_rename_col,
+                    'ignore_subset_cols':
+                        self.splicing.feature_ignore_subset_cols}
+            except AttributeError:
+                pass
 
-        try:
-            spikein = self.spikein.data_original
-        except AttributeError:
-            spikein = None
+        spikein = None
+        if 'spikein' not in copy_resources:
+            try:
+                spikein = self.spikein.data_original
+            except AttributeError:
+                pass
 
         try:
             mapping_stats = self.mapping_stats.data_original
@@ -1260,6 +1627,8 @@ class Study(object):
 
 
         # Increase the version number
+        import semantic_version
+
         version = semantic_version.Version(self.version)
         version.patch = version.patch + 1
         version = str(version)
@@ -1279,7 +1648,10 @@ class Study(object):
                                       title=self.title,
                                       sources=self.sources,
                                       version=version,
-                                      flotilla_dir=flotilla_dir)
+                                      flotilla_dir=flotilla_dir,
+                                      resource_format=resource_format,
+                                      compresslevel=compresslevel,
+                                      copy_resources=copy_resources)
 
 
 
@@ -0,0 +1,348 @@
+"""
+Named subsets of the rows of a metadata table, e.g. all features whose
+"gene_type" is "protein_coding", stored as one sparse membership matrix and
+queried with boolean expressions like "phenotype: neuron & ~outlier"
+"""
+import collections
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class SubsetIndex(collections.Mapping):
+    """Which rows belong to which named subset
+
+    Membership is stored once as a sparse boolean (rows x subsets) matrix,
+    so looking up a subset or combining several of them only touches the
+    rows in those subsets. The complement of each subset, "not (subset)",
+    is resolved from the matrix on demand rather than stored.
+
+    Behaves like the ``{name: row_ids}`` dict that
+    :py:func:`subsets_from_metadata` used to return.
+
+    Parameters
+    ----------
+    index : pandas.Index
+        Row ids, e.g. feature ids
+    membership : scipy.sparse matrix
+        (len(index) x len(names)) boolean matrix, True where a row is in a
+        subset
+    names : list-like
+        Name of each column of ``membership``
+    complements : list-like, optional
+        Names of the subsets whose complement "not (name)" is available
+    extra : dict, optional
+        Additional ``{name: row_ids}`` subsets which aren't derived from
+        the metadata, e.g. "variant" features
+    """
+
+    def __init__(self, index, membership, names, complements=(),
+                 extra=None):
+        self.index = pd.Index(index)
+        self.membership = sparse.csc_matrix(membership, dtype=bool)
+        self.names = pd.Index(names)
+        self._positions = dict((name, i) for i, name in
+                               enumerate(self.names))
+        self._complements = collections.OrderedDict(
+            ('not ({})'.format(name), name) for name in complements)
+        self._extra = collections.OrderedDict(
+            () if extra is None else extra)
+        # Packed bitmasks of the subsets used in queries so far
+        self._bits = {}
+
+    @classmethod
+    def from_metadata(cls, metadata, minimum, subset_type, ignore=None):
+        """Build the index from the columns of a metadata table
+
+        Parameters
+        ----------
+        metadata : pandas.DataFrame
+            The dataframe whose columns to use to create subsets of the rows
+        minimum : int
+            Minimum number of rows required for a column or group in the
+            column to be included
+        subset_type : str
+            The name of the kind of subset. e.g. "samples" or "features"
+        ignore : list-like
+            List of columns to ignore
+
+        Returns
+        -------
+        subsets : SubsetIndex
+            Boolean columns become a subset of the same name, and every
+            group of at least ``minimum`` rows in any other column becomes
+            a "column: group" subset. "all {subset_type}" holds every row.
+        """
+        if metadata is None:
+            return cls([], sparse.csc_matrix((0, 0), dtype=bool), [])
+
+        ignore = () if ignore is None else ignore
+        names = []
+        rows = []
+        for col in metadata:
+            if col in ignore:
+                continue
+            values = metadata[col].values
+            if metadata[col].dtype == bool:
+                names.append(col)
+                rows.append(np.flatnonzero(values))
+                continue
+            codes, groups = pd.factorize(values, sort=True)
+            present = codes >= 0
+            sizes = np.bincount(codes[present], minlength=len(groups))
+            # Row positions of each group, in their original order
+            order = np.flatnonzero(present)[
+                np.argsort(codes[present], kind='mergesort')]
+            starts = np.concatenate([[0], np.cumsum(sizes)])
+            for code, group in enumerate(groups):
+                if sizes[code] < minimum or isinstance(group, bool):
+                    continue
+                names.append('{}: {}'.format(col, group))
+                rows.append(order[starts[code]:starts[code + 1]])
+
+        complements = [name for name in names
+                       if 'False' not in name and 'True' not in name
+                       and 'not ({})'.format(name) not in names]
+
+        names.append('all {}'.format(subset_type))
+        rows.append(np.arange(metadata.shape[0]))
+
+        lengths = [len(r) for r in rows]
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        indices = np.concatenate(rows).astype(np.int64) if rows \
+            else np.array([], dtype=np.int64)
+        membership = sparse.csc_matrix(
+            (np.ones(len(indices), dtype=bool), indices, indptr),
+            shape=(metadata.shape[0], len(names)))
+        return cls(metadata.index, membership, names, complements)
+
+    def with_subsets(self, subsets):
+        """Copy of this index with more named subsets added
+
+        The membership matrix is shared, not copied.
+
+        Parameters
+        ----------
+        subsets : dict
+            ``{name: row_ids}`` of the subsets to add
+
+        Returns
+        -------
+        index : SubsetIndex
+        """
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new._extra = collections.OrderedDict(self._extra)
+        new._extra.update(subsets)
+        return new
+
+    def _rows(self, name):
+        """Positions of the rows in a stored subset"""
+        i = self._positions[name]
+        indptr = self.membership.indptr
+        return self.membership.indices[indptr[i]:indptr[i + 1]]
+
+    def mask(self, name):
+        """Boolean array over ``index``, True for the rows in a subset"""
+        if name in self._extra:
+            return self.index.isin(self._extra[name])
+        if name in self._complements:
+            return ~self.mask(self._complements[name])
+        mask = np.zeros(len(self.index), dtype=bool)
+        mask[self._rows(name)] = True
+        return mask
+
+    def bits(self, name):
+        """Bitmask of the rows in a subset, packed with numpy.packbits"""
+        if name in self._extra:
+            # Added subsets aren't cached, because copies share the cache
+            return np.packbits(self.mask(name))
+        bits = self._bits.get(name)
+        if bits is None:
+            bits = self._bits[name] = np.packbits(self.mask(name))
+        return bits
+
+    def query_mask(self, expression):
+        """Boolean array over ``index`` of the rows matching a query
+
+        See :py:meth:`query` for the syntax
+        """
+        bits = _QueryParser(self, expression).parse()
+        return np.unpackbits(bits)[:len(self.index)].astype(bool)
+
+    def query(self, expression):
+        """Row ids matching a boolean expression of subset names
+
+        Subset names are combined with ``&`` (and), ``|`` (or) and ``~``
+        (not), grouped with parentheses. ``&`` binds tighter than ``|``, so
+        ``"phenotype: neuron & ~outlier | pooled"`` means neurons which
+        aren't outliers, plus all pooled samples. Each subset's bitmask is
+        built once and reused by later queries.
+
+        Parameters
+        ----------
+        expression : str
+            The query, e.g. "phenotype: neuron & ~outlier | pooled"
+
+        Returns
+        -------
+        row_ids : pandas.Index
+            Matching rows, in their original order
+
+        Raises
+        ------
+        KeyError
+            If the query names a subset which doesn't exist
+        ValueError
+            If the query can't be parsed
+        """
+        return self.index[self.query_mask(expression)]
+
+    def __getitem__(self, name):
+        if name in self._extra:
+            return self._extra[name]
+        if name in self._positions:
+            # Row positions are stored sorted, so the original order is kept
+            return self.index[np.sort(self._rows(name))]
+        if name in self._complements:
+            return self.index[self.mask(name)]
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        # Like a dict, raises TypeError for unhashable names such as lists
+        return name in self._positions or name in self._complements \
+            or name in self._extra
+
+    def __iter__(self):
+        for name in self.names:
+            if name not in self._extra:
+                yield name
+        for name in self._complements:
+            if name not in self._positions and name not in self._extra:
+                yield name
+        for name in self._extra:
+            yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '<{} of {} rows, {} subsets>'.format(
+            self.__class__.__name__, len(self.index), len(self))
+
+    def _combine(self, names, combine):
+        if not names:
+            return self.index[:0]
+        mask = self.mask(names[0])
+        for name in names[1:]:
+            mask = combine(mask, self.mask(name))
+        return self.index[mask]
+
+    def union(self, *names):
+        """Row ids in any of the named subsets"""
+        return self._combine(names, np.logical_or)
+
+    def intersection(self, *names):
+        """Row ids in all of the named subsets"""
+        return self._combine(names, np.logical_and)
+
+    def difference(self, name, *others):
+        """Row ids in the first named subset but none of the others"""
+        mask = self.mask(name)
+        for other in others:
+            mask &= ~self.mask(other)
+        return self.index[mask]
+
+
+class _QueryParser(object):
+    """Evaluate a subset query as it is parsed, by recursive descent::
+
+        expression := term ('|' term)*
+        term := factor ('&' factor)*
+        factor := '~' factor | '(' expression ')' | subset name
+
+    Subset names may themselves contain spaces and parentheses, e.g.
+    "not (phenotype: neuron)", so the longest known name is matched first.
+    """
+    operators = '&|~()'
+
+    def __init__(self, subsets, expression):
+        self.subsets = subsets
+        self.tokens = self._tokenize(expression)
+        self.position = 0
+
+    def _tokenize(self, expression):
+        names = sorted(self.subsets, key=len, reverse=True)
+        tokens = []
+        i = 0
+        while i < len(expression):
+            if expression[i].isspace():
+                i += 1
+                continue
+            for name in names:
+                if expression.startswith(name, i):
+                    end = i + len(name)
+                    rest = expression[end:].lstrip()
+                    if not rest or rest[0] in '&|)':
+                        tokens.append(('name', name))
+                        i = end
+                        break
+            else:
+                if expression[i] in self.operators:
+                    tokens.append((expression[i], expression[i]))
+                    i += 1
+                else:
+                    # Not a known subset, which raises a KeyError when
+                    # evaluated
+                    end = i
+                    while end < len(expression) and \
+                            expression[end] not in self.operators:
+                        end += 1
+                    tokens.append(('name', expression[i:end].strip()))
+                    i = end
+        return tokens
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError('Empty subset query')
+        bits = self._expression()
+        if self.position < len(self.tokens):
+            raise ValueError('Unexpected "{}" in subset query'.format(
+                self.tokens[self.position][1]))
+        return bits
+
+    def _expression(self):
+        bits = self._term()
+        while self._peek() == '|':
+            self.position += 1
+            bits = bits | self._term()
+        return bits
+
+    def _term(self):
+        bits = self._factor()
+        while self._peek() == '&':
+            self.position += 1
+            bits = bits & self._factor()
+        return bits
+
+    def _factor(self):
+        if self.position >= len(self.tokens):
+            raise ValueError('Subset query ended unexpectedly')
+        kind, value = self.tokens[self.position]
+        self.position += 1
+        if kind == '~':
+            return ~self._factor()
+        if kind == '(':
+            bits = self._expression()
+            if self._peek() != ')':
+                raise ValueError('Unbalanced parentheses in subset query')
+            self.position += 1
+            return bits
+        if kind == 'name':
+            return self.subsets.bits(value)
+        raise ValueError('Unexpected "{}" in subset query'.format(value))
@@ -1,12 +1,41 @@
+import cPickle
+import glob
 import gzip
+import hashlib
 import json
 import os
+import shutil
 import string
 import sys
+import tempfile
 import urllib2
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import pandas as pd
+
+from .cache import hash_object
+from .compute.chunked import ChunkedMatrix
+from .compute.sparse import SparseMatrix
 
 FLOTILLA_DOWNLOAD_DIR = os.path.expanduser('~/flotilla_projects')
 
+# Name of the directory, next to the datapackage's resource files, where
+# binary copies of the resources are kept for fast re-loading
+BINARY_CACHE_DIRNAME = '.flotilla_cache'
+
+# Ways a Study's resources can be saved: the file extension, and the
+# compression the reader of that format is given
+RESOURCE_FORMATS = {'csv': ('csv.gz', 'gzip'),
+                    'pickle_df': ('pickle', None)}
+
+# Size of the blocks that downloads are streamed to disk in
+DOWNLOAD_CHUNK_BYTES = 2 ** 20
+
+# Number of rows of a sparse or chunked matrix which are read into a dense
+# DataFrame at once when it's written to a csv resource
+WRITE_BLOCK_ROWS = 1000
+
 
 def data_package_url_to_dict(data_package_url):
     filename = check_if_already_downloaded(data_package_url)
@@ -16,15 +45,129 @@ def data_package_url_to_dict(data_package_url):
     return data_package
 
 
+def _download_info_filename(filename):
+    return _binary_cache_prefix(filename) + '.download.json'
+
+
+def _read_download_info(filename):
+    """What we know about where a downloaded file came from, or {}"""
+    try:
+        with open(_download_info_filename(filename)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_download_info(filename, info):
+    try:
+        os.mkdir(os.path.dirname(_download_info_filename(filename)))
+    except OSError:
+        pass
+    _atomic_write(_download_info_filename(filename),
+                  lambda f: json.dump(info, f))
+
+
+def downloaded_checksum(filename):
+    """MD5 of a downloaded file, only re-reading the file if it changed"""
+    info = _read_download_info(filename)
+    stat = os.stat(filename)
+    if info.get('md5') is not None and \
+            (info.get('size'), info.get('mtime')) == (stat.st_size,
+                                                      stat.st_mtime):
+        return info['md5']
+    return file_checksum(filename)
+
+
+def download(url, filename, md5=None, chunk_bytes=DOWNLOAD_CHUNK_BYTES):
+    """Stream a url to a file, resuming a previous partial download
+
+    The file is downloaded to ``filename + ".part"`` a chunk at a time, and
+    only moved to ``filename`` once it's complete (and matches ``md5``, if
+    given). If a ".part" file of the same url already exists, only the rest
+    of it is downloaded, as long as the server supports ranges and the file
+    hasn't changed on the server since (according to its ETag).
+
+    Parameters
+    ----------
+    url : str
+        HTTP url to download
+    filename : str
+        Where to save it
+    md5 : str, optional (default=None)
+        Expected hexadecimal MD5 checksum of the file
+    chunk_bytes : int, optional (default=DOWNLOAD_CHUNK_BYTES)
+        How much to read from the network and write to disk at a time
+
+    Returns
+    -------
+    filename : str
+        Where the file was saved
+
+    Raises
+    ------
+    IOError
+        If the downloaded file doesn't match ``md5``
+    """
+    partial = filename + '.part'
+    info = _read_download_info(filename)
+    offset = 0
+    headers = {}
+    if os.path.isfile(partial) and info.get('url') == url:
+        offset = os.path.getsize(partial)
+        headers['Range'] = 'bytes={}-'.format(offset)
+        if info.get('etag') is not None:
+            # Only send the rest if it's still the same file
+            headers['If-Range'] = info['etag']
+
+    try:
+        response = urllib2.urlopen(urllib2.Request(url, headers=headers))
+    except urllib2.HTTPError as e:
+        if e.code != 416:
+            raise
+        # The partial file is already as long as (or longer than) the file
+        response = urllib2.urlopen(urllib2.Request(url))
+        offset = 0
+    etag = response.info().getheader('ETag')
+    # Record where the partial download is from, so it can be resumed
+    _write_download_info(filename, {'url': url, 'etag': etag})
+
+    resumed = offset > 0 and response.getcode() == 206
+    with open(partial, 'ab' if resumed else 'wb') as f:
+        for block in iter(lambda: response.read(chunk_bytes), ''):
+            f.write(block)
+
+    checksum = file_checksum(partial)
+    if md5 is not None and checksum != md5:
+        os.remove(partial)
+        raise IOError('The MD5 checksum of {} is {}, but it should be '
+                      '{}'.format(url, checksum, md5))
+    os.rename(partial, filename)
+    stat = os.stat(filename)
+    _write_download_info(filename, {'url': url, 'etag': etag,
+                                    'md5': checksum, 'size': stat.st_size,
+                                    'mtime': stat.st_mtime})
+    return filename
+
+
 def check_if_already_downloaded(url,
                                 datapackage_name=None,
-                                download_dir=FLOTILLA_DOWNLOAD_DIR):
+                                download_dir=FLOTILLA_DOWNLOAD_DIR,
+                                md5=None):
     """If a url filename has already been downloaded, don't download it again.
 
     Parameters
     ----------
     url : str
         HTTP url of a file you want to downlaod
+    datapackage_name : str, optional (default=None)
+        Name of the datapackage this file belongs to, which is the folder
+        it's saved in. If None, ``url`` is a datapackage.json file, and the
+        name is read from it
+    download_dir : str, optional
+        Folder to save datapackage folders in. Default "~/flotilla_projects"
+    md5 : str, optional (default=None)
+        Expected hexadecimal MD5 checksum of the file. If the file was
+        already downloaded but doesn't match, it's downloaded again
 
     Returns
     -------
@@ -38,12 +181,12 @@ def check_if_already_downloaded(url,
     except OSError:
         pass
 
+    datapackage = None
     if datapackage_name is None:
-        req = urllib2.Request(url)
-        opener = urllib2.build_opener()
-        opened_url = opener.open(req)
-        datapackage = json.loads(opened_url.read())
-        datapackage_name = datapackage['name']
+        # Need the contents to know where to save it, and it's small, so
+        # read it into memory rather than downloading it twice
+        datapackage = urllib2.urlopen(urllib2.Request(url)).read()
+        datapackage_name = json.loads(datapackage)['name']
 
     package_dir = '{}/{}'.format(download_dir, datapackage_name)
 
@@ -56,17 +199,140 @@ def check_if_already_downloaded(url,
     basename = url.rsplit('/', 1)[-1]
     filename = os.path.expanduser(os.path.join(package_dir, basename))
 
-    if not os.path.isfile(filename):
+    if datapackage is not None:
+        _atomic_write(filename, lambda f: f.write(datapackage))
+    elif not os.path.isfile(filename):
         sys.stdout.write('{} has not been downloaded before.\n\tDownloading '
                          'now to {}\n'.format(url, filename))
-        req = urllib2.Request(url)
-        opener = urllib2.build_opener()
-        opened_url = opener.open(req)
-        with open(filename, 'w') as f:
-            f.write(opened_url.read())
+        download(url, filename, md5=md5)
+    elif md5 is not None and downloaded_checksum(filename) != md5:
+        sys.stdout.write('{} has changed since it was downloaded.\n\t'
+                         'Downloading it again to {}\n'.format(url, filename))
+        download(url, filename, md5=md5)
     return filename
 
 
+def _dense_row_blocks(data, block_rows=None):
+    """Rows of a DataFrame, SparseMatrix or ChunkedMatrix as DataFrames, a
+    block at a time, in the order of the index
+
+    Sparse and chunked matrices are only read into a dense DataFrame one
+    block of rows at a time, so writing them out doesn't need memory for
+    the whole dense matrix.
+    """
+    if not isinstance(data, (SparseMatrix, ChunkedMatrix)):
+        yield data
+        return
+    if data.shape[0] == 0:
+        yield data.to_dense()
+        return
+
+    block_rows = WRITE_BLOCK_ROWS if block_rows is None else block_rows
+    if isinstance(data, SparseMatrix):
+        values = data.values.tocsr()
+        for i in range(0, data.shape[0], block_rows):
+            yield pd.DataFrame(values[i:i + block_rows].toarray(),
+                               index=data.index[i:i + block_rows],
+                               columns=data.columns)
+    else:
+        for i in range(0, data.shape[0], block_rows):
+            rows = np.zeros(data.shape[0], dtype=bool)
+            rows[i:i + block_rows] = True
+            yield data.ix[rows].to_dense()
+
+
+def write_resource(data, filename, resource_format='csv', compresslevel=9):
+    """Write a DataFrame to a datapackage resource file
+
+    The data is written to a temporary file which is then renamed, so the
+    resource file is never partially written.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame, SparseMatrix or ChunkedMatrix
+        Data to write. Either way, it's read back as a DataFrame
+    filename : str
+        Where to write it
+    resource_format : "csv" | "pickle_df", optional (default="csv")
+        Gzipped csv, or uncompressed pickle
+    compresslevel : int, optional (default=9)
+        For "csv", the gzip compression level from 1 (fastest) to 9 (smallest)
+    """
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    try:
+        if resource_format == 'csv':
+            with gzip.GzipFile(tmp, 'wb', compresslevel=compresslevel) as f:
+                for i, block in enumerate(_dense_row_blocks(data)):
+                    block.to_csv(f, header=i == 0)
+        else:
+            if isinstance(data, (SparseMatrix, ChunkedMatrix)):
+                data = data.to_dense()
+            with open(tmp, 'wb') as f:
+                cPickle.dump(data, f, protocol=2)
+        os.rename(tmp, filename)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def copy_resource(source, filename):
+    """Copy a resource file unchanged, unless it's already there
+
+    Like :py:func:`write_resource`, the copy is made to a temporary file
+    which is then renamed.
+    """
+    if os.path.abspath(source) == os.path.abspath(filename):
+        return
+    if os.path.isfile(filename) \
+            and os.path.getsize(filename) == os.path.getsize(source) \
+            and file_checksum(filename) == file_checksum(source):
+        return
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    try:
+        shutil.copyfile(source, tmp)
+        os.rename(tmp, filename)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _saved_fingerprint_filename(filename):
+    return _binary_cache_prefix(filename) + '.saved.json'
+
+
+def read_saved_fingerprint(filename):
+    """Fingerprint of the data last saved to this resource file
+
+    Returns None if the file wasn't saved by :py:func:`write_resource` with
+    :py:func:`write_saved_fingerprint`, or if it changed since then.
+    """
+    try:
+        with open(_saved_fingerprint_filename(filename)) as f:
+            saved = json.load(f)
+        stat = os.stat(filename)
+    except (IOError, OSError, ValueError):
+        return None
+    if (saved['size'], saved['mtime']) != (stat.st_size, stat.st_mtime):
+        return None
+    return saved['fingerprint']
+
+
+def write_saved_fingerprint(filename, fingerprint):
+    """Remember the fingerprint of the data which was saved to a file"""
+    stat = os.stat(filename)
+    saved = {'fingerprint': fingerprint, 'size': stat.st_size,
+             'mtime': stat.st_mtime}
+    prefix = _binary_cache_prefix(filename)
+    try:
+        os.mkdir(os.path.dirname(prefix))
+    except OSError:
+        pass
+    _atomic_write(_saved_fingerprint_filename(filename),
+                  lambda f: json.dump(saved, f))
+
+
 def make_study_datapackage(name, metadata,
                            expression_data=None,
                            splicing_data=None,
@@ -86,9 +352,38 @@ def make_study_datapackage(name, metadata,
                            splicing_feature_data=None,
                            splicing_feature_kws=None,
                            host="sauron.ucsd.edu",
-                           host_destination='/zfs/www/flotilla_packages/'):
+                           host_destination='/zfs/www/flotilla_packages/',
+                           resource_format='csv', compresslevel=9,
+                           n_jobs=None, copy_resources=None):
     """Example code for making a datapackage for a Study
+
+    Only resources whose data changed since they were last written here are
+    written again, and those are written at the same time in separate
+    threads. So saving a study after changing only the metadata is fast.
+
+    Parameters
+    ----------
+    resource_format : "csv" | "pickle_df", optional (default="csv")
+        How to save the data. "csv" is a gzipped csv file, which can be
+        read by anything. "pickle_df" is an uncompressed, binary pickle of
+        the DataFrame, which is much faster to write and read but can only be
+        read by Python
+    compresslevel : int, optional (default=9)
+        For "csv", the gzip compression level from 1 (fastest) to 9 (smallest)
+    n_jobs : int, optional (default=None)
+        Maximum number of resources to write at once. If None, write all
+        the changed resources at once
+    copy_resources : dict, optional (default=None)
+        Resources whose files are copied into the datapackage unchanged,
+        e.g. data which was never loaded, as ``{name: (filename,
+        resource)}``. ``resource`` is the resource's dict in the datapackage
+        it came from, whose format and other keys are kept
     """
+    if resource_format not in RESOURCE_FORMATS:
+        raise ValueError('resource_format must be one of {}, not "{}"'.format(
+            ', '.join(sorted(RESOURCE_FORMATS)), resource_format))
+    extension, compression = RESOURCE_FORMATS[resource_format]
+
     if ' ' in name:
         raise ValueError("Datapackage name cannot have any spaces")
     if set(string.uppercase) & set(name):
@@ -121,6 +416,7 @@ def make_study_datapackage(name, metadata,
                                       splicing_feature_kws)}
 
     datapackage['resources'] = []
+    to_write = []
     for resource_name, (data, kws) in resources.items():
         if data is None:
             continue
@@ -128,9 +424,11 @@ def make_study_datapackage(name, metadata,
         datapackage['resources'].append({'name': resource_name})
         resource = datapackage['resources'][-1]
 
-        data_filename = '{}/{}.csv.gz'.format(datapackage_dir, resource_name)
-        with gzip.open(data_filename, 'wb') as f:
-            data.to_csv(f)
+        data_filename = '{}/{}.{}'.format(datapackage_dir, resource_name,
+                                          extension)
+        fingerprint = hash_object(data)
+        if fingerprint != read_saved_fingerprint(data_filename):
+            to_write.append((data, data_filename, fingerprint))
         # try:
         # # TODO: only transmit data if it has been updated
         # subprocess.call(
@@ -140,12 +438,42 @@ def make_study_datapackage(name, metadata,
         #     sys.stderr.write("error sending data to host: {}".format(e))
 
         resource['path'] = data_filename
-        resource['compression'] = 'gzip'
-        resource['format'] = 'csv'
+        if compression is not None:
+            resource['compression'] = compression
+        resource['format'] = resource_format
         if kws is not None:
             for key, value in kws.iteritems():
                 resource[key] = value
 
+    copy_resources = {} if copy_resources is None else copy_resources
+    for resource_name, (filename, source) in copy_resources.items():
+        basename = os.path.basename(filename)
+        extension = basename.split('.', 1)[1] if '.' in basename else ''
+        data_filename = '{}/{}.{}'.format(datapackage_dir, resource_name,
+                                          extension).rstrip('.')
+        copy_resource(filename, data_filename)
+
+        resource = dict((key, value) for key, value in source.iteritems()
+                        if key not in ('url', 'hash'))
+        resource.update(name=resource_name, path=data_filename)
+        datapackage['resources'].append(resource)
+
+    def write(args):
+        data, data_filename, fingerprint = args
+        write_resource(data, data_filename, resource_format, compresslevel)
+        write_saved_fingerprint(data_filename, fingerprint)
+
+    if len(to_write) > 1 and n_jobs != 1:
+        n_jobs = len(to_write) if n_jobs is None else n_jobs
+        pool = ThreadPool(min(n_jobs, len(to_write)))
+        try:
+            pool.map(write, to_write)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        map(write, to_write)
+
     filename = '{}/datapackage.json'.format(datapackage_dir)
     with open(filename, 'w') as f:
         json.dump(datapackage, f, indent=2)
@@ -180,6 +508,428 @@ def make_feature_datapackage():
             ]}
 
 
+def file_checksum(filename, blocksize=2 ** 20):
+    """MD5 hex digest of a file's contents, read in blocks
+
+    Parameters
+    ----------
+    filename : str
+        Path to the file
+    blocksize : int, optional (default=1MB)
+        Number of bytes to read at a time
+
+    Returns
+    -------
+    checksum : str
+        Hexadecimal MD5 digest of the file
+    """
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _binary_cache_prefix(filename):
+    """Prefix of the binary cache files of a resource file"""
+    filename = os.path.abspath(filename)
+    return os.path.join(os.path.dirname(filename), BINARY_CACHE_DIRNAME,
+                        os.path.basename(filename))
+
+
+def _binary_cache_manifest(filename, suffix='.json'):
+    """Read the binary cache manifest of a resource file, or None"""
+    try:
+        with open(_binary_cache_prefix(filename) + suffix) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _file_manifest(filename):
+    """Size, modification time and checksum of a file, to tell whether
+    anything cached from it is still up to date"""
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime,
+            'md5': file_checksum(filename)}
+
+
+def _manifest_up_to_date(filename, manifest):
+    """Whether the file has the same size and modification time as in the
+    manifest, or if those changed, the same MD5 checksum"""
+    stat = os.stat(filename)
+    if (stat.st_size, stat.st_mtime) != (manifest['size'],
+                                         manifest['mtime']):
+        if stat.st_size != manifest['size'] \
+                or file_checksum(filename) != manifest['md5']:
+            return False
+    return True
+
+
+def _atomic_write(filename, writer):
+    """Call ``writer`` on a temporary file, then move it to ``filename``
+
+    This way, a partially written file is never mistaken for a complete one
+    """
+    directory = os.path.dirname(filename)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer(f)
+        os.rename(tmp, filename)
+    except:
+        os.remove(tmp)
+        raise
+
+
+def _float32_filename(prefix, md5):
+    """The float32 copy of a cached matrix is named by the checksum of the
+    resource file it came from, so a changed file never reuses it"""
+    return '{}.{}.float32.npy'.format(prefix, md5)
+
+
+def _float32_memmap(prefix, md5):
+    """Read-only, memory-mapped float32 copy of a cached numeric matrix
+
+    The float32 file is created from the cached matrix the first time it's
+    needed. Every process which maps the same file shares the operating
+    system's page cache, rather than each holding its own copy in memory.
+    """
+    filename = _float32_filename(prefix, md5)
+    if not os.path.exists(filename):
+        values = np.load(prefix + '.values.npy').astype(np.float32)
+        _atomic_write(filename, lambda f: np.save(f, values))
+    return np.load(filename, mmap_mode='r')
+
+
+def _remove_stale_float32(prefix, md5):
+    """Remove float32 copies made from older versions of a resource file
+
+    Memory maps of a removed file stay valid until they're closed, so this
+    doesn't affect DataFrames which are already loaded
+    """
+    current = _float32_filename(prefix, md5)
+    for filename in glob.glob(prefix + '.*.float32.npy'):
+        if filename != current:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+def read_binary_cache(filename, reader_name, compression=None, mmap=False):
+    """Read a resource from its binary cache, if the cache is up to date
+
+    The cache is up to date if the resource file has the same size and
+    modification time as when the cache was written, or if those changed
+    but the MD5 checksum is still the same (e.g. the file was copied).
+
+    Parameters
+    ----------
+    filename : str
+        Path to the original (text) resource file
+    reader_name : str
+        Name of the function used to read the original file, e.g. "load_csv"
+    compression : str, optional (default=None)
+        Compression of the original file, e.g. "gzip"
+    mmap : bool, optional (default=False)
+        If True and the resource is a numeric matrix, return a DataFrame
+        backed by a read-only, memory-mapped float32 file instead of
+        reading the values into memory
+
+    Returns
+    -------
+    data : pandas.DataFrame or None
+        The resource data, or None if there is no up-to-date cache
+    """
+    manifest = _binary_cache_manifest(filename)
+    if manifest is None or manifest['reader'] != reader_name \
+            or manifest['compression'] != compression \
+            or not _manifest_up_to_date(filename, manifest):
+        return None
+
+    prefix = _binary_cache_prefix(filename)
+    try:
+        if manifest['layout'] == 'matrix':
+            if mmap:
+                values = _float32_memmap(prefix, manifest['md5'])
+            else:
+                values = np.load(prefix + '.values.npy')
+            with open(prefix + '.labels.pkl', 'rb') as f:
+                index, columns = cPickle.load(f)
+            return pd.DataFrame(values, index=index, columns=columns)
+        else:
+            return pd.read_pickle(prefix + '.pkl')
+    except (IOError, OSError, ValueError, EOFError,
+            cPickle.UnpicklingError):
+        return None
+
+
+def write_binary_cache(data, filename, reader_name, compression=None):
+    """Write a binary copy of a resource, next to the original file
+
+    DataFrames with a single numeric dtype are stored as a numpy matrix plus
+    their index and columns, everything else is pickled. If the directory is
+    not writable, nothing is cached.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Resource data, as read from ``filename``
+    filename : str
+        Path to the original (text) resource file
+    reader_name : str
+        Name of the function used to read the original file, e.g. "load_csv"
+    compression : str, optional (default=None)
+        Compression of the original file, e.g. "gzip"
+    """
+    prefix = _binary_cache_prefix(filename)
+    manifest = _file_manifest(filename)
+    manifest.update(reader=reader_name, compression=compression)
+    _remove_stale_float32(prefix, manifest['md5'])
+
+    dtypes = set(data.dtypes) if isinstance(data, pd.DataFrame) else set()
+    if len(dtypes) == 1 and np.issubdtype(dtypes.pop(), np.number):
+        manifest['layout'] = 'matrix'
+    else:
+        manifest['layout'] = 'pickle'
+
+    try:
+        try:
+            os.mkdir(os.path.dirname(prefix))
+        except OSError:
+            pass
+        if manifest['layout'] == 'matrix':
+            _atomic_write(prefix + '.values.npy',
+                          lambda f: np.save(f, data.values))
+            _atomic_write(prefix + '.labels.pkl',
+                          lambda f: cPickle.dump((data.index, data.columns),
+                                                 f, protocol=2))
+        else:
+            _atomic_write(prefix + '.pkl',
+                          lambda f: cPickle.dump(data, f, protocol=2))
+        # Write the manifest last, so it only exists for a complete cache
+        _atomic_write(prefix + '.json', lambda f: json.dump(manifest, f))
+    except (IOError, OSError) as e:
+        sys.stderr.write('Could not write binary cache of {}: {}\n'.format(
+            filename, e))
+
+
+def load_resource(filename, reader, compression=None, binary_cache=True,
+                  mmap=False):
+    """Read a datapackage resource, via its binary cache if possible
+
+    Parameters
+    ----------
+    filename : str
+        Path to the resource file
+    reader : function
+        Function to read the resource, e.g. :py:func:`flotilla.util.load_csv`
+    compression : str, optional (default=None)
+        Compression of the resource file, e.g. "gzip"
+    binary_cache : bool, optional (default=True)
+        If True, read from the binary cache in the ``.flotilla_cache``
+        directory next to ``filename`` if it is up to date, otherwise read
+        with ``reader`` and write the binary cache for next time
+    mmap : bool, optional (default=False)
+        If True and the resource is a numeric matrix, back it with a
+        read-only, memory-mapped float32 file in the binary cache, so the
+        values aren't held in this process's memory. Implies
+        ``binary_cache=True``.
+
+    Returns
+    -------
+    data : pandas.DataFrame
+        The data of the resource
+    """
+    if not (binary_cache or mmap):
+        return reader(filename, compression=compression)
+
+    data = read_binary_cache(filename, reader.__name__, compression, mmap)
+    if data is None:
+        data = reader(filename, compression=compression)
+        write_binary_cache(data, filename, reader.__name__, compression)
+        if mmap:
+            # Swap the freshly parsed values for the memory-mapped ones
+            mapped = read_binary_cache(filename, reader.__name__,
+                                       compression, mmap)
+            data = data if mapped is None else mapped
+    return data
+
+
+def load_chunked_resource(filename, sep=',', compression=None):
+    """Read a samples x features resource as a ChunkedMatrix, which is kept
+    on disk in blocks of samples rather than read into memory
+
+    The first time, the text file is copied into blocks in the
+    ``.flotilla_cache`` directory next to it, one block at a time. After
+    that, the blocks are used as long as the file hasn't changed. Each
+    version of the file gets its own directory of blocks, and old versions
+    are never removed, because matrices which were loaded earlier may still
+    be reading from them. Delete the ``.flotilla_cache`` directory to
+    reclaim their space.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the resource file
+    sep : str, optional (default=",")
+        Column separator of the file, e.g. "\\t" for tsv files
+    compression : str, optional (default=None)
+        Compression of the resource file, e.g. "gzip"
+
+    Returns
+    -------
+    data : flotilla.compute.chunked.ChunkedMatrix
+        The data of the resource
+    """
+    prefix = _binary_cache_prefix(filename)
+    cache_dir = os.path.dirname(prefix)
+    manifest = _binary_cache_manifest(filename, '.chunked.json')
+    if manifest is not None and 'directory' in manifest \
+            and manifest['sep'] == sep \
+            and manifest['compression'] == compression \
+            and _manifest_up_to_date(filename, manifest):
+        try:
+            return ChunkedMatrix(os.path.join(cache_dir,
+                                              manifest['directory']))
+        except (IOError, OSError, ValueError, EOFError,
+                cPickle.UnpicklingError):
+            pass
+
+    manifest = _file_manifest(filename)
+    manifest.update(sep=sep, compression=compression)
+    version = hashlib.md5(repr((manifest['md5'], sep, compression)))
+    directory = '{}.{}.chunked'.format(prefix, version.hexdigest())
+    manifest['directory'] = os.path.basename(directory)
+
+    if not os.path.isdir(directory):
+        # Write to a new directory, then move it into place, so a partially
+        # written one is never used
+        try:
+            os.mkdir(cache_dir)
+        except OSError:
+            pass
+        tmp = tempfile.mkdtemp(dir=cache_dir, suffix='.tmp')
+        try:
+            ChunkedMatrix.from_csv(filename, tmp, sep=sep,
+                                   compression=compression)
+        except:
+            shutil.rmtree(tmp)
+            raise
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            # Another process finished this version first, and its blocks
+            # may already be in use, so keep them
+            shutil.rmtree(tmp)
+
+    _atomic_write(prefix + '.chunked.json', lambda f: json.dump(manifest, f))
+    return ChunkedMatrix(directory)
+
+
+def resource_filename(resource, datapackage_name, datapackage_dir=None):
+    """Location of a resource on this computer, downloading it if necessary
+
+    Parameters
+    ----------
+    resource : dict
+        A resource from a datapackage, with either a "url" or a "path", and
+        optionally the "hash" (MD5 checksum) of the file
+    datapackage_name : str
+        Name of the datapackage, which is the folder downloaded resources
+        are saved to
+    datapackage_dir : str, optional (default=None)
+        If the resource's path doesn't exist, look for it relative to this
+        directory, e.g. the folder containing the datapackage.json file
+
+    Returns
+    -------
+    filename : str
+        Location of the resource's file
+    """
+    if 'url' in resource:
+        return check_if_already_downloaded(resource['url'], datapackage_name,
+                                           md5=resource.get('hash'))
+
+    filename = resource['path']
+    if datapackage_dir is not None and not os.path.isfile(filename):
+        filename = os.path.join(datapackage_dir, filename)
+    return filename
+
+
+def load_resources(resources, datapackage_name, readers,
+                   datapackage_dir=None, binary_cache=True, mmap=(),
+                   chunked=(), n_jobs=None):
+    """Download (if necessary) and read several resources at once
+
+    Each resource is read in its own thread, so the time to load all of them
+    is about the time to load the biggest one, rather than the sum. Threads
+    rather than processes are used so the (possibly huge) DataFrames don't
+    have to be pickled back to this process; downloading, decompressing and
+    reading binary caches all release the GIL.
+
+    Parameters
+    ----------
+    resources : list of dict
+        Resources from a datapackage, with "name" and "format" and either a
+        "url" or a "path"
+    datapackage_name : str
+        Name of the datapackage, which is the folder downloaded resources
+        are saved to
+    readers : dict
+        Mapping of resource formats, e.g. "csv", to the function which reads
+        that format
+    datapackage_dir : str, optional (default=None)
+        Directory to look for resources in, if their path doesn't exist
+    binary_cache : bool, optional (default=True)
+        Whether to read and write binary copies of the resources. See
+        :py:func:`load_resource`
+    mmap : list-like, optional (default=())
+        Names of the resources to memory-map. See :py:func:`load_resource`
+    chunked : list-like, optional (default=())
+        Names of the csv or tsv resources to keep on disk as a
+        :py:class:`.ChunkedMatrix`, rather than reading them into memory.
+        See :py:func:`load_chunked_resource`
+    n_jobs : int, optional (default=None)
+        Maximum number of resources to read at once. If None, read all of
+        them at once
+
+    Returns
+    -------
+    dfs : dict
+        Mapping of resource names to their data
+    """
+    def load(resource):
+        filename = resource_filename(resource, datapackage_name,
+                                     datapackage_dir)
+        if resource['name'] in chunked and \
+                resource['format'] in ('csv', 'tsv'):
+            sep = '\t' if resource['format'] == 'tsv' else ','
+            return load_chunked_resource(
+                filename, sep=sep, compression=resource.get('compression'))
+        # Pickles are already a fast binary format
+        return load_resource(filename, readers[resource['format']],
+                             compression=resource.get('compression'),
+                             binary_cache=binary_cache
+                             and resource['format'] != 'pickle_df',
+                             mmap=resource['name'] in mmap)
+
+    resources = list(resources)
+    if len(resources) <= 1 or n_jobs == 1:
+        data = map(load, resources)
+    else:
+        n_jobs = len(resources) if n_jobs is None else n_jobs
+        pool = ThreadPool(min(n_jobs, len(resources)))
+        try:
+            data = pool.map(load, resources)
+        finally:
+            pool.close()
+            pool.join()
+    return dict((resource['name'], df)
+                for resource, df in zip(resources, data))
+
+
 def get_resource_from_name(datapackage, name):
     for resource in datapackage['resources']:
         if resource['name'] == name:
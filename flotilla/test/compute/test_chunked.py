@@ -0,0 +1,110 @@
+"""Test matrices kept on disk in blocks of rows"""
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def dense():
+    np.random.seed(0)
+    values = np.random.lognormal(size=(55, 12))
+    values[0, 0] = np.nan
+    values[30, 3] = np.nan
+    return pd.DataFrame(values,
+                        index=['sample_{}'.format(i) for i in range(55)],
+                        columns=['gene_{}'.format(i) for i in range(12)])
+
+
+@pytest.fixture
+def chunked(dense, tmpdir):
+    from flotilla.compute.chunked import ChunkedMatrix
+
+    # Blocks of 10 rows, so there's an uneven leftover block
+    return ChunkedMatrix.from_dataframe(dense, str(tmpdir.join('matrix')),
+                                        block_rows=10, dtype=np.float64)
+
+
+def test_from_csv(dense, tmpdir):
+    from flotilla.compute.chunked import ChunkedMatrix
+
+    filename = str(tmpdir.join('matrix.csv'))
+    dense.to_csv(filename)
+    chunked = ChunkedMatrix.from_csv(filename, str(tmpdir.join('matrix')),
+                                     block_rows=10)
+    pdt.assert_frame_equal(chunked.to_dense(), dense, check_less_precise=True)
+
+
+def test_statistics(dense, chunked):
+    pdt.assert_series_equal(chunked.count(), dense.count())
+    pdt.assert_series_equal(chunked.count_greater(1),
+                            dense[dense > 1].count())
+    pdt.assert_series_equal(chunked.sum(), dense.sum())
+    pdt.assert_series_equal(chunked.mean(), dense.mean())
+    pdt.assert_series_equal(chunked.var(), dense.var())
+    pdt.assert_series_equal(chunked.std(ddof=0), dense.std(ddof=0))
+
+
+def test_ix(dense, chunked):
+    rows = dense.index[::-3]
+    columns = dense.columns[[5, 1, 2]]
+    subset = chunked.ix[rows, columns]
+    pdt.assert_frame_equal(subset.to_dense(), dense.ix[rows, columns])
+    pdt.assert_series_equal(subset.mean(), dense.ix[rows, columns].mean())
+
+    # Subsetting a subset
+    pdt.assert_frame_equal(subset.ix[rows[:4], columns[1:]].to_dense(),
+                           dense.ix[rows[:4], columns[1:]])
+    mask = (dense.mean() > 1.5).values
+    pdt.assert_frame_equal(chunked.ix[:, mask].to_dense(), dense.ix[:, mask])
+    pdt.assert_series_equal(chunked['gene_1'], dense['gene_1'])
+
+
+def test_fillna_transform_values(dense, chunked):
+    subset = chunked.fillna(dense.mean()).ix[:, ['gene_3', 'gene_0']]
+    pdt.assert_frame_equal(subset.to_dense(),
+                           dense.fillna(dense.mean())[['gene_3', 'gene_0']])
+    pdt.assert_frame_equal(chunked.transform_values(np.log2).to_dense(),
+                           np.log2(dense))
+
+
+def test_iter_blocks_min_rows(chunked):
+    subset = chunked.ix[chunked.index[::2]]
+    sizes = [len(block) for block in subset.iter_blocks(min_rows=8)]
+    assert sum(sizes) == subset.shape[0]
+    assert min(sizes) >= 8
+
+
+def test_chunked_matrix_pca(dense, chunked):
+    from flotilla.compute.decomposition import ChunkedMatrixPCA, DataFramePCA
+
+    dense = dense.fillna(dense.mean())
+    test = ChunkedMatrixPCA(chunked.fillna(dense.mean()), n_components=3)
+
+    standardized = (dense - dense.mean()) / dense.std(ddof=0)
+    true = DataFramePCA(standardized, n_components=3)
+
+    # IncrementalPCA is approximate, and components are only defined up to
+    # their sign
+    npt.assert_allclose(test.reduced_space.abs(), true.reduced_space.abs(),
+                        rtol=1e-2, atol=1e-2)
+    npt.assert_allclose(test.explained_variance_ratio_,
+                        true.explained_variance_ratio_, rtol=1e-2)
+
+
+def test_expression_data_chunked(dense, chunked):
+    from flotilla.compute.chunked import ChunkedMatrix
+    from flotilla.data_model import ExpressionData
+
+    expression = ExpressionData(chunked, thresh=1, minimum_samples=20,
+                                log_base=2)
+    assert isinstance(expression.data, ChunkedMatrix)
+
+    true = ExpressionData(dense, thresh=1, minimum_samples=20, log_base=2)
+    pdt.assert_frame_equal(expression.data.to_dense(), true.data)
+    pdt.assert_index_equal(expression.variant, true.variant)
+
+    reduced = expression.reduce(sample_ids=dense.index[5:])
+    assert reduced.reduced_space.shape[0] == dense.shape[0] - 5
+    assert set(reduced.components_.columns) == set(true.data.columns)
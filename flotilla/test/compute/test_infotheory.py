@@ -56,6 +56,27 @@ def test_binify(bins, df1):
     pdt.assert_frame_equal(binned, true_binned)
 
 
+def test_binify_nan_and_chunks(bins, df1):
+    from flotilla.compute.infotheory import binify
+
+    df = df1.copy()
+    df.iloc[0, 0] = np.nan
+    df.iloc[1, 0] = 1.5
+    df.iloc[2, 1] = 1
+    df.iloc[:, 2] = np.nan
+
+    # Chunks of one column at a time
+    binned = binify(df, bins, chunk_bytes=1)
+
+    true_binned = df.apply(lambda x: pd.Series(
+        np.histogram(x.dropna(), bins=bins)[0]))
+    true_binned.index = binned.index
+    true_binned = true_binned / true_binned.sum().astype(float)
+
+    pdt.assert_frame_equal(binned, true_binned)
+    pdt.assert_frame_equal(binify(df, bins), binned)
+
+
 def test_kld(p, q):
     from flotilla.compute.infotheory import kld
 
@@ -96,4 +117,13 @@ def test_entropy(p, base):
 
     true_result = -((np.log(p) / np.log(base)) * p).sum(axis=0)
 
-    pdt.assert_series_equal(result, true_result)
\ No newline at end of file
+    pdt.assert_series_equal(result, true_result)
+
+
+def test_pairwise_jsd(p, q):
+    from flotilla.compute.infotheory import jsd, pairwise_jsd
+
+    result = pairwise_jsd(p.values.T, q.values.T)
+
+    true_result = np.array([[jsd(p[i], q[j]) for j in q] for i in p])
+    npt.assert_array_almost_equal(result, true_result)
@@ -1 +1,69 @@
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+
 __author__ = 'olga'
+
+
+def test_sqrt_jsd_modalities():
+    from flotilla.compute.infotheory import binify, jsd
+    from flotilla.compute.splicing import Modalities
+
+    np.random.seed(0)
+    psi = pd.DataFrame(np.random.uniform(size=(20, 50)))
+    psi.iloc[:10, 1] = 0
+    psi.iloc[:10, 2] = 1
+    psi.iloc[:, 3] = np.nan
+    modalities = Modalities()
+    binned = binify(psi, modalities.bins)
+
+    result = modalities.sqrt_jsd_modalities(binned)
+
+    true_modalities = modalities.true_modalities.copy()
+    true_modalities.index = binned.index
+    true_result = np.sqrt(binned.apply(
+        lambda col: true_modalities.apply(lambda q: jsd(col, q), axis=0),
+        axis=0))
+    # Events without any values have no divergence from anything
+    true_result[3] = np.nan
+
+    pdt.assert_frame_equal(result, true_result)
+    pdt.assert_series_equal(modalities.assignments(result),
+                            modalities.assignments(true_result))
+
+
+def test_bootstrapped_fit_transform():
+    from flotilla.compute.splicing import Modalities
+
+    np.random.seed(0)
+    psi = pd.DataFrame(np.random.uniform(size=(20, 30)))
+    psi.iloc[:, 0] = np.random.uniform(0, 0.1, size=20)
+    psi.iloc[:18, 1] = np.nan
+    modalities = Modalities()
+    n_iter = 20
+
+    result = modalities._bootstrapped_fit_transform(
+        psi, n_iter=n_iter, min_samples=10, n_jobs=1, random_state=0)
+
+    # Fit each resample on its own, using the same draws
+    draws = np.random.RandomState(0).randint(0, 20, size=(n_iter, 20))
+    assignments = pd.DataFrame(
+        [modalities._single_fit_transform(
+            psi.iloc[draw].dropna(axis=1, thresh=10), do_not_memoize=True)
+         for draw in draws], columns=psi.columns)
+    fractions = assignments.apply(
+        lambda x: x.value_counts() / float(x.count()) if x.count()
+        else pd.Series())
+    true_result = fractions.apply(
+        lambda x: x.idxmax() if (x >= 0.6).any() else 'unassigned')
+    true_result = true_result.reindex(psi.columns).fillna('unassigned')
+
+    pdt.assert_series_equal(result, true_result, check_dtype=False,
+                            check_names=False)
+    assert result[0] == 'excluded'
+    assert result[1] == 'unassigned'
+
+    # The same resamples no matter how the work is split up
+    pdt.assert_series_equal(
+        modalities._bootstrapped_fit_transform(psi, n_iter=n_iter, n_jobs=4),
+        result)
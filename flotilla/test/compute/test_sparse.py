@@ -0,0 +1,107 @@
+"""Test labeled sparse matrices and sparse PCA"""
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def dense():
+    """Mostly-zero counts, with a few missing values"""
+    np.random.seed(0)
+    values = np.random.poisson(0.3, size=(30, 20)).astype(float)
+    values[0, 0] = np.nan
+    values[5, 3] = np.nan
+    return pd.DataFrame(values,
+                        index=['sample_{}'.format(i) for i in range(30)],
+                        columns=['gene_{}'.format(i) for i in range(20)])
+
+
+@pytest.fixture
+def sparse_matrix(dense):
+    from flotilla.compute.sparse import SparseMatrix
+
+    return SparseMatrix.from_dataframe(dense, dtype=np.float64)
+
+
+def test_from_dataframe(dense, sparse_matrix):
+    assert sparse_matrix.shape == dense.shape
+    assert sparse_matrix.values.nnz < dense.size
+    pdt.assert_frame_equal(sparse_matrix.to_dense(), dense)
+
+
+def test_statistics(dense, sparse_matrix):
+    pdt.assert_series_equal(sparse_matrix.count(), dense.count())
+    pdt.assert_series_equal(sparse_matrix.count_greater(1),
+                            dense[dense > 1].count())
+    pdt.assert_series_equal(sparse_matrix.count_greater(-1),
+                            dense[dense > -1].count())
+    pdt.assert_series_equal(sparse_matrix.mean(), dense.mean())
+    pdt.assert_series_equal(sparse_matrix.var(), dense.var())
+    pdt.assert_series_equal(sparse_matrix.std(ddof=0), dense.std(ddof=0))
+
+
+def test_ix(dense, sparse_matrix):
+    rows = dense.index[::3]
+    columns = dense.columns[dense.count() == dense.shape[0]]
+    pdt.assert_frame_equal(sparse_matrix.ix[rows, columns].to_dense(),
+                           dense.ix[rows, columns])
+    pdt.assert_frame_equal(sparse_matrix.ix[rows].to_dense(), dense.ix[rows])
+
+    mask = (dense.mean() > 0.3).values
+    pdt.assert_frame_equal(sparse_matrix.ix[:, mask].to_dense(),
+                           dense.ix[:, mask])
+    pdt.assert_series_equal(sparse_matrix.ix[:, 'gene_1'],
+                            dense.ix[:, 'gene_1'])
+
+
+def test_fillna(dense, sparse_matrix):
+    pdt.assert_frame_equal(
+        sparse_matrix.fillna(dense.mean()).to_dense(),
+        dense.fillna(dense.mean()))
+
+
+def test_sparse_matrix_pca(dense):
+    from flotilla.compute.decomposition import DataFramePCA, SparseMatrixPCA
+    from flotilla.compute.sparse import SparseMatrix
+
+    dense = dense.fillna(0)
+    test = SparseMatrixPCA(SparseMatrix.from_dataframe(dense),
+                           n_components=3)
+
+    standardized = (dense - dense.mean()) / dense.std(ddof=0)
+    true = DataFramePCA(standardized, n_components=3)
+
+    # Components are only defined up to their sign
+    npt.assert_allclose(test.reduced_space.abs(), true.reduced_space.abs(),
+                        rtol=1e-3, atol=1e-4)
+    npt.assert_allclose(test.explained_variance_ratio_,
+                        true.explained_variance_ratio_, rtol=1e-3)
+
+
+def test_expression_data_sparse(dense):
+    from flotilla.compute.sparse import SparseMatrix
+    from flotilla.data_model import ExpressionData
+
+    dense = dense.fillna(0)
+    expression = ExpressionData(dense, sparse=True, thresh=0,
+                                minimum_samples=5, plus_one=True,
+                                log_base=2)
+    assert isinstance(expression.data, SparseMatrix)
+
+    true = np.log2(dense + 1)
+    enough_samples = true[true > expression.thresh].count() >= 5
+    thresholded = expression._threshold(expression.data)
+    pdt.assert_index_equal(thresholded.columns,
+                           dense.columns[enough_samples.values])
+
+    reduced = expression.reduce()
+    assert reduced.reduced_space.shape[0] == dense.shape[0]
+
+
+def test_expression_data_sparse_plus_one_without_log(dense):
+    from flotilla.data_model import ExpressionData
+
+    with pytest.raises(ValueError):
+        ExpressionData(dense.fillna(0), sparse=True, plus_one=True)
@@ -89,4 +89,143 @@ def test__subset_and_standardize(base_data, standardize, feature_ids,
                                        columns=subset.columns)
 
     pdt.assert_frame_equal(subset_standardized, base_data.subset)
-    pdt.assert_series_equal(means, base_data.means)
\ No newline at end of file
+    pdt.assert_series_equal(means, base_data.means)
+
+
+def test_singles_pooled_outliers(example_data):
+    data = example_data.expression
+    pooled = data.index[:2]
+    outliers = data.index[[3, 5]]
+    base_data = BaseData(data, pooled=pooled, outliers=outliers)
+
+    pdt.assert_frame_equal(base_data.singles, data.ix[2:])
+    pdt.assert_frame_equal(base_data.pooled, data.ix[pooled])
+    pdt.assert_frame_equal(base_data.outliers, data.ix[outliers])
+
+    # The rows are reused until the data is replaced
+    assert base_data.outliers is base_data.outliers
+    base_data.data = base_data.data.drop(outliers[0])
+    pdt.assert_frame_equal(base_data.outliers, data.ix[outliers[1:]])
+
+    # ... or changed in place
+    base_data.data.ix[outliers[1], :] = 0
+    base_data.mark_changed('data')
+    assert (base_data.outliers.values == 0).all()
+
+
+def test_stats(example_data):
+    base_data = BaseData(example_data.expression,
+                         pooled=example_data.expression.index[[0, 2]])
+    base_data._subset(base_data.data)
+    base_data._subset(base_data.data)
+    base_data.singles
+
+    stats = base_data.stats()
+    assert stats['nbytes']['data'] >= example_data.expression.values.nbytes
+    assert 'singles' in stats['nbytes']
+    assert 'data_original' not in stats['nbytes']
+    assert stats['timings']['_subset']['calls'] == 2
+
+
+def test_feature_subsets(example_data):
+    import pandas as pd
+
+    features = example_data.expression.columns
+    feature_data = pd.DataFrame(
+        {'gene_type': ['protein_coding' if i % 2 else 'lincRNA'
+                       for i in range(len(features))],
+         'is_tf': [i % 3 == 0 for i in range(len(features))]},
+        index=features)
+    base_data = BaseData(example_data.expression, feature_data=feature_data)
+    subsets = base_data.feature_subsets
+
+    coding = features[feature_data.gene_type == 'protein_coding']
+    pdt.assert_index_equal(subsets['gene_type: protein_coding'], coding)
+    pdt.assert_index_equal(subsets['not (gene_type: protein_coding)'],
+                           features[feature_data.gene_type == 'lincRNA'])
+    pdt.assert_index_equal(subsets['is_tf'], features[feature_data.is_tf])
+    pdt.assert_index_equal(subsets['all features'], features)
+    assert 'variant' in subsets
+    pdt.assert_index_equal(
+        subsets.intersection('gene_type: protein_coding', 'is_tf'),
+        features[(feature_data.gene_type == 'protein_coding')
+                 & feature_data.is_tf])
+    pdt.assert_index_equal(
+        subsets.difference('all features', 'gene_type: protein_coding'),
+        subsets['gene_type: lincRNA'])
+
+    # Built once, and rebuilt only when the feature data changes
+    assert base_data.feature_subsets is subsets
+    base_data.feature_subset_to_feature_ids(list(features[:2]),
+                                            rename=False)
+    assert 'custom_1' in base_data.feature_subsets
+
+
+def test_feature_names(example_data):
+    import pandas as pd
+
+    features = example_data.expression.columns
+    feature_data = pd.DataFrame(
+        {'gene_name': ['gene_{}'.format(i // 2)
+                       for i in range(len(features))]},
+        index=features)
+    base_data = BaseData(example_data.expression, feature_data=feature_data,
+                         feature_rename_col='gene_name')
+
+    assert base_data.feature_renamer(features[3]) == 'gene_1'
+    pdt.assert_index_equal(base_data.rename_features(features[:4]),
+                           pd.Index(['gene_0', 'gene_0', 'gene_1', 'gene_1']))
+    pdt.assert_index_equal(
+        base_data.rename_features(['not_a_feature']),
+        pd.Index(['not_a_feature']))
+
+    pdt.assert_index_equal(base_data.maybe_renamed_to_feature_id('gene_1'),
+                           features[2:4])
+    assert base_data.maybe_renamed_to_feature_id(features[0]) == features[0]
+    pdt.assert_index_equal(
+        base_data.resolve_feature_ids(['gene_1', features[0], 'gene_0']),
+        features[[2, 3, 0, 1]])
+    with pytest.raises(ValueError):
+        base_data.resolve_feature_ids(['gene_1', 'not_a_gene'])
+
+
+def test_jsd_entropy(example_data):
+    import numpy as np
+    import pandas as pd
+    from flotilla.compute.infotheory import binify, entropy, jsd
+
+    data = example_data.expression
+    data = data.ix[:, data.std() > 0].iloc[:, :50]
+    base_data = BaseData(data)
+    groupby = pd.Series(['A', 'B', 'C'] * (data.shape[0] // 3)
+                        + ['A'] * (data.shape[0] % 3), index=data.index)
+
+    result = base_data.jsd(groupby)
+
+    scaled = (data - data.min()) / (data.max() - data.min())
+    bins = np.arange(0, 1.1, .1)
+    binned = dict((phenotype, binify(scaled.ix[samples], bins))
+                  for phenotype, samples in groupby.groupby(groupby).groups
+                  .iteritems())
+    pairs = [('A', 'B'), ('A', 'C'), ('B', 'C')]
+    true_result = pd.DataFrame(
+        [jsd(binned[first], binned[second]) for first, second in pairs],
+        index=pd.MultiIndex.from_tuples(pairs,
+                                        names=['phenotype1', 'phenotype2'])).T
+    pdt.assert_frame_equal(result, true_result)
+
+    true_entropy = pd.DataFrame(dict(
+        (phenotype, entropy(b)) for phenotype, b in binned.iteritems()))
+    pdt.assert_frame_equal(base_data.entropy(groupby), true_entropy)
+
+    # The binning is reused
+    assert base_data.binify_phenotypes(groupby)[1] is \
+        base_data.binify_phenotypes(groupby)[1]
+
+    # Features are in the order of the data, however they're asked for
+    feature_ids = data.columns[::-1][:10]
+    pdt.assert_frame_equal(base_data.jsd(groupby, feature_ids=feature_ids),
+                           true_result.ix[data.columns[-10:]])
+    pdt.assert_frame_equal(
+        base_data.jsd(groupby, feature_ids=data.columns[:1]),
+        true_result.iloc[:1])
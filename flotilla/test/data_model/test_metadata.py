@@ -0,0 +1,110 @@
+"""Test integer-coded sample metadata"""
+import numpy.testing as npt
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture
+def metadata_data():
+    samples = ['sample_{}'.format(i) for i in range(12)]
+    return pd.DataFrame(
+        {'phenotype': ['P', 'M', 'S'] * 4,
+         'pooled': [True, False, False, False] * 3,
+         'outlier': [False] * 11 + [True]}, index=samples)
+
+
+@pytest.fixture
+def metadata(metadata_data):
+    from flotilla.data_model.metadata import MetaData
+
+    return MetaData(metadata_data, phenotype_order=['P', 'M', 'S'],
+                    phenotype_to_color={'P': 'red', 'M': 'blue',
+                                        'S': 'green'})
+
+
+def test_phenotype_codes(metadata, metadata_data):
+    npt.assert_array_equal(metadata.phenotype_codes, [0, 1, 2] * 4)
+    pdt.assert_index_equal(metadata.phenotype_categories,
+                           pd.Index(['P', 'M', 'S']))
+    assert metadata.phenotype_color_order == [
+        metadata.phenotype_to_color[p] for p in ['P', 'M', 'S']]
+
+
+def test_sample_id_to_color(metadata, metadata_data):
+    true = pd.Series(dict(
+        (sample_id, metadata.phenotype_to_color[p])
+        for sample_id, p in metadata_data.phenotype.iteritems()))
+    pdt.assert_series_equal(metadata.sample_id_to_color.sort_index(),
+                            true.sort_index())
+
+    # Built once, not on every access
+    assert metadata.sample_id_to_color is metadata.sample_id_to_color
+
+
+def test_sample_colors(metadata, metadata_data):
+    sample_ids = metadata_data.index[[5, 0, 7]]
+    true = [metadata.phenotype_to_color[p]
+            for p in metadata_data.phenotype[sample_ids]]
+    npt.assert_array_equal(metadata.sample_colors(sample_ids), true)
+    npt.assert_array_equal(metadata.sample_markers(sample_ids), ['o'] * 3)
+
+    with pytest.raises(KeyError):
+        metadata.sample_colors(['not_a_sample'])
+
+
+def test_unknown_phenotype(metadata, metadata_data):
+    from flotilla.data_model.metadata import UNKNOWN_PHENOTYPE_COLOR
+
+    sample_id = metadata_data.index[0]
+    metadata.data.ix[sample_id, metadata.phenotype_col] = 'not_a_phenotype'
+    metadata.mark_changed('data')
+
+    # Re-encoded after the data changed, without falling back on the last
+    # phenotype's color
+    assert metadata.phenotype_codes[0] == -1
+    assert metadata.sample_id_to_color[sample_id] == UNKNOWN_PHENOTYPE_COLOR
+    npt.assert_array_equal(metadata.sample_colors([sample_id]),
+                           [UNKNOWN_PHENOTYPE_COLOR])
+    assert len(metadata.phenotype_color_order) == 3
+
+
+def test_flags(metadata, metadata_data):
+    npt.assert_array_equal(metadata.is_pooled, metadata_data.pooled.values)
+    npt.assert_array_equal(metadata.is_outlier, metadata_data.outlier.values)
+
+    del metadata.data['outlier']
+    assert not metadata.is_outlier.any()
+
+
+def test_sample_subsets_query(metadata, metadata_data):
+    from flotilla.data_model.subsets import SubsetIndex
+
+    subsets = SubsetIndex.from_metadata(metadata_data, 1, 'samples')
+    phenotype_p = metadata_data.phenotype == 'P'
+    pooled = metadata_data.pooled
+    outlier = metadata_data.outlier
+
+    pdt.assert_index_equal(
+        subsets.query('phenotype: P & ~outlier | pooled'),
+        metadata_data.index[(phenotype_p & ~outlier) | pooled])
+    pdt.assert_index_equal(
+        subsets.query('phenotype: P & ~(outlier | pooled)'),
+        metadata_data.index[phenotype_p & ~(outlier | pooled)])
+    pdt.assert_index_equal(
+        subsets.query('not (phenotype: P) & pooled'),
+        metadata_data.index[~phenotype_p & pooled])
+
+    with pytest.raises(KeyError):
+        subsets.query('phenotype: P & not_a_subset')
+    with pytest.raises(ValueError):
+        subsets.query('(phenotype: P | pooled')
+
+    # Boolean columns are always subsets, and rebuilt when the data changes
+    sample_subsets = metadata.sample_subsets
+    assert metadata.sample_subsets is sample_subsets
+    pdt.assert_index_equal(sample_subsets.query('~outlier'),
+                           metadata_data.index[~outlier])
+    metadata.data['outlier'] = True
+    metadata.mark_changed('data')
+    assert len(metadata.sample_subsets.query('~outlier')) == 0
@@ -11,3 +11,36 @@ from flotilla.data_model import SplicingData
 def test_splicing_init(example_data):
     splicing_data = SplicingData(example_data.splicing)
     pdt.assert_frame_equal(splicing_data.data, example_data.splicing)
+
+
+def test_downsampled_from_miso_summary(tmpdir):
+    import collections
+
+    import numpy as np
+    import pandas as pd
+
+    from flotilla.data_model import DownsampledSplicingData
+
+    n_rows = 100
+    summary = pd.DataFrame(
+        {'event_name': np.random.choice(['event_{}'.format(i)
+                                         for i in range(10)], n_rows),
+         'splice_type': np.random.choice(['SE', 'MXE'], n_rows),
+         'probability': np.random.choice([0.1, 0.5, 1.0], n_rows),
+         'iteration': np.random.randint(0, 5, n_rows)})
+    filename = str(tmpdir.join('miso_summary.tsv'))
+    summary.to_csv(filename, sep='\t', index=False)
+    sample_descriptors = pd.DataFrame({'probability': [0.1, 0.5, 1.0]})
+
+    downsampled = DownsampledSplicingData.from_miso_summary(
+        filename, sample_descriptors, chunksize=7)
+
+    true_shared_events = {}
+    for (splice_type, probability), df in summary.groupby(
+            ['splice_type', 'probability']):
+        true_shared_events[(splice_type, probability)] = pd.Series(
+            collections.Counter(df.event_name))
+    true_shared_events = pd.DataFrame(true_shared_events)
+
+    pdt.assert_frame_equal(downsampled.shared_events, true_shared_events,
+                           check_dtype=False, check_names=False)
@@ -0,0 +1,177 @@
+"""Test content-addressed hashing and the size-bounded LRU cache"""
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(np.random.randn(100, 50))
+
+
+def test_hash_object_same_contents(df):
+    from flotilla.cache import hash_object
+
+    assert hash_object(df) == hash_object(df.copy())
+
+
+def test_hash_object_different_contents(df):
+    from flotilla.cache import hash_object
+
+    # Change a value in the middle, which is truncated in str(df)
+    other = df.copy()
+    other.ix[50, 25] += 1
+    assert str(df) == str(other)
+    assert hash_object(df) != hash_object(other)
+
+
+def test_hash_object_different_labels(df):
+    from flotilla.cache import hash_object
+
+    other = df.copy()
+    other.index = other.index + 1
+    assert hash_object(df) != hash_object(other)
+
+
+def test_hash_object_object_dtype():
+    from flotilla.cache import hash_object
+
+    s1 = pd.Series(['a', 'b', 'c'])
+    s2 = pd.Series(['a', 'b', 'd'])
+    assert hash_object(s1) == hash_object(s1.copy())
+    assert hash_object(s1) != hash_object(s2)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    from flotilla.cache import LRUCache, nbytes
+
+    array = np.zeros(100)
+    cache = LRUCache(max_bytes=2 * nbytes(array))
+    cache['a'] = array
+    cache['b'] = array.copy()
+
+    # Use "a" so "b" is the least recently used
+    cache['a']
+    cache['c'] = array.copy()
+
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+    assert cache.nbytes <= cache.max_bytes
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+
+
+def test_lru_cache_too_big():
+    from flotilla.cache import LRUCache
+
+    cache = LRUCache(max_bytes=10)
+    cache['a'] = np.zeros(100)
+    assert 'a' not in cache
+    assert cache.nbytes == 0
+
+
+def test_memoize_instance_cache():
+    from flotilla.cache import LRUCache
+    from flotilla.util import memoize
+
+    class Data(object):
+        def __init__(self):
+            self.cache = LRUCache()
+            self.n_calls = 0
+
+        @memoize
+        def total(self, df):
+            self.n_calls += 1
+            return df.sum().sum()
+
+    data = Data()
+    df = pd.DataFrame(np.ones((10, 10)))
+    data.total(df)
+    data.total(df.copy())
+    assert data.n_calls == 1
+    assert data.cache.stats()['hits'] == 1
+    assert data.cache.stats()['misses'] == 1
+
+    df.ix[5, 5] = 2
+    assert data.total(df) == 101
+    assert data.n_calls == 2
+
+
+def test_result_store(df, tmpdir):
+    from flotilla.cache import ResultStore
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return df.sum()
+
+    store = ResultStore(str(tmpdir.join('results')))
+    first = store.fetch('sum', (df, {'axis': 0}), compute)
+
+    # A new store in the same directory, like in the next python session
+    store = ResultStore(str(tmpdir.join('results')))
+    second = store.fetch('sum', (df.copy(), {'axis': 0}), compute)
+    assert len(calls) == 1
+    pd.util.testing.assert_series_equal(first, second)
+    assert store.stats()['entries'] == 1
+    assert store.stats()['hits'] == 1
+
+    store.fetch('sum', (df, {'axis': 1}), compute)
+    assert len(calls) == 2
+
+    store.clear()
+    assert store.stats()['entries'] == 0
+
+    # Inputs hashed on their identity aren't saved, because another object
+    # could have the same identity in the next session
+    store.fetch('sum', (df, lambda x: x), compute)
+    assert store.stats()['entries'] == 0
+    assert store.stats()['unsaved'] == 1
+
+
+def test_lru_cache_invalidate():
+    from flotilla.cache import LRUCache
+
+    cache = LRUCache()
+    cache.set('a', 1, tags=['data'])
+    cache.set('b', 2, tags=['data', 'feature_data'])
+    cache.set('c', 3, tags=['feature_data'])
+    cache['d'] = 4
+
+    assert cache.invalidate('data') == 2
+    assert 'a' not in cache and 'b' not in cache
+    assert 'c' in cache and 'd' in cache
+    assert cache.invalidate('data') == 0
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_memoize_depends_on(df):
+    from flotilla.data_model.base import BaseData
+    from flotilla.util import memoize
+
+    class Data(BaseData):
+        n_calls = 0
+
+        @memoize(depends_on=('data',))
+        def total(self):
+            self.n_calls += 1
+            return self.data.sum().sum()
+
+    data = Data(df)
+    data.total()
+    data.total()
+    assert data.n_calls == 1
+
+    # Changing the feature data doesn't change the total
+    data.feature_data = pd.DataFrame(index=df.columns)
+    data.total()
+    assert data.n_calls == 1
+
+    data.data = df + 1
+    assert data.total() == (df + 1).sum().sum()
+    assert data.n_calls == 2
@@ -0,0 +1,563 @@
+"""Test reading and writing datapackages and their resources"""
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+
+
+@pytest.fixture(params=['numeric', 'mixed'])
+def resource_data(request):
+    data = pd.DataFrame(np.random.randn(20, 10),
+                        index=['sample_{}'.format(i) for i in range(20)],
+                        columns=['feature_{}'.format(i) for i in range(10)])
+    if request.param == 'mixed':
+        data['phenotype'] = 'celltype'
+    return data
+
+
+@pytest.fixture
+def resource_filename(resource_data, tmpdir):
+    filename = str(tmpdir.join('expression.csv.gz'))
+    with gzip.open(filename, 'wb') as f:
+        resource_data.to_csv(f)
+    return filename
+
+
+class CountingReader(object):
+    """Wrap load_csv to count how many times the text file is parsed"""
+    __name__ = 'load_csv'
+
+    def __init__(self):
+        self.n_calls = 0
+
+    def __call__(self, filename, compression=None):
+        from flotilla.util import load_csv
+
+        self.n_calls += 1
+        return load_csv(filename, compression=compression)
+
+
+def test_load_resource_binary_cache(resource_filename, resource_data):
+    from flotilla.datapackage import load_resource, BINARY_CACHE_DIRNAME
+
+    reader = CountingReader()
+    first = load_resource(resource_filename, reader, compression='gzip')
+    second = load_resource(resource_filename, reader, compression='gzip')
+
+    assert reader.n_calls == 1
+    assert os.path.isdir(os.path.join(os.path.dirname(resource_filename),
+                                      BINARY_CACHE_DIRNAME))
+    pdt.assert_frame_equal(first, resource_data)
+    pdt.assert_frame_equal(second, resource_data)
+
+
+def test_load_resource_binary_cache_touched(resource_filename):
+    from flotilla.datapackage import load_resource
+
+    reader = CountingReader()
+    load_resource(resource_filename, reader, compression='gzip')
+
+    # Same contents, different modification time: checksum still matches
+    stat = os.stat(resource_filename)
+    os.utime(resource_filename, (stat.st_atime, stat.st_mtime + 10))
+    load_resource(resource_filename, reader, compression='gzip')
+    assert reader.n_calls == 1
+
+
+def test_load_resource_binary_cache_stale(resource_filename, resource_data):
+    from flotilla.datapackage import load_resource
+
+    reader = CountingReader()
+    load_resource(resource_filename, reader, compression='gzip')
+
+    changed = resource_data.copy()
+    changed.iloc[0, 0] = 1000
+    with gzip.open(resource_filename, 'wb') as f:
+        changed.to_csv(f)
+    test = load_resource(resource_filename, reader, compression='gzip')
+
+    assert reader.n_calls == 2
+    pdt.assert_frame_equal(test, changed)
+
+
+def test_load_resource_no_binary_cache(resource_filename):
+    from flotilla.datapackage import load_resource, BINARY_CACHE_DIRNAME
+
+    reader = CountingReader()
+    load_resource(resource_filename, reader, compression='gzip',
+                  binary_cache=False)
+    load_resource(resource_filename, reader, compression='gzip',
+                  binary_cache=False)
+
+    assert reader.n_calls == 2
+    assert not os.path.exists(os.path.join(
+        os.path.dirname(resource_filename), BINARY_CACHE_DIRNAME))
+
+
+def test_load_resource_mmap(tmpdir):
+    from flotilla.datapackage import load_resource
+
+    data = pd.DataFrame(np.random.randn(20, 10),
+                        index=['sample_{}'.format(i) for i in range(20)],
+                        columns=['feature_{}'.format(i) for i in range(10)])
+    filename = str(tmpdir.join('expression.csv'))
+    data.to_csv(filename)
+
+    reader = CountingReader()
+    first = load_resource(filename, reader, mmap=True)
+    second = load_resource(filename, reader, mmap=True)
+    assert reader.n_calls == 1
+
+    for test in (first, second):
+        values = test.values
+        assert values.dtype == np.float32
+        assert not values.flags.writeable
+
+        # The values are a view onto the memory-mapped file
+        base = values
+        while base.base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        assert isinstance(base, np.memmap)
+        pdt.assert_frame_equal(test, data.astype(np.float32))
+
+    # Same shape, different values: the old float32 copy isn't reused
+    changed = data + 1
+    changed.to_csv(filename)
+    stat = os.stat(filename)
+    os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+    test = load_resource(filename, reader, mmap=True)
+    assert reader.n_calls == 2
+    pdt.assert_frame_equal(test, changed.astype(np.float32))
+
+    # The matrix that was already mapped still has the old values
+    pdt.assert_frame_equal(first, data.astype(np.float32))
+
+
+def test_load_resource_mmap_mixed(tmpdir):
+    from flotilla.datapackage import load_resource
+
+    data = pd.DataFrame(np.random.randn(20, 10),
+                        index=['sample_{}'.format(i) for i in range(20)],
+                        columns=['feature_{}'.format(i) for i in range(10)])
+    data['phenotype'] = 'celltype'
+    filename = str(tmpdir.join('metadata.csv'))
+    data.to_csv(filename)
+
+    # Mixed types can't be memory-mapped, so they're read as usual
+    test = load_resource(filename, CountingReader(), mmap=True)
+    pdt.assert_frame_equal(test, data)
+
+
+@pytest.fixture
+def local_datapackage(tmpdir):
+    """Small datapackage with metadata and expression, saved in tmpdir"""
+    samples = ['sample_{}'.format(i) for i in range(20)]
+    metadata = pd.DataFrame({'phenotype': ['celltype'] * 20}, index=samples)
+    expression = pd.DataFrame(np.random.randn(20, 10), index=samples,
+                              columns=['gene_{}'.format(i)
+                                       for i in range(10)])
+    metadata.to_csv(str(tmpdir.join('metadata.csv')))
+    expression.to_csv(str(tmpdir.join('expression.csv')))
+    return {'name': 'local', 'datapackage_version': '0.1.0',
+            'species': 'hg19',
+            'resources': [
+                {'name': 'metadata', 'format': 'csv',
+                 'path': 'metadata.csv'},
+                {'name': 'expression', 'format': 'csv',
+                 'path': 'expression.csv'}]}
+
+
+def test_load_resources(local_datapackage, tmpdir):
+    from flotilla.datapackage import load_resources
+    from flotilla.util import load_csv
+
+    dfs = load_resources(local_datapackage['resources'], 'local',
+                         {'csv': load_csv}, datapackage_dir=str(tmpdir))
+    assert sorted(dfs.keys()) == ['expression', 'metadata']
+    pdt.assert_frame_equal(
+        dfs['expression'], load_csv(str(tmpdir.join('expression.csv'))))
+
+
+def test_from_datapackage_loads_species_once(local_datapackage, tmpdir,
+                                             monkeypatch):
+    from flotilla import Study
+
+    species = []
+
+    def load_species_data(species_name, readers, *args, **kwargs):
+        species.append(species_name)
+        return {}
+
+    monkeypatch.setattr(Study, 'load_species_data',
+                        staticmethod(load_species_data))
+    study = Study.from_datapackage(local_datapackage, str(tmpdir))
+    assert species == ['hg19']
+    assert study.species == 'hg19'
+    assert study.expression.data.shape == (20, 10)
+
+
+def test_species_data_shared_across_studies(local_datapackage, tmpdir,
+                                            monkeypatch):
+    from flotilla import Study
+    from flotilla.data_model.study import clear_species_data
+
+    feature_data = pd.DataFrame({'gene_name': 'GENE'},
+                                index=['gene_{}'.format(i)
+                                       for i in range(10)])
+    species = []
+
+    def read_species_data(species_name, *args):
+        species.append(species_name)
+        return {'expression_feature_data': feature_data,
+                'expression_feature_rename_col': 'gene_name'}
+
+    monkeypatch.setattr(Study, '_read_species_data',
+                        staticmethod(read_species_data))
+    clear_species_data()
+    try:
+        study1 = Study.from_datapackage(local_datapackage, str(tmpdir))
+        study2 = Study.from_datapackage(local_datapackage, str(tmpdir))
+    finally:
+        clear_species_data()
+    assert species == ['hg19']
+    assert study1.expression.feature_data is feature_data
+    assert study2.expression.feature_data is feature_data
+
+
+@pytest.fixture
+def study_data():
+    samples = ['sample_{}'.format(i) for i in range(20)]
+    metadata = pd.DataFrame({'phenotype': ['celltype'] * 20}, index=samples)
+    expression = pd.DataFrame(np.random.randn(20, 10), index=samples,
+                              columns=['gene_{}'.format(i)
+                                       for i in range(10)])
+    return metadata, expression
+
+
+def test_make_study_datapackage_only_writes_changed(study_data, tmpdir,
+                                                    monkeypatch):
+    import flotilla.datapackage
+
+    written = []
+    write_resource = flotilla.datapackage.write_resource
+
+    def counting_write_resource(data, filename, *args, **kwargs):
+        written.append(os.path.basename(filename))
+        return write_resource(data, filename, *args, **kwargs)
+
+    monkeypatch.setattr(flotilla.datapackage, 'write_resource',
+                        counting_write_resource)
+    metadata, expression = study_data
+    kws = dict(expression_data=expression, flotilla_dir=str(tmpdir),
+               version='0.1.0')
+
+    flotilla.datapackage.make_study_datapackage('test', metadata, **kws)
+    assert sorted(written) == ['expression.csv.gz', 'metadata.csv.gz']
+
+    # Nothing changed, so nothing is written
+    del written[:]
+    flotilla.datapackage.make_study_datapackage('test', metadata.copy(),
+                                                **kws)
+    assert written == []
+
+    # Only the metadata changed
+    metadata['outlier'] = False
+    flotilla.datapackage.make_study_datapackage('test', metadata, **kws)
+    assert written == ['metadata.csv.gz']
+
+    # A file changed on disk is written again
+    del written[:]
+    with open(str(tmpdir.join('test', 'expression.csv.gz')), 'ab') as f:
+        f.write('\n')
+    flotilla.datapackage.make_study_datapackage('test', metadata, **kws)
+    assert written == ['expression.csv.gz']
+
+
+@pytest.mark.parametrize('resource_format', ['csv', 'pickle_df'])
+def test_make_study_datapackage_roundtrip(study_data, tmpdir,
+                                          resource_format):
+    from flotilla import Study
+    from flotilla.datapackage import make_study_datapackage
+
+    metadata, expression = study_data
+    make_study_datapackage('test', metadata, expression_data=expression,
+                           flotilla_dir=str(tmpdir), version='0.1.0',
+                           resource_format=resource_format, compresslevel=1)
+    study = Study.from_datapackage_file(
+        str(tmpdir.join('test', 'datapackage.json')),
+        load_species_data=False)
+    pdt.assert_frame_equal(study.expression.data, expression,
+                           check_dtype=False, check_less_precise=True)
+
+
+@pytest.mark.parametrize('resource_format', ['csv', 'pickle_df'])
+def test_save_sparse_roundtrip(study_data, tmpdir, resource_format,
+                               monkeypatch):
+    import flotilla.datapackage
+    from flotilla import Study
+
+    # Write the sparse matrix in several blocks of rows
+    monkeypatch.setattr(flotilla.datapackage, 'WRITE_BLOCK_ROWS', 3)
+    metadata, expression = study_data
+    expression = expression.where(expression > 0, 0)
+    study = Study(metadata, expression_data=expression,
+                  expression_sparse=True, version='0.1.0')
+    study.save('test', flotilla_dir=str(tmpdir),
+               resource_format=resource_format, compresslevel=1)
+
+    saved = Study.from_datapackage_file(
+        str(tmpdir.join('test', 'datapackage.json')),
+        load_species_data=False)
+    pdt.assert_frame_equal(saved.expression.data, expression,
+                           check_dtype=False, check_less_precise=True)
+
+
+def test_from_datapackage_lazy(study_data, tmpdir, monkeypatch):
+    import flotilla.datapackage
+    from flotilla import Study
+    from flotilla.datapackage import make_study_datapackage
+
+    metadata, expression = study_data
+    make_study_datapackage('test', metadata, expression_data=expression,
+                           splicing_data=expression / 10,
+                           flotilla_dir=str(tmpdir), version='0.1.0')
+
+    loaded = []
+    load_resource = flotilla.datapackage.load_resource
+
+    def recording_load_resource(filename, *args, **kwargs):
+        loaded.append(os.path.basename(filename))
+        return load_resource(filename, *args, **kwargs)
+
+    monkeypatch.setattr(flotilla.datapackage, 'load_resource',
+                        recording_load_resource)
+    study = Study.from_datapackage_file(
+        str(tmpdir.join('test', 'datapackage.json')),
+        load_species_data=False, lazy=True)
+    assert loaded == ['metadata.csv.gz']
+    assert 'splicing' not in vars(study)
+
+    assert study.splicing.data.shape == (20, 10)
+    assert loaded == ['metadata.csv.gz', 'splicing.csv.gz']
+    assert 'expression' not in vars(study)
+
+
+def test_save_lazy(study_data, tmpdir, monkeypatch):
+    import flotilla.datapackage
+    from flotilla import Study
+    from flotilla.datapackage import make_study_datapackage
+
+    metadata, expression = study_data
+    make_study_datapackage('test', metadata, expression_data=expression,
+                           splicing_data=expression / 10,
+                           flotilla_dir=str(tmpdir), version='0.1.0')
+    study = Study.from_datapackage_file(
+        str(tmpdir.join('test', 'datapackage.json')),
+        load_species_data=False, lazy=True)
+    study.splicing
+
+    loaded = []
+    load_resource = flotilla.datapackage.load_resource
+
+    def recording_load_resource(filename, *args, **kwargs):
+        loaded.append(os.path.basename(filename))
+        return load_resource(filename, *args, **kwargs)
+
+    monkeypatch.setattr(flotilla.datapackage, 'load_resource',
+                        recording_load_resource)
+    study.save('saved', flotilla_dir=str(tmpdir))
+
+    # The expression data is copied without being loaded
+    assert loaded == []
+    assert 'expression' not in vars(study)
+    saved = Study.from_datapackage_file(
+        str(tmpdir.join('saved', 'datapackage.json')),
+        load_species_data=False)
+    pdt.assert_frame_equal(saved.expression.data, expression,
+                           check_dtype=False, check_less_precise=True)
+    pdt.assert_frame_equal(saved.splicing.data, expression / 10,
+                           check_dtype=False, check_less_precise=True)
+
+
+def test_from_datapackage_chunked(local_datapackage, tmpdir):
+    from flotilla import Study
+    from flotilla.compute.chunked import ChunkedMatrix
+    from flotilla.datapackage import load_chunked_resource
+
+    study = Study.from_datapackage(local_datapackage, str(tmpdir),
+                                   load_species_data=False, chunked=True)
+    assert isinstance(study.expression.data, ChunkedMatrix)
+    expression = pd.read_csv(str(tmpdir.join('expression.csv')), index_col=0)
+    pdt.assert_frame_equal(study.expression.data.to_dense(), expression,
+                           check_dtype=False, check_less_precise=True)
+
+    # The blocks on disk are reused, until the file changes
+    filename = str(tmpdir.join('expression.csv'))
+    old = load_chunked_resource(filename)
+    assert load_chunked_resource(filename).directory == old.directory
+    (expression + 1).to_csv(filename)
+    new = load_chunked_resource(filename)
+    assert new.directory != old.directory
+    pdt.assert_frame_equal(new.to_dense(), expression + 1,
+                           check_dtype=False, check_less_precise=True)
+
+    # Matrices loaded before the change still read their own blocks
+    pdt.assert_frame_equal(old.to_dense(), expression, check_dtype=False,
+                           check_less_precise=True)
+
+
+def test_save_chunked_roundtrip(study_data, tmpdir, monkeypatch):
+    import flotilla.datapackage
+    from flotilla import Study
+    from flotilla.cache import hash_object
+    from flotilla.compute.chunked import ChunkedMatrix
+
+    monkeypatch.setattr(flotilla.datapackage, 'WRITE_BLOCK_ROWS', 3)
+    metadata, expression = study_data
+    chunked = ChunkedMatrix.from_dataframe(
+        expression, str(tmpdir.join('matrix')), block_rows=7,
+        dtype=np.float64)
+    # The same values saved somewhere else hash the same
+    copy = ChunkedMatrix.from_dataframe(
+        expression, str(tmpdir.join('copy')), block_rows=7,
+        dtype=np.float64)
+    assert hash_object(chunked) == hash_object(copy)
+    subset = chunked.ix[expression.index[:5]]
+    assert hash_object(chunked) != hash_object(subset)
+
+    study = Study(metadata, expression_data=chunked, version='0.1.0')
+    study.save('test', flotilla_dir=str(tmpdir.join('saved')),
+               compresslevel=1)
+    saved = Study.from_datapackage_file(
+        str(tmpdir.join('saved', 'test', 'datapackage.json')),
+        load_species_data=False)
+    pdt.assert_frame_equal(saved.expression.data, expression,
+                           check_dtype=False, check_less_precise=True)
+
+
+class ContentServer(object):
+    """Local HTTP server for some contents, which supports ranges and ETags
+
+    Records the path and headers of every request, and how many bytes of
+    content were sent
+    """
+
+    def __init__(self, contents):
+        import BaseHTTPServer
+        import threading
+
+        self.contents = contents
+        self.requests = []
+        self.bytes_sent = 0
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                content = server.contents[self.path]
+                etag = '"{}"'.format(hash(content))
+                start = 0
+                if 'range' in self.headers and \
+                        self.headers.get('if-range', etag) == etag:
+                    start = int(self.headers['range'].split('=')[1]
+                                .rstrip('-'))
+                    self.send_response(206)
+                else:
+                    self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', len(content) - start)
+                self.end_headers()
+                self.wfile.write(content[start:])
+                server.bytes_sent += len(content) - start
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.yield_fixture
+def content_server():
+    import hashlib
+
+    content = ''.join(chr(i % 256) for i in range(100000))
+    datapackage = '{"name": "served", "resources": []}'
+    server = ContentServer({'/expression.csv.gz': content,
+                            '/datapackage.json': datapackage})
+    server.md5 = hashlib.md5(content).hexdigest()
+    yield server
+    server.shutdown()
+
+
+def test_download(content_server, tmpdir):
+    from flotilla.datapackage import check_if_already_downloaded
+
+    url = content_server.url + '/expression.csv.gz'
+    filename = check_if_already_downloaded(url, 'served', str(tmpdir),
+                                           md5=content_server.md5)
+    with open(filename, 'rb') as f:
+        assert f.read() == content_server.contents['/expression.csv.gz']
+
+    # Already downloaded, so no need to ask the server again
+    check_if_already_downloaded(url, 'served', str(tmpdir),
+                                md5=content_server.md5)
+    assert len(content_server.requests) == 1
+
+
+def test_download_resume(content_server, tmpdir):
+    from flotilla.datapackage import download, _write_download_info
+
+    url = content_server.url + '/expression.csv.gz'
+    content = content_server.contents['/expression.csv.gz']
+    etag = '"{}"'.format(hash(content))
+
+    # Pretend a previous download was interrupted halfway through
+    filename = str(tmpdir.join('expression.csv.gz'))
+    with open(filename + '.part', 'wb') as f:
+        f.write(content[:60000])
+    _write_download_info(filename, {'url': url, 'etag': etag})
+
+    download(url, filename, md5=content_server.md5)
+    with open(filename, 'rb') as f:
+        assert f.read() == content
+    assert content_server.bytes_sent == 40000
+    assert not os.path.exists(filename + '.part')
+
+
+def test_download_checksum_mismatch(content_server, tmpdir):
+    from flotilla.datapackage import check_if_already_downloaded
+
+    url = content_server.url + '/expression.csv.gz'
+    with pytest.raises(IOError):
+        check_if_already_downloaded(url, 'served', str(tmpdir),
+                                    md5='0' * 32)
+    assert not os.path.exists(str(tmpdir.join('served', 'expression.csv.gz')))
+
+    # A corrupted local copy is downloaded again
+    filename = check_if_already_downloaded(url, 'served', str(tmpdir))
+    with open(filename, 'ab') as f:
+        f.write('corrupted')
+    check_if_already_downloaded(url, 'served', str(tmpdir),
+                                md5=content_server.md5)
+    with open(filename, 'rb') as f:
+        assert f.read() == content_server.contents['/expression.csv.gz']
+
+
+def test_download_datapackage_once(content_server, tmpdir):
+    from flotilla.datapackage import check_if_already_downloaded
+
+    filename = check_if_already_downloaded(
+        content_server.url + '/datapackage.json', download_dir=str(tmpdir))
+    assert filename == str(tmpdir.join('served', 'datapackage.json'))
+    assert len(content_server.requests) == 1
@@ -0,0 +1,38 @@
+"""Test that importing flotilla doesn't import the plotting, interactive or
+machine learning libraries, which are slow to import"""
+import subprocess
+import sys
+
+HEAVY_MODULES = ('IPython', 'matplotlib.pyplot', 'networkx', 'seaborn',
+                 'semantic_version', 'sklearn', 'statsmodels')
+
+# Generous, so this only fails when something heavy sneaks back in, not on
+# a slow machine
+MAX_IMPORT_SECONDS = 5
+
+
+def _import_flotilla():
+    """Import flotilla in a fresh interpreter, and return how long it took
+    and which of the heavy modules were imported"""
+    code = ('import sys, time\n'
+            't = time.time()\n'
+            'import flotilla\n'
+            'print time.time() - t\n'
+            'print " ".join(m for m in {!r} if m in sys.modules)\n'.format(
+                HEAVY_MODULES))
+    output = subprocess.check_output([sys.executable, '-c', code])
+    seconds, imported = output.split('\n')[:2]
+    return float(seconds), imported.split()
+
+
+def test_import_is_lazy():
+    seconds, imported = _import_flotilla()
+    assert imported == [], \
+        'Importing flotilla imported {} ({:.2f} seconds)'.format(
+            ', '.join(imported), seconds)
+
+
+def test_import_time():
+    seconds, imported = _import_flotilla()
+    assert seconds < MAX_IMPORT_SECONDS, \
+        'Importing flotilla took {:.2f} seconds'.format(seconds)
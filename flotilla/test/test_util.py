@@ -1,11 +1,15 @@
 """Test utilities interfacing with external-facing modules, e.g. links to
 gene lists"""
+import gzip
 import os
 import sys
 import tempfile
 import subprocess
 
+import numpy as np
 import pandas as pd
+import pandas.util.testing as pdt
+import pytest
 
 from flotilla.util import link_to_list
 
@@ -28,3 +32,62 @@ def test_link_to_list(genelist_link):
         .tolist()
 
     assert true_list == test_list
+
+
+@pytest.fixture(params=[None, 'gzip'])
+def compression(request):
+    return request.param
+
+
+def write_matrix(df, tmpdir, compression):
+    filename = str(tmpdir.join('matrix.csv'))
+    if compression == 'gzip':
+        filename += '.gz'
+        with gzip.open(filename, 'wb') as f:
+            df.to_csv(f)
+    else:
+        df.to_csv(filename)
+    return filename
+
+
+def test_load_matrix_chunked_floats(tmpdir, compression):
+    from flotilla.util import load_matrix_chunked
+
+    df = pd.DataFrame(np.random.randn(50, 20),
+                      index=['sample_{}'.format(i) for i in range(50)])
+    df.index.name = 'sample_id'
+    filename = write_matrix(df, tmpdir, compression)
+
+    # Tiny chunks, so the matrix is read a few rows at a time
+    test = load_matrix_chunked(filename, compression=compression,
+                               chunk_bytes=1000)
+    assert test.values.dtype == np.float32
+    test.columns = test.columns.astype(int)
+    pdt.assert_frame_equal(test, df.astype(np.float32))
+
+
+def test_load_matrix_chunked_counts(tmpdir):
+    from flotilla.util import load_matrix_chunked
+
+    df = pd.DataFrame(np.random.randint(0, 1000, size=(50, 20)))
+    filename = write_matrix(df, tmpdir, None)
+
+    test = load_matrix_chunked(filename, chunk_bytes=1000)
+    assert test.values.dtype == np.int32
+    pdt.assert_numpy_array_equal(test.values, df.values.astype(np.int32))
+
+    # A missing value in a later chunk makes the whole matrix float32
+    df = df.astype(float)
+    df.iloc[40, 5] = np.nan
+    filename = write_matrix(df, tmpdir, None)
+    test = load_matrix_chunked(filename, chunk_bytes=1000)
+    assert test.values.dtype == np.float32
+    pdt.assert_numpy_array_equal(test.values, df.values.astype(np.float32))
+
+
+def test_load_matrix_chunked_not_numeric(tmpdir):
+    from flotilla.util import load_matrix_chunked, load_csv
+
+    df = pd.DataFrame({'phenotype': ['celltype'] * 10, 'n_reads': range(10)})
+    filename = write_matrix(df, tmpdir, None)
+    pdt.assert_frame_equal(load_matrix_chunked(filename), load_csv(filename))
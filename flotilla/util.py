@@ -2,6 +2,7 @@
 General use utilities
 """
 
+import bz2
 import datetime
 from functools import wraps
 import errno
@@ -16,8 +17,19 @@ import cPickle
 import gzip
 import tempfile
 
+import numpy as np
 import pandas as pd
 
+from .cache import LRUCache, hash_object
+
+# Approximate size of each chunk of rows parsed at once by
+# load_matrix_chunked, as float64 before downcasting
+CHUNK_BYTES = 2 ** 25
+
+# Integer data is downcast to no smaller than this type, because smaller types
+# overflow too easily in arithmetic further down the line
+MIN_INT_DTYPE = np.int32
+
 
 class TimeoutError(Exception):
     """
@@ -77,31 +89,113 @@ def install_development_package(package_location):
     os.chdir(original_location)
 
 
-def memoize(obj):
+def _dependency_versions(instance, depends_on=None):
+    """Current versions of the attributes of ``instance`` which a cached
+    result depends on
+
+    Objects such as :py:class:`.BaseData` list their tracked attributes in
+    ``_versioned_attributes``, and count how many times each has changed in
+    ``_versions``. If ``depends_on`` is None, the result depends on all the
+    tracked attributes.
+
+    Returns
+    -------
+    versions : tuple
+        (attribute, version) pairs, empty if nothing is tracked
+    """
+    if depends_on is None:
+        depends_on = getattr(instance, '_versioned_attributes', ())
+    if not depends_on:
+        return ()
+    versions = getattr(instance, '_versions', {})
+    return tuple((attribute, versions.get(attribute, 0))
+                 for attribute in depends_on)
+
+
+def memoize(obj=None, depends_on=None):
     """'Memoize' aka remember the output from a function and return that,
     rather than recalculating
 
-    Stolen from:
+    The results are keyed on a content hash (see :py:func:`hash_object`) of
+    the function name and all the arguments. If the first argument (i.e.
+    ``self`` for methods) has a ``cache`` attribute which is an
+    :py:class:`LRUCache`, the result is stored there, so e.g. all the data in
+    a :py:class:`.Study` share one byte budget. Otherwise, the result is
+    stored in a bounded cache belonging to the function, ``obj.cache``.
+
+    ``self`` is hashed on its identity, not its contents, so for objects
+    which track changes to their attributes (e.g. ``data`` in
+    :py:class:`.BaseData`), the key also has the versions of the attributes
+    the result depends on, and the result is thrown out when one of them
+    changes. Use ``@memoize(depends_on=('data',))`` to only depend on some
+    attributes. By default, the result depends on all of them.
+
+    Originally from:
     https://wiki.python.org/moin/PythonDecoratorLibrary#CA-237e205c0d5bd1459c3663a3feb7f78236085e0a_1
 
     do_not_memoize : bool
         IF this is a keyword argument (kwarg) in the function, and it is true,
         then just evaluate the function and don't memoize it.
     """
-    cache = obj.cache = {}
+    if obj is None:
+        return functools.partial(memoize, depends_on=depends_on)
+
+    cache = obj.cache = LRUCache()
+    name = '{}.{}'.format(obj.__module__, obj.__name__)
 
     @functools.wraps(obj)
     def memoizer(*args, **kwargs):
         if 'do_not_memoize' in kwargs and kwargs['do_not_memoize']:
             return obj(*args, **kwargs)
-        key = str(args) + str(kwargs)
-        if key not in cache:
-            cache[key] = obj(*args, **kwargs)
-        return cache[key]
+
+        instance_cache = getattr(args[0], 'cache', None) if args else None
+        if isinstance(instance_cache, LRUCache):
+            results = instance_cache
+        else:
+            results = cache
+
+        versions = _dependency_versions(args[0], depends_on) if args else ()
+        key = hash_object((name, args, kwargs, versions))
+        try:
+            return results[key]
+        except KeyError:
+            value = obj(*args, **kwargs)
+            # Tag the result with what it depends on, so it's thrown out as
+            # soon as one of them changes
+            tags = [(id(args[0]), attribute) for attribute, _ in versions]
+            results.set(key, value, tags, name=obj.__name__,
+                        owner=id(args[0]) if args else None)
+            return value
 
     return memoizer
 
 
+def timed(obj):
+    """Add up the wall time spent in a method, and how often it's called
+
+    If the instance has a ``timings`` attribute which is a dict, each call
+    adds to ``timings[<method name>]``, a dict with the number of ``calls``
+    and the total ``seconds``. Time spent in other timed methods called by
+    this one counts towards both.
+    """
+    name = obj.__name__
+
+    @functools.wraps(obj)
+    def timer(self, *args, **kwargs):
+        timings = getattr(self, 'timings', None)
+        if not isinstance(timings, dict):
+            return obj(self, *args, **kwargs)
+        start = time.time()
+        try:
+            return obj(self, *args, **kwargs)
+        finally:
+            timing = timings.setdefault(name, {'calls': 0, 'seconds': 0.})
+            timing['calls'] += 1
+            timing['seconds'] += time.time() - start
+
+    return timer
+
+
 class cached_property(object):
     '''Decorator for read-only properties evaluated only once within TTL period.
 
@@ -132,13 +226,19 @@ class cached_property(object):
 
         del instance._cache[<property name>]
 
+    If the value depends on attributes whose changes the instance tracks
+    (see :py:func:`memoize`), list them in ``depends_on``, e.g.
+    ``@cached_property(depends_on=('data',))``, and the value is recomputed
+    after they change.
+
     Stolen from:
     https://wiki.python.org/moin/PythonDecoratorLibrary#Cached_Properties
 
     '''
 
-    def __init__(self, ttl=0):
+    def __init__(self, ttl=0, depends_on=()):
         self.ttl = ttl
+        self.depends_on = depends_on
 
     def __call__(self, fget, doc=None):
         self.fget = fget
@@ -149,17 +249,20 @@ class cached_property(object):
 
     def __get__(self, inst, owner):
         now = time.time()
+        versions = _dependency_versions(inst, self.depends_on)
         try:
-            value, last_update = inst._cache[self.__name__]
+            value, last_update, last_versions = inst._cache[self.__name__]
             if self.ttl > 0 and now - last_update > self.ttl:
                 raise AttributeError
+            if last_versions != versions:
+                raise AttributeError
         except (KeyError, AttributeError):
             value = self.fget(inst)
             try:
                 cache = inst._cache
             except AttributeError:
                 cache = inst._cache = {}
-            cache[self.__name__] = (value, now)
+            cache[self.__name__] = (value, now, versions)
         return value
 
 
@@ -212,7 +315,7 @@ def validate_params(self):
             raise AssertionError("Missing minimal parameter %s" % param)
 
 
-def load_pickle_df(file_name):
+def load_pickle_df(file_name, compression=None):
     return pd.read_pickle(file_name)
 
 
@@ -220,7 +323,7 @@ def write_pickle_df(df, file_name):
     df.to_pickle(file_name)
 
 
-def load_gzip_pickle_df(file_name):
+def load_gzip_pickle_df(file_name, compression=None):
     with gzip.open(file_name, 'r') as f:
         return cPickle.load(f)
 
@@ -267,6 +370,110 @@ def write_csv(df, file_name):
     df.to_csv(file_name)
 
 
+def _open_compressed(file_name, compression=None):
+    """Open a possibly compressed file for reading"""
+    if compression == 'gzip':
+        return gzip.open(file_name, 'rb')
+    elif compression == 'bz2':
+        return bz2.BZ2File(file_name, 'rb')
+    return open(file_name, 'rb')
+
+
+def _downcast_dtype(values, dtype=None):
+    """Smallest dtype which holds these values and anything of ``dtype``
+
+    Floats become float32, and integers become the smallest integer type
+    (but at least MIN_INT_DTYPE) holding their range. Returns None if the
+    values aren't numbers.
+    """
+    kind = values.dtype.kind
+    if kind == 'f' or (kind in 'iu' and dtype is not None
+                       and dtype.kind == 'f'):
+        return np.dtype(np.float32)
+    elif kind in 'iu':
+        new = np.dtype(MIN_INT_DTYPE) if dtype is None else dtype
+        if values.size > 0:
+            new = np.promote_types(new, np.min_scalar_type(values.min()))
+            new = np.promote_types(new, np.min_scalar_type(values.max()))
+        return new
+    return None
+
+
+def load_matrix_chunked(file_name, sep=',', compression=None,
+                        chunk_bytes=CHUNK_BYTES):
+    """Read a numeric matrix a few rows at a time, with the smallest dtype
+
+    Parsing a whole file with pandas needs several times the memory of the
+    final float64 DataFrame. Instead, this parses chunks of rows, downcasts
+    them to float32 (or for count data, the smallest integer type that holds
+    them) and copies them into one array, which is grown in place as needed.
+    The peak memory is about the size of the final, downcast matrix plus a
+    few chunks.
+
+    Files which aren't entirely numeric, e.g. metadata, are read all at once
+    as usual.
+
+    Parameters
+    ----------
+    file_name : str
+        Delimited text file, with the row names in the first column and the
+        column names in the first row
+    sep : str, optional (default=",")
+        Delimiter between fields
+    compression : str, optional (default=None)
+        "gzip", "bz2" or None
+    chunk_bytes : int, optional (default=CHUNK_BYTES)
+        Approximate size of each chunk of rows, before downcasting
+
+    Returns
+    -------
+    data : pandas.DataFrame
+        The matrix from the file
+    """
+    read_kws = dict(sep=sep, index_col=0, compression=compression)
+    with _open_compressed(file_name, compression) as f:
+        n_columns = max(1, f.readline().count(sep))
+    chunksize = max(1, chunk_bytes // (8 * n_columns))
+
+    values = None
+    index = []
+    n_rows = 0
+    for chunk in pd.read_csv(file_name, chunksize=chunksize, **read_kws):
+        dtype = _downcast_dtype(chunk.values,
+                                None if values is None else values.dtype)
+        if dtype is None:
+            # Not a numeric matrix, so there's nothing to downcast
+            return pd.read_csv(file_name, **read_kws)
+
+        if values is None:
+            columns = chunk.columns
+            values = np.empty((2 * len(chunk), len(columns)), dtype=dtype)
+        elif dtype != values.dtype:
+            # E.g. a later chunk of count data has a missing value
+            values = values.astype(dtype)
+        if n_rows + len(chunk) > len(values):
+            # Rows are contiguous, so this can usually grow without a copy.
+            # Nothing else refers to this array yet, so skip the check
+            values.resize((2 * len(values), len(columns)), refcheck=False)
+        values[n_rows:n_rows + len(chunk)] = chunk.values
+        index.append(chunk.index)
+        n_rows += len(chunk)
+
+    if values is None:
+        return pd.read_csv(file_name, **read_kws)
+    values.resize((n_rows, len(columns)), refcheck=False)
+    index = index[0].append(index[1:]) if len(index) > 1 else index[0]
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def load_csv_chunked(file_name, compression=None):
+    return load_matrix_chunked(file_name, ',', compression=compression)
+
+
+def load_tsv_chunked(file_name, compression=None):
+    return load_matrix_chunked(file_name, '\t', compression=compression)
+
+
 def get_loading_method(self, file_name):
     """loading_methods for loading from file"""
     return getattr(self, "_load_" + file_name)
@@ -1,37 +1,58 @@
-"""plotting tools"""
-
-import seaborn
-
-seaborn.set_style({'axes.axisbelow': True,
-                   'axes.edgecolor': '.15',
-                   'axes.facecolor': 'white',
-                   'axes.grid': False,
-                   'axes.labelcolor': '.15',
-                   'axes.linewidth': 1.25,
-                   'font.family': 'Helvetica',
-                   'grid.color': '.8',
-                   'grid.linestyle': '-',
-                   'image.cmap': 'Greys',
-                   'legend.frameon': False,
-                   'legend.numpoints': 1,
-                   'legend.scatterpoints': 1,
-                   'lines.solid_capstyle': 'round',
-                   'text.color': '.15',
-                   'xtick.color': '.15',
-                   'xtick.direction': 'out',
-                   'xtick.major.size': 0,
-                   'xtick.minor.size': 0,
-                   'ytick.color': '.15',
-                   'ytick.direction': 'out',
-                   'ytick.major.size': 0,
-                   'ytick.minor.size': 0})
-
-seaborn.set_context('talk')
-
-try:
-    get_ipython().magic('matplotlib inline')
-except:
-    pass
+"""plotting tools
+
+Matplotlib, seaborn and IPython's widgets are slow to import, so the
+plotting modules are only imported when something is first plotted, and
+that's when flotilla's plotting style is set (see :py:func:`set_style`).
+"""
+
+_style_is_set = False
+
+
+def set_style():
+    """Set flotilla's seaborn style, context and color palette, and show
+    plots inline if this is an IPython notebook
+
+    Called by each plotting module when it's first imported, and only sets
+    the style the first time, so it doesn't undo any changes made since.
+    """
+    global _style_is_set
+    if _style_is_set:
+        return
+    _style_is_set = True
+
+    import seaborn
+
+    seaborn.set_style({'axes.axisbelow': True,
+                       'axes.edgecolor': '.15',
+                       'axes.facecolor': 'white',
+                       'axes.grid': False,
+                       'axes.labelcolor': '.15',
+                       'axes.linewidth': 1.25,
+                       'font.family': 'Helvetica',
+                       'grid.color': '.8',
+                       'grid.linestyle': '-',
+                       'image.cmap': 'Greys',
+                       'legend.frameon': False,
+                       'legend.numpoints': 1,
+                       'legend.scatterpoints': 1,
+                       'lines.solid_capstyle': 'round',
+                       'text.color': '.15',
+                       'xtick.color': '.15',
+                       'xtick.direction': 'out',
+                       'xtick.major.size': 0,
+                       'xtick.minor.size': 0,
+                       'ytick.color': '.15',
+                       'ytick.direction': 'out',
+                       'ytick.major.size': 0,
+                       'ytick.minor.size': 0})
+
+    seaborn.set_context('talk')
+    seaborn.set_palette('deep')
+
+    try:
+        get_ipython().magic('matplotlib inline')
+    except:
+        pass
+
 
 from .ipython_interact import Interactive
-from .predict import PredictorBaseViz
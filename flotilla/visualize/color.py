@@ -1,19 +1,19 @@
 """
 Convenience functions for obtaining reasonable plotting colors
 """
-
-
 import matplotlib as mpl
-import seaborn as sns
-import brewer2mpl
+import matplotlib.cm
+import numpy as np
 
-sns.set_palette('deep')
-deep = sns.color_palette('deep')
+# These are fixed palettes, so they're written out here rather than imported
+# from seaborn and brewer2mpl, which are slow to import
+deep = ['#4c72b0', '#55a868', '#c44e52', '#8172b2', '#ccb974', '#64b5cd']
 
-dark2 = map(mpl.colors.rgb2hex,
-            brewer2mpl.get_map('Dark2', 'qualitative', 8).mpl_colors)
-set1 = map(mpl.colors.rgb2hex,
-           brewer2mpl.get_map('Set1', 'qualitative', 9).mpl_colors)
+# ColorBrewer's "Dark2" and "Set1" qualitative palettes
+dark2 = ['#1b9e77', '#d95f02', '#7570b3', '#e7298a', '#66a61e', '#e6ab02',
+         '#a6761d', '#666666']
+set1 = ['#e41a1c', '#377eb8', '#4daf4a', '#984ea3', '#ff7f00', '#ffff33',
+        '#a65628', '#f781bf', '#999999']
 red = set1[0]
 blue = set1[1]
 green = set1[2]
@@ -26,7 +26,8 @@ grey = set1[8]
 
 almost_black = '#262626'
 
-purples = sns.color_palette('Purples', 9)
+# Same as seaborn.color_palette('Purples', 9)
+purples = map(tuple, mpl.cm.Purples(np.linspace(0, 1, 11)[1:-1])[:, :3])
 
 str_to_color = {'red': red, 'blue': blue, 'green': green, 'purple': purple,
                 'orange': orange, 'brown': brown, 'pink': pink, 'grey': grey}
@@ -8,9 +8,12 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
+from . import set_style
 from .color import dark2
 from .generic import violinplot
 
+set_style()
+
 
 class DecompositionViz(object):
     """
@@ -1,9 +1,12 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
+from . import set_style
 from .color import blue
 from ..compute.expression import TwoWayGeneComparisonLocal
 
+set_style()
+
 
 class TwoWayScatterViz(TwoWayGeneComparisonLocal):
     def __call__(self, **kwargs):
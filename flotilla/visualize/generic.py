@@ -5,6 +5,10 @@ from matplotlib import pyplot as plt
 import numpy as np
 import seaborn as sns
 
+from . import set_style
+
+set_style()
+
 
 def violinplot(data, groupby=None, color_ordered=None, ax=None,
                pooled_data=None,
@@ -5,15 +5,9 @@ between IPython interactive visualizations vs D3 interactive visualizations.
 import sys
 import warnings
 
-from IPython.html.widgets import interact
-import matplotlib.pyplot as plt
-
-
-
 # from ..compute.predict import CLASSIFIER
 from flotilla.util import link_to_list
 from ..visualize.color import red
-from .network import NetworkerViz
 from .color import str_to_color
 from ..util import natural_sort
 
@@ -22,6 +16,13 @@ default_regressor = 'ExtraTreesRegressor'
 default_score_coefficient = 2
 
 
+def interact(*args, **kwargs):
+    """IPython's interact, imported when it's first used because IPython's
+    widgets are slow to import"""
+    from IPython.html.widgets import interact
+    return interact(*args, **kwargs)
+
+
 class Interactive(object):
     """
 
@@ -176,8 +177,9 @@ class Interactive(object):
                           use_pc_1=True, use_pc_2=True, use_pc_3=True,
                           use_pc_4=True,
                           savefile=''):
+        import matplotlib.pyplot as plt
 
-        from IPython.html.widgets import interact
+        from .network import NetworkerViz
 
         # not sure why nested fxns are required for this, but they are... i
         # think...
@@ -255,6 +257,7 @@ class Interactive(object):
                                score_coefficient=(0.1, 20),
                                draw_labels=False,
                                savefile=''):
+        import matplotlib.pyplot as plt
 
         def do_interact(data_type,
                         sample_subset,
@@ -359,6 +362,8 @@ class Interactive(object):
                                               bootstrapped=False,
                                               bootstrapped_kws=None,
                                               savefile=''):
+        import matplotlib.pyplot as plt
+
         def do_interact(sample_subset=None, feature_subset=None,
                         color=red, x_offset=0,
                         use_these_modalities=True,
@@ -429,7 +434,7 @@ class Interactive(object):
             self, sample_subsets=None, feature_subsets=None,
             difference_threshold=(0.001, 1.00),
             colors=['red', 'green', 'blue', 'purple', 'yellow'], savefile=''):
-        from IPython.html.widgets import interact
+        import matplotlib.pyplot as plt
 
         # not sure why nested fxns are required for this, but they are... i
         # think...
@@ -8,12 +8,16 @@ import networkx as nx
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
+import pandas as pd
 import seaborn as sns
 
+from . import set_style
 from ..compute.network import Networker
 from ..util import dict_to_str
 from .color import dark2, almost_black, green, red
 
+set_style()
+
 
 class NetworkerViz(Networker):
     # TODO: needs to be decontaminated, as it requires methods from
@@ -114,10 +118,7 @@ class NetworkerViz(Networker):
                 if (x == feature_id) else almost_black
             node_size_mapper = lambda x: (pca.means.ix[x] ** 2) + 10
         else:
-            if sample_id_to_color is not None:
-                node_color_mapper = lambda x: sample_id_to_color[x]
-            else:
-                node_color_mapper = lambda x: dark2[0]
+            node_color_mapper = lambda x: dark2[0]
             node_size_mapper = lambda x: 95
 
         ax_pev.plot(pca.explained_variance_ratio_ * 100.)
@@ -152,9 +153,15 @@ class NetworkerViz(Networker):
 
         graph, pos = self.graph(adjacency, **graph_settings)
 
+        if not featurewise and sample_id_to_color is not None:
+            # Look up the colors of all the samples at once
+            node_colors = pd.Series(sample_id_to_color).reindex(
+                graph.nodes()).fillna(dark2[0]).tolist()
+        else:
+            node_colors = map(node_color_mapper, graph.nodes())
         nx.draw_networkx_nodes(
             graph, pos,
-            node_color=map(node_color_mapper, graph.nodes()),
+            node_color=node_colors,
             node_size=map(node_size_mapper, graph.nodes()),
             ax=main_ax, alpha=0.5)
 
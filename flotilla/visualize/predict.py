@@ -9,10 +9,13 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
+from . import set_style
 from ..compute.predict import Classifier, Regressor, PredictorBase
 from .color import green
 from .decomposition import DecompositionViz
 
+set_style()
+
 
 class PredictorBaseViz(PredictorBase):
     _reducer_plotting_args = {}
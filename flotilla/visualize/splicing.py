@@ -2,10 +2,13 @@ import matplotlib.pyplot as plt
 import numpy as np
 import seaborn as sns
 
+from . import set_style
 from .color import red, blue, purple, grey, green
 from ..compute.splicing import get_switchy_score_order
 from ..util import as_numpy
 
+set_style()
+
 
 class ModalitiesViz(object):
     """Visualize results of modality assignments